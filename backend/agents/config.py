@@ -22,6 +22,9 @@ class AgentConfig:
     # Document retrieval settings
     DEFAULT_CHUNK_RETRIEVAL_COUNT = int(os.getenv("DEFAULT_CHUNK_RETRIEVAL_COUNT", "6"))
     MAX_CHUNK_RETRIEVAL_COUNT = int(os.getenv("MAX_CHUNK_RETRIEVAL_COUNT", "10"))
+    # With cross-encoder reranking fewer, better chunks go into the prompt
+    ENABLE_RERANKING = os.getenv("ENABLE_RERANKING", "false").lower() == "true"
+    RERANKED_CHUNK_COUNT = int(os.getenv("RERANKED_CHUNK_COUNT", "3"))
     
     # Logging and debugging
     ENABLE_AGENT_VERBOSE = os.getenv("ENABLE_AGENT_VERBOSE", "true").lower() == "true"
@@ -42,10 +45,17 @@ class AgentConfig:
             "max_iterations": cls.AGENT_MAX_ITERATIONS,
             "default_chunk_count": cls.DEFAULT_CHUNK_RETRIEVAL_COUNT,
             "max_chunk_count": cls.MAX_CHUNK_RETRIEVAL_COUNT,
+            "enable_reranking": cls.ENABLE_RERANKING,
+            "reranked_chunk_count": cls.RERANKED_CHUNK_COUNT,
             "verbose": cls.ENABLE_AGENT_VERBOSE,
             "log_reasoning": cls.LOG_AGENT_REASONING
         }
     
+    @classmethod
+    def get_retrieval_chunk_count(cls) -> int:
+        """Number of chunks to put in an agent prompt"""
+        return cls.RERANKED_CHUNK_COUNT if cls.ENABLE_RERANKING else cls.DEFAULT_CHUNK_RETRIEVAL_COUNT
+
     @classmethod
     def is_agent_enabled(cls) -> bool:
         """Check if agents are enabled"""
@@ -16,6 +16,7 @@ from api_endpoints.financeGPT.chatbot_endpoints import (
     get_relevant_chunks, add_message_to_db, add_sources_to_db,
     retrieve_message_from_db, retrieve_docs_from_db
 )
+from api_endpoints.financeGPT.retrieval_filters import documents_named_in_query
 from .config import AgentConfig
 
 class AgentState(TypedDict):
@@ -35,6 +36,7 @@ class AgentState(TypedDict):
     next_agent: str
     completed_agents: List[str]
     stream_callback: Any
+    document_filter: Optional[Dict[str, Any]]
 
 
 class MultiAgentCallbackHandler(BaseCallbackHandler):
@@ -138,8 +140,10 @@ class BaseSpecializedAgent:
 class DocumentRetrievalAgent(BaseSpecializedAgent):
     """Specialized agent for document retrieval and analysis"""
     
-    def __init__(self, model_type: int = 0, model_key: Optional[str] = None):
+    def __init__(self, model_type: int = 0, model_key: Optional[str] = None, mmr: Optional[bool] = None):
         super().__init__("DocumentRetrieval", model_type, model_key)
+        # None uses the retrieval default (ENABLE_MMR)
+        self.mmr = mmr
     
     def process(self, state: AgentState) -> Dict[str, Any]:
         """Process document retrieval requests"""
@@ -152,7 +156,8 @@ class DocumentRetrievalAgent(BaseSpecializedAgent):
             user_email = state["user_email"]
             
             # Retrieve relevant documents
-            sources = get_relevant_chunks(6, query, chat_id, user_email)
+            sources = get_relevant_chunks(AgentConfig.get_retrieval_chunk_count(), query, chat_id, user_email, mmr=self.mmr,
+                                          filters=state.get("document_filter"))
             
             if not sources or sources == ["No text found"]:
                 reasoning = "No relevant documents found for this query."
@@ -364,17 +369,23 @@ class DocumentListAgent(BaseSpecializedAgent):
             is_list_query = any(keyword in query.lower() for keyword in list_keywords)
             
             if not is_list_query:
+                # Narrow retrieval to the documents the query names, e.g. "the 2023 10-K"
+                targeted_ids = documents_named_in_query(query, retrieve_docs_from_db(chat_id, user_email))
+                document_filter = {"document_ids": targeted_ids} if targeted_ids else None
+
                 reasoning_step = {
                     'id': f'step-{int(time.time() * 1000)}',
                     'type': 'agent_completion',
                     'agent_name': self.name,
                     'message': f'{self.name} determined query does not require document listing',
-                    'reasoning': 'Query is not asking for document list information',
+                    'reasoning': 'Query is not asking for document list information'
+                                 + (f'; retrieval limited to document ids {targeted_ids}' if targeted_ids else ''),
                     'timestamp': int(time.time() * 1000)
                 }
                 
                 return {
                     "available_documents": [],
+                    "document_filter": document_filter,
                     "reasoning_steps": state["reasoning_steps"] + [reasoning_step],
                     "completed_agents": state["completed_agents"] + [self.name],
                     "next_agent": "ChatHistoryAgent"
@@ -680,13 +691,13 @@ class OrchestratorAgent(BaseSpecializedAgent):
 class MultiAgentDocumentSystem:
     """Main multi-agent system using LangGraph"""
     
-    def __init__(self, model_type: int = 0, model_key: Optional[str] = None):
+    def __init__(self, model_type: int = 0, model_key: Optional[str] = None, mmr: Optional[bool] = None):
         self.model_type = model_type
         self.model_key = model_key
         
         #initialize agents
         self.agents = {"DocumentListAgent": DocumentListAgent(model_type, model_key), "ChatHistoryAgent": ChatHistoryAgent(model_type, model_key),
-            "DocumentRetrievalAgent": DocumentRetrievalAgent(model_type, model_key),
+            "DocumentRetrievalAgent": DocumentRetrievalAgent(model_type, model_key, mmr=mmr),
             "GeneralKnowledgeAgent": GeneralKnowledgeAgent(model_type, model_key),
             "OrchestratorAgent": OrchestratorAgent(model_type, model_key)
         }
@@ -820,6 +831,7 @@ class MultiAgentDocumentSystem:
                 reasoning_steps=[],
                 next_agent="DocumentListAgent",
                 completed_agents=[],
+                document_filter=None,
                 stream_callback=stream_callback
             )
             
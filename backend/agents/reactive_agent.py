@@ -20,16 +20,35 @@ from .multi_agent_system import MultiAgentDocumentSystem
 
 class DocumentRetrievalTool(BaseTool):
     name: str = "document_retrieval"
-    description: str = "Retrieve relevant document chunks based on a query for a specific chat"
+    description: str = (
+        "Retrieve relevant document chunks based on a query for a specific chat. "
+        "Input is the search query, or to search only some documents a JSON object like "
+        '{"query": "...", "document_ids": [1], "document_names": ["2023 10-K"], "page_start": 1, "page_end": 20, '
+        '"created_after": "2024-01-01", "created_before": "2024-12-31"} (all keys but query optional; '
+        "get ids and names from document_list)"
+    )
     chat_id: int = Field(...)
     user_email: str = Field(...)
+    # Maximal marginal relevance selection; None uses the retrieval default (ENABLE_MMR)
+    mmr: Optional[bool] = None
 
-    def __init__(self, chat_id: int, user_email: str, **kwargs):
-        super().__init__(chat_id=chat_id, user_email=user_email, **kwargs)
+    def __init__(self, chat_id: int, user_email: str, mmr: Optional[bool] = None, **kwargs):
+        super().__init__(chat_id=chat_id, user_email=user_email, mmr=mmr, **kwargs)
 
-    def _run(self, query: str, k: int = 6) -> str:
+    def _run(self, query: str, k: Optional[int] = None, mmr: Optional[bool] = None) -> str:
         try:
-            sources = get_relevant_chunks(k, query, self.chat_id, self.user_email)
+            if k is None:
+                k = AgentConfig.get_retrieval_chunk_count()
+            filters = None
+            if query.lstrip().startswith("{"):
+                try:
+                    data = json.loads(query)
+                except ValueError:
+                    data = None
+                if isinstance(data, dict):
+                    query, filters = str(data.get("query", "")), data
+            sources = get_relevant_chunks(k, query, self.chat_id, self.user_email,
+                                          mmr=self.mmr if mmr is None else mmr, filters=filters)
             if not sources:
                 return "No relevant documents found for this query."
 
@@ -378,9 +397,11 @@ class StreamingAgentCallbackHandler(BaseCallbackHandler):
 
 
 class ReactiveDocumentAgent:
-    def __init__(self, model_type: int = 0, model_key: Optional[str] = None, use_multi_agent: Optional[bool] = None):
+    def __init__(self, model_type: int = 0, model_key: Optional[str] = None, use_multi_agent: Optional[bool] = None,
+                 mmr: Optional[bool] = None):
         self.model_type = model_type
         self.model_key = model_key
+        self.mmr = mmr
         # Use config default if not explicitly specified
         self.use_multi_agent = use_multi_agent if use_multi_agent is not None else AgentConfig.is_multi_agent_enabled()
         self.llm = self._initialize_llm()
@@ -389,7 +410,7 @@ class ReactiveDocumentAgent:
         # Initialize multi-agent system if enabled
         if self.use_multi_agent:
             try:
-                self.multi_agent_system = MultiAgentDocumentSystem(model_type, model_key)
+                self.multi_agent_system = MultiAgentDocumentSystem(model_type, model_key, mmr=mmr)
                 print("Multi-agent system initialized successfully")
             except Exception as e:
                 print(f"Failed to initialize multi-agent system: {e}")
@@ -417,7 +438,7 @@ class ReactiveDocumentAgent:
     
     def _create_agent(self, chat_id: int, user_email: str) -> AgentExecutor:
         tools = [
-            DocumentRetrievalTool(chat_id, user_email),
+            DocumentRetrievalTool(chat_id, user_email, mmr=self.mmr),
             ChatHistoryTool(chat_id, user_email),
             DocumentListTool(chat_id, user_email),
         ]
@@ -841,13 +862,14 @@ class WorkflowReactiveAgent(ReactiveDocumentAgent):
     def __init__(self, model_type: int = 1):  # Default to Claude for workflows
         super().__init__(model_type)
     
-    def process_workflow_query(self, query: str, workflow_id: int, user_email: str) -> str:
+    def process_workflow_query(self, query: str, workflow_id: int, user_email: str, sources=None) -> str:
         from api_endpoints.financeGPT.chatbot_endpoints import get_relevant_chunks_wf
         from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
         
         try:
-            # Get relevant chunks for workflow
-            sources = get_relevant_chunks_wf(2, query, workflow_id, user_email)
+            # Get relevant chunks for workflow, unless they were retrieved in a batch beforehand
+            if sources is None:
+                sources = get_relevant_chunks_wf(2, query, workflow_id, user_email)
             sources_str = " ".join([", ".join(str(elem) for elem in source) for source in sources])
             
             # Use Claude for workflow processing
@@ -0,0 +1,283 @@
+"""
+Approximate nearest-neighbour (IVF-flat) indexes for large chat/workflow corpora.
+
+Each index is a spherical k-means coarse quantizer over the corpus embeddings plus
+the list assignment of every chunk id. A query probes the `nprobe` closest lists and
+scores only their members exactly, instead of every row of the corpus matrix.
+
+Indexes are persisted under ANN_INDEX_DIR (one .npz file per corpus), extended
+incrementally as chunks are inserted and rebuilt when the corpus has doubled since
+training. Exact search stays the fallback for small corpora or when an index is missing.
+
+ANN search trades recall for latency (scripts/benchmark_ann.py measures recall@6
+of about 0.87-0.96 at nprobe=16), so it is opt-in: set ANN_ENABLED=true and tune
+ANN_NPROBE against the benchmark for the recall the deployment needs.
+"""
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ANN_ENABLED = os.getenv("ANN_ENABLED", "false").lower() == "true"
+ANN_MIN_CHUNKS = int(os.getenv("ANN_MIN_CHUNKS", "10000"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", os.path.join(_BACKEND_DIR, "db", "ann_indexes"))
+
+_KMEANS_ITERATIONS = 12
+_KMEANS_SAMPLES_PER_LIST = 64
+_ASSIGN_BLOCK_ROWS = 8192
+
+
+def _assign_to_lists(vectors, centroids):
+    """Nearest centroid (by inner product) for each row, computed in blocks to bound memory."""
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], _ASSIGN_BLOCK_ROWS):
+        block = vectors[start:start + _ASSIGN_BLOCK_ROWS]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index over unit-length vectors.
+
+    Only the coarse quantizer and the chunk-id -> list assignment are stored;
+    candidate rows are scored against the caller's full-precision corpus matrix.
+    """
+
+    def __init__(self, centroids, chunk_ids, assignments, trained_size):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.trained_size = int(trained_size)
+        self._set_members(np.asarray(chunk_ids, dtype=np.int64), np.asarray(assignments, dtype=np.int32))
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def train(cls, chunk_ids, matrix, nlist=None, seed=0):
+        """
+        Build an index with spherical k-means.
+
+        Args:
+            chunk_ids (np.array): Chunk id of each matrix row
+            matrix (np.array): Unit-length vectors (N x dimensions)
+            nlist (int, optional): Number of lists. Defaults to sqrt(N).
+            seed (int): Random seed for centroid initialisation
+        """
+        num_vectors = matrix.shape[0]
+        if nlist is None:
+            nlist = int(np.sqrt(num_vectors))
+        nlist = max(1, min(nlist, num_vectors))
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(num_vectors, nlist * _KMEANS_SAMPLES_PER_LIST)
+        sample = matrix[rng.choice(num_vectors, sample_size, replace=False)].astype(np.float32)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(_KMEANS_ITERATIONS):
+            assignments = _assign_to_lists(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty lists with random sample points
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            centroids = _normalize_rows(sums).astype(np.float32)
+
+        return cls(centroids, chunk_ids, _assign_to_lists(matrix, centroids), trained_size=num_vectors)
+
+    def add(self, chunk_ids, vectors):
+        """Assign new chunks to their nearest lists. Ids already in the index are ignored."""
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        if len(chunk_ids) == 0:
+            return 0
+        is_new = ~np.isin(chunk_ids, self.chunk_ids)
+        if not is_new.any():
+            return 0
+        new_assignments = _assign_to_lists(np.asarray(vectors, dtype=np.float32)[is_new], self.centroids)
+        self._set_members(np.concatenate([self.chunk_ids, chunk_ids[is_new]]),
+                          np.concatenate([self.assignments, new_assignments]))
+        return int(is_new.sum())
+
+    def retain(self, chunk_ids):
+        """Drop chunks that are no longer part of the corpus."""
+        keep = np.isin(self.chunk_ids, chunk_ids)
+        if not keep.all():
+            self._set_members(self.chunk_ids[keep], self.assignments[keep])
+
+    def needs_retraining(self):
+        return len(self) > 2 * self.trained_size
+
+    def candidates(self, query_vector, nprobe):
+        """Chunk ids stored in the nprobe lists closest to the query."""
+        nprobe = max(1, min(nprobe, self.nlist))
+        scores = self.centroids @ np.asarray(query_vector, dtype=np.float32)
+        probed = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._list_members(list_id) for list_id in probed])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, chunk_ids=self.chunk_ids,
+                 assignments=self.assignments, trained_size=np.array(self.trained_size))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["chunk_ids"], data["assignments"], int(data["trained_size"]))
+
+    def _set_members(self, chunk_ids, assignments):
+        self.chunk_ids = chunk_ids
+        self.assignments = assignments
+        # Group chunk ids by list so a probe is a slice rather than a scan
+        order = np.argsort(assignments, kind="stable")
+        self._sorted_chunk_ids = chunk_ids[order]
+        self._list_bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+
+    def _list_members(self, list_id):
+        return self._sorted_chunk_ids[self._list_bounds[list_id]:self._list_bounds[list_id + 1]]
+
+
+def index_path(key):
+    kind, corpus_id = key
+    return os.path.join(ANN_INDEX_DIR, f"{kind}_{int(corpus_id)}.npz")
+
+
+class _FileLock:
+    """Advisory lock so Flask workers and Ray tasks do not interleave index writes."""
+
+    def __init__(self, path):
+        self.path = f"{path}.lock"
+        self._handle = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._handle = open(self.path, "a")
+        if fcntl:
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+        self._handle.close()
+
+
+class AnnIndexStore:
+    """Per-process cache of IVF-flat indexes, kept in sync with the on-disk copies."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.RLock()
+
+    def applies_to(self, corpus):
+        """True if searches over this corpus go through an ANN index."""
+        return ANN_ENABLED and corpus.matrix is not None and len(corpus) >= ANN_MIN_CHUNKS
+
+    def search(self, key, corpus, query_vector, k, nprobe=None):
+        """
+        Approximate top-k over a CorpusMatrix.
+
+        Returns:
+            tuple: (row indices into corpus.matrix, scores), best first, or None
+                when the corpus is below ANN_MIN_CHUNKS or the index cannot be used
+        """
+        if k <= 0 or not self.applies_to(corpus):
+            return None
+
+        try:
+            index = self._synced_index(key, corpus)
+        except Exception as e:
+            print(f"[WARNING] ANN index unavailable for {key}, using exact search: {e}")
+            return None
+
+        candidate_ids = index.candidates(query_vector, nprobe or ANN_NPROBE)
+        rows = np.searchsorted(corpus.chunk_ids, candidate_ids)
+        rows = rows[(rows < len(corpus)) & (corpus.chunk_ids[np.minimum(rows, len(corpus) - 1)] == candidate_ids)]
+        if len(rows) < k:
+            return None
+
+        scores = corpus.matrix[rows] @ np.asarray(query_vector, dtype=corpus.matrix.dtype)
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top], scores[top]
+
+    def add_chunks(self, key, chunk_ids, vectors):
+        """Extend an existing on-disk index with newly inserted chunks (no-op if none exists)."""
+        path = index_path(key)
+        if not os.path.exists(path):
+            return 0
+        with _FileLock(path):
+            index = IVFFlatIndex.load(path)
+            added = index.add(chunk_ids, vectors)
+            if added:
+                index.save(path)
+        return added
+
+    def drop(self, key):
+        with self._lock:
+            self._indexes.pop(key, None)
+        path = index_path(key)
+        if not os.path.exists(path):
+            return
+        try:
+            with _FileLock(path):
+                if os.path.exists(path):
+                    os.remove(path)
+        except OSError as e:
+            print(f"[WARNING] Could not remove ANN index {path}: {e}")
+
+    def _synced_index(self, key, corpus):
+        with self._lock:
+            entry = self._indexes.get(key)
+            path = index_path(key)
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+
+            if entry is not None and entry["fingerprint"] == corpus.fingerprint and entry["mtime"] == mtime:
+                return entry["index"]
+
+            with _FileLock(path):
+                index = IVFFlatIndex.load(path) if mtime is not None else None
+                changed = False
+                if index is None or index.centroids.shape[1] != corpus.matrix.shape[1]:
+                    print(f"Training ANN index for {key} over {len(corpus)} chunks")
+                    index = IVFFlatIndex.train(corpus.chunk_ids, corpus.matrix)
+                    changed = True
+                else:
+                    before = len(index)
+                    index.retain(corpus.chunk_ids)
+                    missing = ~np.isin(corpus.chunk_ids, index.chunk_ids)
+                    index.add(corpus.chunk_ids[missing], corpus.matrix[missing])
+                    changed = len(index) != before or missing.any()
+                    if index.needs_retraining():
+                        print(f"Retraining ANN index for {key}: corpus grew to {len(corpus)} chunks")
+                        index = IVFFlatIndex.train(corpus.chunk_ids, corpus.matrix)
+                        changed = True
+                if changed:
+                    index.save(path)
+                mtime = os.path.getmtime(path)
+
+            self._indexes[key] = {"index": index, "fingerprint": corpus.fingerprint, "mtime": mtime}
+            return index
+
+
+ann_index_store = AnnIndexStore()
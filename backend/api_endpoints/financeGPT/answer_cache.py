@@ -0,0 +1,142 @@
+"""
+Semantic answer cache for chat questions.
+
+Answers are stored per content key and model together with the embedding of
+the question they answered. The content key covers what the answer was derived
+from: the user, the content hash and name of each document in the chat, and the
+chat history before the question. A new question whose embedding has a cosine
+similarity of at least SEMANTIC_CACHE_THRESHOLD to a stored one, asked with the
+same content key and model, is answered from the cache without retrieval or an
+LLM call. Keys do not name the chat, so the same documents uploaded to a new
+chat (as every SDK upload does) share the answers, and entries live in the
+shared cache, so paraphrases asked through any worker are served.
+"""
+import base64
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from api_endpoints.financeGPT.shared_cache import SharedCache
+
+SEMANTIC_CACHE_ENABLED = os.getenv("ENABLE_SEMANTIC_CACHE", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+# Answers kept per content key and model; the oldest are dropped first
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "64"))
+
+
+def _encode_vector(vector):
+    # float16 halves the stored size; similarity at the threshold is unaffected
+    return base64.b64encode(np.asarray(vector, dtype=np.float16).tobytes()).decode("ascii")
+
+
+def _decode_vector(value):
+    return np.frombuffer(base64.b64decode(value), dtype=np.float16).astype(np.float32)
+
+
+def answer_content_key(user_email, documents, history):
+    """
+    Digest of everything a chat answer depends on besides the question and model.
+
+    Args:
+        user_email (str): Owner of the chat; answers are not shared across users
+        documents (list): (content_hash, document_name) of each document in the chat
+        history (list): (sent_from_user, message_text) of each earlier message, oldest first
+
+    Returns:
+        str: Hex digest; equal for chats with the same documents and history
+    """
+    content = [
+        user_email,
+        sorted([content_hash, name] for content_hash, name in documents),
+        [[int(sent_from_user), message_text] for sent_from_user, message_text in history],
+    ]
+    return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by question embedding, bucketed by (content key, model).
+
+    The content key comes from answer_content_key, so any document change or new
+    message moves lookups to a new, empty bucket.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._store = SharedCache("answers")
+
+    def _key(self, content_key, model):
+        digest = hashlib.sha1(str(model).encode("utf-8")).hexdigest()
+        return f"{content_key}:{digest}"
+
+    def lookup(self, content_key, model, query_embedding):
+        """
+        Find the cached answer to the most similar question.
+
+        Args:
+            content_key (str): Digest from answer_content_key
+            model (tuple): Identifies the answering model, e.g. (model_type, model_key)
+            query_embedding (numpy.ndarray): Unit-length question embedding
+
+        Returns:
+            dict: answer, sources ((chunk_text, document_name) tuples), question and
+                similarity of the hit, or None
+        """
+        if not SEMANTIC_CACHE_ENABLED or self.ttl_seconds <= 0:
+            return None
+
+        entries = self._store.get(self._key(content_key, model)) or []
+        best = None
+        if entries:
+            vectors = np.stack([_decode_vector(entry["embedding"]) for entry in entries])
+            similarities = vectors @ np.asarray(query_embedding, dtype=np.float32)
+            position = int(np.argmax(similarities))
+            if similarities[position] >= self.threshold:
+                best = entries[position]
+                best = {
+                    "answer": best["answer"],
+                    "sources": [tuple(source) for source in best["sources"]],
+                    "question": best["question"],
+                    "similarity": float(similarities[position]),
+                }
+
+        self._store.incr("hits" if best is not None else "misses")
+        return best
+
+    def store(self, content_key, model, query_embedding, question, answer, sources):
+        """
+        Remember the answer to a question.
+        """
+        if not SEMANTIC_CACHE_ENABLED or self.ttl_seconds <= 0:
+            return
+
+        key = self._key(content_key, model)
+        entries = self._store.get(key) or []
+        entries.append({
+            "embedding": _encode_vector(query_embedding),
+            "question": question,
+            "answer": answer,
+            "sources": [list(source) for source in sources],
+        })
+        self._store.set(key, entries[-self.max_entries:], ttl_seconds=self.ttl_seconds)
+
+    def stats(self):
+        hits = self._store.counter("hits")
+        misses = self._store.counter("misses")
+        lookups = hits + misses
+        return {
+            "backend": self._store.backend,
+            "threshold": self.threshold,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+semantic_answer_cache = SemanticAnswerCache()
@@ -1,7 +1,6 @@
 from langchain_community.llms import OpenAI
 from langchain_community.vectorstores import Chroma
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 import ray
@@ -19,7 +18,9 @@ from flask import jsonify
 # from openai import OpenAI
 
 # """Module for fetching data from the SEC EDGAR Archives"""
+import hashlib
 import json
+from itertools import accumulate
 import os
 import re
 import uuid
@@ -38,6 +39,31 @@ else:
     from typing import Final
 
 from database.db import get_db_connection
+from api_endpoints.financeGPT.retrieval_cache import (
+    corpus_cache, chat_corpus_key, workflow_corpus_key, build_corpus_matrix,
+    query_embedding_cache, normalize_query_text, retrieval_result_cache
+)
+from api_endpoints.financeGPT.embedding_format import encode_embedding, decode_embedding, encode_embedding_code
+from api_endpoints.financeGPT.quantization import (
+    EMBEDDING_QUANTIZATION, QUANTIZED_RERANK_CANDIDATES, QUANTIZATION_KINDS, QuantizedMatrix
+)
+from api_endpoints.financeGPT.ann_index import ann_index_store, ANN_ENABLED
+from api_endpoints.financeGPT.lexical_index import (
+    HYBRID_RETRIEVAL, HYBRID_CANDIDATES, lexical_index_store, term_counts, encode_term_counts, decode_term_counts,
+    reciprocal_rank_fusion
+)
+from api_endpoints.financeGPT.diversity import MMR_ENABLED, MMR_LAMBDA, MMR_CANDIDATES, maximal_marginal_relevance
+from api_endpoints.financeGPT.retrieval_filters import RetrievalFilter
+from api_endpoints.financeGPT.answer_cache import semantic_answer_cache, answer_content_key, SEMANTIC_CACHE_ENABLED
+from api_endpoints.financeGPT.ingestion_pipeline import run_pipeline, batched
+from api_endpoints.financeGPT.embedding_cache import chunk_embedding_store, embedding_cache_key
+from api_endpoints.financeGPT.embedding_pool import get_embedding_pool, load_embedding_model
+from api_endpoints.financeGPT.embedding_batching import encode_length_bucketed
+from api_endpoints.financeGPT.span_splitter import SpanTextSplitter
+from api_endpoints.financeGPT.pdf_extraction import iter_pdf_pages, extract_pdf_pages, parse_pdf, ParsedDocument
+from api_endpoints.financeGPT.ingestion_jobs import start_ingestion_job, record_ingestion_progress, finish_ingestion_job, \
+    fail_ingestion_job
+from api_endpoints.financeGPT.document_diff import plan_reingest
 from tika import parser as p
 
 
@@ -49,11 +75,30 @@ sec_api_key = os.getenv('SEC_API_KEY')
 # Embedding Configuration
 EMBEDDING_MODEL = 'sentence-transformers/all-mpnet-base-v2'
 EMBEDDING_DIMENSIONS = 768
+_PASSAGE_PREFIX = "passage: "
 MAX_CHUNK_SIZE = 1500
 CHUNK_OVERLAP = 200
 
+# Background rewrite of legacy float64 embedding BLOBs to the versioned float32 format
+EMBEDDING_MIGRATION_BATCH_SIZE = int(os.getenv("EMBEDDING_MIGRATION_BATCH_SIZE", "500"))
+EMBEDDING_MIGRATION_PAUSE_SECONDS = float(os.getenv("EMBEDDING_MIGRATION_PAUSE_SECONDS", "0.1"))
+
+# Pipelined ingestion: chunks per embed/insert batch
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# New chunks are appended to an existing ANN index this many at a time
+_ANN_FLUSH_CHUNKS = 2048
+
+# Optional cross-encoder rerank stage (ENABLE_RERANKING=true): over-fetch RERANK_CANDIDATES chunks, keep the best k
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_ENABLED = os.getenv("ENABLE_RERANKING", "false").lower() == "true"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_LATENCY_BUDGET_MS = float(os.getenv("RERANK_LATENCY_BUDGET_MS", "400"))
+
 # Global model cache for optimal performance
 _embedding_model = None
+_reranker_model = None
+_reranker_failed = False
 _text_splitter = None
 try:
     import threading
@@ -82,6 +127,21 @@ def add_chat_to_db(user_email, chat_type, model_type): #intake the current userI
 
     return chat_id
 
+def _reencode_embedding(blob):
+    # Copies are written in the current storage format, whatever the source row used
+    embedding = decode_embedding(blob)
+    if embedding is None:
+        return blob
+    return encode_embedding(embedding)
+
+def _encode_chunk_embedding(embedding):
+    # (embedding_vector, embedding_int8, embedding_binary) column values for one chunk
+    return (
+        encode_embedding(embedding),
+        encode_embedding_code(embedding, "int8"),
+        encode_embedding_code(embedding, "binary"),
+    )
+
 def create_chat_shareable_url(chat_id):
     conn, cursor = get_db_connection()
     # Generate shareable UUID
@@ -142,7 +202,7 @@ def create_chat_shareable_url(chat_id):
                 chat_share_doc_id,
                 chunk["start_index"],
                 chunk["end_index"],
-                chunk["embedding_vector"],
+                _reencode_embedding(chunk["embedding_vector"]),
                 chunk["page_number"]
             ))
     conn.commit()
@@ -205,7 +265,7 @@ def access_sharable_chat(share_uuid, user_id=1):
                 new_doc_id,
                 chunk['start_index'],
                 chunk['end_index'],
-                chunk['embedding_vector'],
+                _reencode_embedding(chunk['embedding_vector']),
                 chunk['page_number']
             ))
     conn.commit()
@@ -432,6 +492,9 @@ def delete_chat_from_db(chat_id, user_email):
     cursor.execute(query, (chat_id, user_email))
 
     conn.commit()
+    corpus_cache.invalidate_chat(chat_id)
+    ann_index_store.drop(chat_corpus_key(chat_id))
+    lexical_index_store.invalidate(chat_corpus_key(chat_id))
 
     if cursor.rowcount > 0:
         print(f"Deleted chat with ID {chat_id} for user {user_email}.")
@@ -536,6 +599,9 @@ def reset_uploaded_docs(chat_id, user_email):
     cursor.execute(delete_documents_query, (chat_id, user_email))
 
     conn.commit()
+    corpus_cache.invalidate_chat(chat_id)
+    ann_index_store.drop(chat_corpus_key(chat_id))
+    lexical_index_store.invalidate(chat_corpus_key(chat_id))
 
     conn.close()
     cursor.close()
@@ -559,6 +625,9 @@ def reset_uploaded_docs_for_workflow(workflow_id, user_email):
     cursor.execute(delete_documents_query, (workflow_id,))
 
     conn.commit()
+    corpus_cache.invalidate_workflow(workflow_id)
+    ann_index_store.drop(workflow_corpus_key(workflow_id))
+    lexical_index_store.invalidate(workflow_corpus_key(workflow_id))
 
     conn.close()
     cursor.close()
@@ -584,10 +653,64 @@ def change_chat_mode_db(chat_mode_to_change_to, chat_id, user_email):
 
 
 
+def _content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _reuse_duplicate_chunks(cursor, document_id, content_hash):
+    """
+    Copy the chunks of a fully ingested document with identical text into a new document.
+
+    Chunk offsets, embeddings and term counts depend only on the text, so the
+    rows of an identical upload anywhere (another chat, workflow or user) are
+    valid as they are. The copy runs server-side in one statement and replaces
+    splitting and embedding the document.
+
+    Returns:
+        int: Number of chunks copied, 0 if there is no finished duplicate
+    """
+    cursor.execute("""
+        SELECT id FROM documents
+        WHERE content_hash = %s AND id <> %s AND chunk_count > 0
+        ORDER BY id
+        LIMIT 1
+    """, (content_hash, document_id))
+    source = cursor.fetchone()
+    if not source:
+        return 0
+
+    cursor.execute("""
+        INSERT INTO chunks (start_index, end_index, document_id, embedding_vector, embedding_int8, embedding_binary, term_counts, page_number)
+        SELECT start_index, end_index, %s, embedding_vector, embedding_int8, embedding_binary, term_counts, page_number
+        FROM chunks
+        WHERE document_id = %s
+        ORDER BY id
+    """, (document_id, source["id"]))
+    copied = cursor.rowcount
+    if copied > 0:
+        cursor.execute('UPDATE documents SET chunk_count = %s WHERE id = %s', (copied, document_id))
+        print(f"Reused {copied} chunks of document {source['id']} with identical content for document {document_id}")
+    return max(copied, 0)
+
 def add_document_to_db(text, document_name, chat_id=None, organization_id=None):
+    """
+    Add a document to a chat.
+
+    If a document with identical text has already been ingested anywhere, its
+    chunks are copied and the document needs no chunking. A document with the
+    same name but different text replaces the chat's existing one once it is
+    chunked, which re-embeds only the edited parts. `text` may be a
+    ParsedDocument.
+
+    Returns:
+        tuple: (document id, True if the document needs no chunking because it
+            already existed unchanged in the chat or reused a duplicate's chunks)
+    """
     if chat_id == 0:
         print(f"Guest session: Skipping database storage for document '{document_name}'")
         return None, False
+
+    if isinstance(text, ParsedDocument):
+        text = text.text
     
     conn, cursor = get_db_connection()
 
@@ -602,148 +725,101 @@ def add_document_to_db(text, document_name, chat_id=None, organization_id=None):
         existing_doc = cursor.fetchone()
 
         if existing_doc:
-            existing_doc_id, existing_doc_text = existing_doc
-            print(f"Document '{document_name}' already exists. Not creating a new entry.")
-            return existing_doc_id, True  # Returning the ID of the existing document
+            if existing_doc["document_text"] == text:
+                print(f"Document '{document_name}' already exists. Not creating a new entry.")
+                return existing_doc["id"], True  # Returning the ID of the existing document
+            # Edited re-upload: chunking re-ingests the changes (see reingest_document_chunks)
+            print(f"Document '{document_name}' changed. Re-ingesting document {existing_doc['id']}.")
+            return existing_doc["id"], False
 
         # If the document doesn't exist, create a new one
         storage_key = "temp"  # You can adjust how the storage key is generated
+        content_hash = _content_hash(text)
         cursor.execute("""
-            INSERT INTO documents (document_text, document_name, storage_key, chat_id)
-            VALUES (%s, %s, %s, %s)
-        """, (text, document_name, storage_key, chat_id))
+            INSERT INTO documents (document_text, document_name, storage_key, chat_id, content_hash)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (text, document_name, storage_key, chat_id, content_hash))
 
         doc_id = cursor.lastrowid
+        reused = _reuse_duplicate_chunks(cursor, doc_id, content_hash)
 
         conn.commit()
-        return doc_id, False  # Returning the ID of the new document
+        corpus_cache.invalidate_chat(chat_id)
+        return doc_id, reused > 0  # Returning the ID of the new document
     finally:
         cursor.close()
         conn.close()
 
 
 def add_document_to_wfs_db(text, document_name, workflow_id):
+    # Add a document (text or ParsedDocument) to a workflow, see add_document_to_db
+    if isinstance(text, ParsedDocument):
+        text = text.text
+
     conn, cursor = get_db_connection()
 
     cursor.execute("SELECT id, document_text FROM documents WHERE document_name = %s AND workflow_id = %s", (document_name, workflow_id))
     existing_doc = cursor.fetchone()
 
     if existing_doc:
-        existing_doc_id, existing_doc_text = existing_doc
-        print("Doc named ", document_name, " exists. Do not create a new entry")
         conn.close()
-        return existing_doc_id, True  # Returning the ID of the existing document
+        if existing_doc["document_text"] == text:
+            print("Doc named ", document_name, " exists. Do not create a new entry")
+            return existing_doc["id"], True  # Returning the ID of the existing document
+        print(f"Doc named {document_name} changed. Re-ingesting document {existing_doc['id']}")
+        return existing_doc["id"], False
 
 
     storage_key = "temp"
-    cursor.execute("INSERT INTO documents (workflow_id, document_name, document_text, storage_key) VALUES (%s, %s, %s, %s)", (workflow_id, document_name, text, storage_key))
+    content_hash = _content_hash(text)
+    cursor.execute("INSERT INTO documents (workflow_id, document_name, document_text, storage_key, content_hash) VALUES (%s, %s, %s, %s, %s)", (workflow_id, document_name, text, storage_key, content_hash))
 
     doc_id = cursor.lastrowid
+    reused = _reuse_duplicate_chunks(cursor, doc_id, content_hash)
 
     conn.commit()
+    corpus_cache.invalidate_workflow(workflow_id)
     conn.close()
-    cursor.close()
+
+    # Like add_document_to_db, True means no chunking is needed
+    return doc_id, reused > 0
 
 
+def _fail_job_of_task(job_id, error):
+    # Ray tasks record a failure that happened outside ingest_document_chunks' own handling
+    if job_id is None:
+        return
+    try:
+        fail_ingestion_job(job_id, error)
+    except Exception as job_error:
+        print(f"[ERROR] Failed to mark ingestion job {job_id} as failed: {job_error}")
+
 @ray.remote
-def chunk_document_by_page_optimized(text_pages, maxChunkSize, document_id):
+def chunk_document_by_page_optimized(text_pages, maxChunkSize, document_id, job_id=None):
     """
     Optimized page-based document chunking with RecursiveCharacterTextSplitter and batch embedding generation.
-    Processes all chunks across all pages in batches for better performance and also preserving semantic boundaries so that the meaning is retained.
+    Pages are split, embedded and inserted as a pipeline (see ingest_document_chunks), preserving
+    semantic boundaries so that the meaning is retained.
     """
     print("start optimized semantic page chunk doc")
 
-    conn, cursor = get_db_connection()
-
-    chunk_texts = []
-    chunk_metadata = []
-    globalStartIndex = 0
-    page_number = 1
-
     try:
-        # Get the global text splitter instance
-        text_splitter = _get_text_splitter(maxChunkSize)
-        
-        # Process each page with semantic chunking
-        for page_text in text_pages:
-            # Split page text into semantic chunks
-            page_chunks = text_splitter.split_text(page_text)
-            print(f"Page {page_number}: Created {len(page_chunks)} semantic chunks")
-            
-            # Track position within this page for accurate indexing
-            page_pos = 0
-            for chunk in page_chunks:
-
-                # Find chunk position in the page
-                chunk_start_in_page = page_text.find(chunk, page_pos)
-                if chunk_start_in_page == -1:
-                    chunk_start_in_page = page_text.find(chunk)
-                
-                chunk_end_in_page = chunk_start_in_page + len(chunk)
-                
-                # Calculate global positions
-                global_start = globalStartIndex + chunk_start_in_page
-                global_end = globalStartIndex + chunk_end_in_page
-                
-                chunk_texts.append(chunk)
-                chunk_metadata.append({
-                    "global_start": global_start,
-                    "global_end": global_end,
-                    "page_number": page_number
-                })
-                
-                # Update page position for next chunk search
-                page_pos = chunk_start_in_page + 1
-
-            globalStartIndex += len(page_text)
-            page_number += 1
-
-        # Generate embeddings for all chunks in batches
-        print(f"Generating embeddings for {len(chunk_texts)} semantic page chunks in batches...")
-        embeddings = get_embeddings_batch(chunk_texts, batch_size=32)
-        
-        # Validate dimensions
-        for i, embedding in enumerate(embeddings):
-            if len(embedding) != EMBEDDING_DIMENSIONS:
-                raise RuntimeError(f"Page chunk {i} embedding dimension mismatch: expected {EMBEDDING_DIMENSIONS}, got {len(embedding)}")
-        
-        # Insert the chunks into database
-        chunk_data = []
-        for i, (metadata, embedding) in enumerate(zip(chunk_metadata, embeddings)):
-            embedding_array = np.array(embedding)
-            blob = embedding_array.tobytes()
-            
-            chunk_data.append((
-                metadata["global_start"],
-                metadata["global_end"], 
-                document_id,
-                blob,
-                metadata["page_number"]
-            ))
-
-        # Batch insert into database
-        cursor.executemany(
-            'INSERT INTO chunks (start_index, end_index, document_id, embedding_vector, page_number) VALUES (%s,%s,%s,%s,%s)',
-            chunk_data
-        )
-
-        print(f"Successfully processed {len(chunk_data)} semantic page chunks with batch embeddings")
-        conn.commit()
-        
+        chunk_count = ingest_document_chunks(text_pages, maxChunkSize, document_id, job_id=job_id)
+        print(f"Successfully processed {chunk_count} semantic page chunks with batch embeddings")
+        return chunk_count
     except Exception as e:
         import traceback
         traceback.print_exc()
         print(f"[FATAL ERROR] Exception during optimized semantic page chunking: {e}")
+        _fail_job_of_task(job_id, e)
         raise RuntimeError("Optimized semantic page chunking failed due to internal error")
-    finally:
-        conn.close()
 
 @ray.remote
-def chunk_document_by_page(text_pages, maxChunkSize, document_id):
+def chunk_document_by_page(text_pages, maxChunkSize, document_id, job_id=None):
     """
     Redirects to optimized version.
     """
-    return chunk_document_by_page_optimized.remote(text_pages, maxChunkSize, document_id)
+    return chunk_document_by_page_optimized.remote(text_pages, maxChunkSize, document_id, job_id)
 
 def _get_model():
     """
@@ -764,14 +840,8 @@ def _get_model():
             with _model_lock:
                 if _embedding_model is None:
                     print(f"Loading {EMBEDDING_MODEL} model with optimizations...")
-                    import numpy as np  
-                    from sentence_transformers import SentenceTransformer
-                    import torch
-                        
-                        # Use GPU if available for faster inference
-                    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-                    _embedding_model = SentenceTransformer(EMBEDDING_MODEL, device=device)
-                    print(f"Model loaded on device: {device}")
+                    # Uses the GPU if available for faster inference
+                    _embedding_model = load_embedding_model(EMBEDDING_MODEL)
         else:
             print(f"Loading {EMBEDDING_MODEL} model...")
             import numpy as np
@@ -783,6 +853,72 @@ def _get_model():
     
     return _embedding_model
 
+def _get_reranker():
+    """
+    Get the global cross-encoder reranker with thread-safe initialization.
+
+    Returns:
+        CrossEncoder: The reranker, or None if it could not be loaded
+    """
+    global _reranker_model, _reranker_failed
+
+    if _reranker_model is not None or _reranker_failed:
+        return _reranker_model
+
+    try:
+        with _model_lock:
+            if _reranker_model is None and not _reranker_failed:
+                print(f"Loading {RERANK_MODEL} reranker...")
+                from sentence_transformers import CrossEncoder
+                _reranker_model = CrossEncoder(RERANK_MODEL, device="cpu")
+    except Exception as e:
+        # Retrieval keeps working without the rerank stage
+        print(f"[WARNING] Failed to load reranker, reranking disabled: {e}")
+        _reranker_failed = True
+
+    return _reranker_model
+
+def rerank_chunks(question, sources, k, budget_ms=None):
+    """
+    Reorder retrieved chunks with the cross-encoder and keep the best k.
+
+    Candidates are scored in batches of RERANK_BATCH_SIZE. If the latency budget
+    runs out before every candidate is scored, reranking is abandoned and the
+    bi-encoder order is kept.
+
+    Args:
+        question (str): The query
+        sources (list): (chunk_text, document_name) tuples in bi-encoder order
+        k (int): Number of chunks to keep
+        budget_ms (float, optional): Latency budget. Defaults to RERANK_LATENCY_BUDGET_MS.
+
+    Returns:
+        tuple: (top-k sources, whether the reranker order was applied)
+    """
+    if len(sources) <= 1:
+        return sources[:k], True
+
+    reranker = _get_reranker()
+    if reranker is None:
+        return sources[:k], False
+
+    budget_seconds = (RERANK_LATENCY_BUDGET_MS if budget_ms is None else budget_ms) / 1000.0
+    started = time.perf_counter()
+    scores = []
+    try:
+        for start in range(0, len(sources), RERANK_BATCH_SIZE):
+            if scores and time.perf_counter() - started > budget_seconds:
+                print(f"[WARNING] Rerank budget of {budget_seconds * 1000:.0f}ms exceeded, keeping bi-encoder order")
+                return sources[:k], False
+            pairs = [(question, chunk_text) for chunk_text, _ in sources[start:start + RERANK_BATCH_SIZE]]
+            scores.extend(reranker.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False).tolist())
+    except Exception as e:
+        print(f"[WARNING] Reranking failed, keeping bi-encoder order: {e}")
+        return sources[:k], False
+
+    order = np.argsort(-np.asarray(scores), kind="stable")[:k]
+    return [sources[i] for i in order], True
+
 # Dictionary to cache text splitters by chunk size
 _text_splitters = {}
 
@@ -795,7 +931,7 @@ def _get_text_splitter(chunk_size=None):
         chunk_size (int, optional): Chunk size. Defaults to MAX_CHUNK_SIZE.
     
     Returns:
-        RecursiveCharacterTextSplitter: The text splitter
+        SpanTextSplitter: The text splitter (RecursiveCharacterTextSplitter chunks, with offsets)
     """
     global _text_splitters
     
@@ -807,21 +943,19 @@ def _get_text_splitter(chunk_size=None):
             if _splitter_lock:
                 with _splitter_lock:
                     if chunk_size not in _text_splitters:
-                        print(f"Initializing RecursiveCharacterTextSplitter with chunk_size={chunk_size}...")
-                        _text_splitters[chunk_size] = RecursiveCharacterTextSplitter(
+                        print(f"Initializing SpanTextSplitter with chunk_size={chunk_size}...")
+                        _text_splitters[chunk_size] = SpanTextSplitter(
                             chunk_size=chunk_size,
                             chunk_overlap=CHUNK_OVERLAP,
                             separators=["\n\n", "\n", ". ", "? ", "! ", " ", ""],
-                            length_function=len,
                         )
-                        print(f"RecursiveCharacterTextSplitter (chunk_size={chunk_size}) initialized successfully!")
+                        print(f"SpanTextSplitter (chunk_size={chunk_size}) initialized successfully!")
             else:
-                print(f"Initializing RecursiveCharacterTextSplitter with chunk_size={chunk_size}...")
-                _text_splitters[chunk_size] = RecursiveCharacterTextSplitter(
+                print(f"Initializing SpanTextSplitter with chunk_size={chunk_size}...")
+                _text_splitters[chunk_size] = SpanTextSplitter(
                     chunk_size=chunk_size,
                     chunk_overlap=CHUNK_OVERLAP,
                     separators=["\n\n", "\n", ". ", "? ", "! ", " ", ""],
-                    length_function=len,
                 )
         except Exception as e:
             print(f"[ERROR] Failed to initialize text splitter: {e}")
@@ -835,9 +969,9 @@ def preload_text_splitter():
     Should be called during application startup for optimal performance.
     """
     try:
-        print("Preloading RecursiveCharacterTextSplitter for faster document processing...")
+        print("Preloading SpanTextSplitter for faster document processing...")
         _get_text_splitter()
-        print("RecursiveCharacterTextSplitter preloaded successfully!")
+        print("SpanTextSplitter preloaded successfully!")
     except Exception as e:
         print(f"[WARNING] Failed to preload text splitter: {e}")
 
@@ -863,28 +997,37 @@ def preload_models():
 
 def get_embedding(question):
     """
-    Get embedding for a given text using Multilingual-E5-large model.
+    Get embedding for a given text using the EMBEDDING_MODEL sentence transformer.
+
+    Results are cached by model and normalized text (whitespace and case
+    folded), so repeated or trivially re-worded queries skip the forward pass.
     
     Args:
         question (str): The text to embed
     
     Returns:
-        list: The embedding vector (1024 dimensions)
+        list: The embedding vector (EMBEDDING_DIMENSIONS dimensions)
         
     Raises:
         RuntimeError: If the embedding generation fails
     """
+    normalized_question = normalize_query_text(question)
+    cached = query_embedding_cache.get(EMBEDDING_MODEL, normalized_question)
+    if cached is not None:
+        return cached
+
     try:
         model = _get_model()
         
         # Add prefix for better performance as recommended by the model
-        prefixed_question = f"query: {question}"
-        embedding = model.encode(prefixed_question,  show_progress_bar=True, normalize_embeddings=True).tolist()
+        prefixed_question = f"query: {normalized_question}"
+        embedding = model.encode(prefixed_question, show_progress_bar=False, normalize_embeddings=True).tolist()
         
         # Validate dimensions using constant
         if len(embedding) != EMBEDDING_DIMENSIONS:
             raise RuntimeError(f"Unexpected embedding dimension: {len(embedding)}, expected {EMBEDDING_DIMENSIONS}")
-            
+
+        query_embedding_cache.put(EMBEDDING_MODEL, normalized_question, embedding)
         return embedding
         
     except Exception as e:
@@ -892,45 +1035,104 @@ def get_embedding(question):
         raise RuntimeError(f"Embedding generation failed: {str(e)}")
 
 @ray.remote
-def chunk_document(text, maxChunkSize, document_id):
-    return chunk_document_optimized.remote(text, maxChunkSize, document_id)
+def chunk_document(text, maxChunkSize, document_id, job_id=None):
+    return chunk_document_optimized.remote(text, maxChunkSize, document_id, job_id)
+
+
+def get_query_embeddings(questions):
+    """
+    Get embeddings for several queries, encoding all cache misses in one model call.
+
+    Args:
+        questions (list): Query strings
 
+    Returns:
+        list: One embedding vector per question, in order
 
-def get_embeddings_batch(texts, batch_size=32):
+    Raises:
+        RuntimeError: If the embedding generation fails
+    """
+    normalized_questions = [normalize_query_text(question) for question in questions]
+    embeddings = [query_embedding_cache.get(EMBEDDING_MODEL, text) for text in normalized_questions]
+    missing = list(dict.fromkeys(text for text, embedding in zip(normalized_questions, embeddings) if embedding is None))
+    if not missing:
+        return embeddings
+
+    try:
+        model = _get_model()
+        encoded = model.encode([f"query: {text}" for text in missing], normalize_embeddings=True,
+                               show_progress_bar=False).tolist()
+    except Exception as e:
+        print(f"[ERROR] Failed to get query embeddings: {e}")
+        raise RuntimeError(f"Embedding generation failed: {str(e)}")
+
+    encoded_by_text = {}
+    for text, embedding in zip(missing, encoded):
+        if len(embedding) != EMBEDDING_DIMENSIONS:
+            raise RuntimeError(f"Unexpected embedding dimension: {len(embedding)}, expected {EMBEDDING_DIMENSIONS}")
+        query_embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+        encoded_by_text[text] = embedding
+
+    return [embedding if embedding is not None else encoded_by_text[text]
+            for text, embedding in zip(normalized_questions, embeddings)]
+
+def _encode_passages(prefixed_texts, batch_size):
+    """
+    Embed passages with the shared embedding pool (see embedding_pool), or with
+    this process's model if the pool is disabled or unavailable. Either way,
+    forward passes are length-bucketed batches (see embedding_batching).
+    """
+    pool = get_embedding_pool(EMBEDDING_MODEL)
+    if pool is not None:
+        try:
+            return pool.encode(prefixed_texts, batch_size)
+        except Exception as e:
+            print(f"[WARNING] Embedding pool failed, embedding in this process: {e}")
+
+    return encode_length_bucketed(_get_model(), prefixed_texts)
+
+def get_embeddings_batch(texts, batch_size=32, stats=None):
     """
     Get embeddings for multiple texts in batches for better performance.
+
+    Embeddings already in the persistent chunk-embedding cache are reused and
+    identical texts are embedded once; only the remaining texts are run
+    through the model, and their embeddings are added to the cache.
     
     Args:
         texts (list): List of text strings to embed
-        batch_size (int): Number of texts to process in each batch (increased default)
+        batch_size (int): Number of texts per embedding pool request; forward passes are
+            sized by EMBEDDING_TOKEN_BUDGET
+        stats (dict, optional): Accumulates "cache_hits" and "cache_misses"
     
     Returns:
         list: List of embedding vectors
     """
     try:
-        import numpy as np
-        model = _get_model()
-        embeddings = []
-        
-        # Process texts in batches
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
+        keys = [embedding_cache_key(EMBEDDING_MODEL, _PASSAGE_PREFIX, text) for text in texts]
+        known = chunk_embedding_store.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in known and key not in missing:
+                missing[key] = text
+
+        hits = sum(1 for key in keys if key in known)
+        if stats is not None:
+            stats["cache_hits"] = stats.get("cache_hits", 0) + hits
+            stats["cache_misses"] = stats.get("cache_misses", 0) + len(texts) - hits
+
+        if missing:
+            missing_keys = list(missing)
             # Add prefix for better performance as recommended by the model
-            prefixed_texts = [f"passage: {text}" for text in batch_texts]
-            
-            # Get batch embeddings with optimized settings
-            batch_embeddings = model.encode(
-                prefixed_texts, 
-                normalize_embeddings=True,
-                batch_size=batch_size,
-                show_progress_bar=False,  # Reduce overhead
-                convert_to_tensor=False   # Direct to list for efficiency
-            )
-            
-            embeddings.extend(batch_embeddings.tolist())
-            print(f"Processed batch {i//batch_size + 1}/{(len(texts) + batch_size - 1)//batch_size}")
-        
-        return embeddings
+            computed = _encode_passages([f"{_PASSAGE_PREFIX}{text}" for text in missing.values()], batch_size)
+
+            chunk_embedding_store.put_many(list(zip(missing_keys, computed)))
+            known.update(zip(missing_keys, computed))
+
+        if texts:
+            print(f"Chunk embedding cache: {hits}/{len(texts)} hits ({hits / len(texts):.0%})")
+        return [known[key] for key in keys]
         
     except Exception as e:
         print(f"[ERROR] Failed to get batch embeddings: {e}")
@@ -951,49 +1153,275 @@ def prepare_chunks_for_embedding(text_pages, maxChunkSize):
 
     chunk_texts = []
     chunk_metadata = []
-    globalStartIndex = 0
-    page_number = 1
+    for chunk, global_start, global_end, page_number in _iter_chunk_spans(text_pages, maxChunkSize):
+        chunk_texts.append(chunk)
+        chunk_metadata.append({
+            "global_start": global_start,
+            "global_end": global_end,
+            "page_number": page_number
+        })
 
-    # Get the global text splitter instance
+    return chunk_texts, chunk_metadata
+
+def _iter_chunk_spans(text_pages, maxChunkSize, numbered_pages=True):
+    """
+    Lazily split pages into semantic chunks, in one pass over the pages.
+
+    Each page is split whole, as one text, and chunks are produced as the
+    splitter reaches them; only the chunk being yielded is copied out of the
+    page. The splitter reports each chunk's offsets, so no searching is needed
+    to place it in the document.
+
+    Yields:
+        tuple: (chunk_text, global_start, global_end, page_number or None)
+    """
     text_splitter = _get_text_splitter(maxChunkSize)
+    page_offset = 0
+    for page_number, page_text in enumerate(text_pages, start=1):
+        for chunk_start, chunk_end in text_splitter.iter_spans(page_text):
+            yield (page_text[chunk_start:chunk_end], page_offset + chunk_start, page_offset + chunk_end,
+                   page_number if numbered_pages else None)
+        page_offset += len(page_text)
+
+def _needs_reingest(text_pages, document_id):
+    # True if the document already has chunks or its stored text is not text_pages (an edited re-upload)
+    conn, cursor = get_db_connection()
+    try:
+        cursor.execute(
+            'SELECT content_hash, EXISTS(SELECT 1 FROM chunks WHERE document_id = %s) AS has_chunks FROM documents WHERE id = %s',
+            (document_id, document_id)
+        )
+        document = cursor.fetchone()
+    finally:
+        conn.close()
+    return bool(document) and (bool(document["has_chunks"]) or document["content_hash"] != _content_hash("".join(text_pages)))
 
-    for page_text in text_pages:
-        # Split page text into semantic chunks
-        page_chunks = text_splitter.split_text(page_text)
-        
-        # Track position within this page for accurate indexing
-        page_position = 0
-        for chunk in page_chunks:
-            # Find chunk position within the page
-            chunk_start_in_page = page_text.find(chunk, page_position)
-            if chunk_start_in_page == -1:
-                chunk_start_in_page = page_text.find(chunk)
-            
-            chunk_end_in_page = chunk_start_in_page + len(chunk)
-            
-            # Calculate global positions
-            global_start = globalStartIndex + chunk_start_in_page
-            global_end = globalStartIndex + chunk_end_in_page
-            
-            chunk_texts.append(chunk)
-            chunk_metadata.append({
-                "global_start": global_start,
-                "global_end": global_end,
-                "page_number": page_number
-            })
-            
-            # Update page position for next chunk search
-            page_position = chunk_start_in_page + 1
+def ingest_document_chunks(text_pages, maxChunkSize, document_id, numbered_pages=True, job_id=None):
+    """
+    Split, embed and insert a document's chunks as an overlapping pipeline.
 
-        globalStartIndex += len(page_text)
-        page_number += 1
+    Splitting, embedding and inserting run in separate threads connected by
+    bounded queues (see ingestion_pipeline), each batch of INGEST_BATCH_SIZE
+    chunks is committed as soon as it is embedded, so the first chunks are
+    searchable while the rest of the document is still being processed and
+    peak memory does not grow with the document. If any stage fails, the
+    chunks already inserted for the document are removed.
 
-    return chunk_texts, chunk_metadata
+    With a job_id, progress is recorded on the ingestion job after every
+    inserted batch and the job is marked completed or failed at the end.
+
+    Args:
+        text_pages (iterable): Page texts (a single-element list for unpaged text);
+            a generator such as iter_pdf_pages() is read into a list first, since
+            the text is hashed before it is split
+        maxChunkSize (int): Maximum chunk size
+        document_id (int): Database document ID
+        numbered_pages (bool): Store page numbers with the chunks
+        job_id (str, optional): Ingestion job to report progress on
+
+    A document that already has chunks, or whose stored text differs from
+    text_pages (an edited re-upload), is re-ingested incrementally instead (see
+    reingest_document_chunks).
+
+    Returns:
+        int: Number of chunks inserted
+    """
+    text_pages = list(text_pages)
+    if _needs_reingest(text_pages, document_id):
+        return reingest_document_chunks(text_pages, maxChunkSize, document_id, numbered_pages, job_id)
+
+    conn, cursor = get_db_connection()
+    ann_key = None
+    progress = {"embedded": 0, "chunks": 0, "last_chunk_id": 0}
+    cache_stats = {"cache_hits": 0, "cache_misses": 0}
+    pending_ann = []
+
+    def embed(batch):
+        embeddings = get_embeddings_batch([chunk_text for chunk_text, _, _, _ in batch], batch_size=len(batch),
+                                          stats=cache_stats)
+        for i, embedding in enumerate(embeddings):
+            if len(embedding) != EMBEDDING_DIMENSIONS:
+                raise RuntimeError(f"Chunk {progress['embedded'] + i} embedding dimension mismatch: expected {EMBEDDING_DIMENSIONS}, got {len(embedding)}")
+        progress["embedded"] += len(batch)
+        return batch, embeddings
+
+    def insert(item):
+        batch, embeddings = item
+        cursor.executemany(
+            'INSERT INTO chunks (start_index, end_index, document_id, embedding_vector, embedding_int8, embedding_binary, term_counts, page_number) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)',
+            [
+                (start, end, document_id, *_encode_chunk_embedding(embedding), encode_term_counts(chunk_text), page_number)
+                for (chunk_text, start, end, page_number), embedding in zip(batch, embeddings)
+            ]
+        )
+        progress["chunks"] += len(batch)
+        if job_id is not None:
+            record_ingestion_progress(cursor, job_id, progress["embedded"], progress["chunks"])
+        conn.commit()
+
+        if ann_key is not None:
+            pending_ann.extend(embeddings)
+            if len(pending_ann) >= _ANN_FLUSH_CHUNKS:
+                progress["last_chunk_id"] = _add_chunks_to_ann_index(cursor, ann_key, document_id, pending_ann,
+                                                                     progress["last_chunk_id"])
+                pending_ann.clear()
+        print(f"Inserted {progress['chunks']} chunks for document {document_id}")
+
+    try:
+        ann_key = _document_corpus_key(cursor, document_id)
+        if job_id is not None:
+            start_ingestion_job(cursor, job_id)
+            conn.commit()
+
+        run_pipeline(
+            batched(_iter_chunk_spans(text_pages, maxChunkSize, numbered_pages), INGEST_BATCH_SIZE),
+            [embed, insert],
+        )
+        if ann_key is not None and pending_ann:
+            _add_chunks_to_ann_index(cursor, ann_key, document_id, pending_ann, progress["last_chunk_id"])
+
+        # Marks the document as fully ingested, so identical uploads can reuse its chunks
+        cursor.execute('UPDATE documents SET chunk_count = %s WHERE id = %s', (progress["chunks"], document_id))
+        if job_id is not None:
+            finish_ingestion_job(cursor, job_id)
+        conn.commit()
+
+        if progress["chunks"]:
+            print(f"Document {document_id}: {cache_stats['cache_hits']}/{progress['chunks']} chunk embeddings reused "
+                  f"({cache_stats['cache_hits'] / progress['chunks']:.0%} cache hit ratio)")
+        return progress["chunks"]
+    except Exception as e:
+        if progress["chunks"]:
+            try:
+                conn.rollback()
+                cursor.execute('DELETE FROM chunks WHERE document_id = %s', (document_id,))
+                conn.commit()
+            except Exception as cleanup_error:
+                print(f"[ERROR] Failed to remove partial chunks of document {document_id}: {cleanup_error}")
+        if job_id is not None:
+            try:
+                conn.rollback()
+                finish_ingestion_job(cursor, job_id, error=e)
+                conn.commit()
+            except Exception as job_error:
+                print(f"[ERROR] Failed to mark ingestion job {job_id} as failed: {job_error}")
+        raise
+    finally:
+        conn.close()
+
+def reingest_document_chunks(text_pages, maxChunkSize, document_id, numbered_pages=True, job_id=None):
+    """
+    Bring an edited document's chunks and stored text up to date with its new text.
+
+    The new text is diffed against the stored document_text (see
+    document_diff.plan_reingest): chunks in unchanged text keep their rows and
+    embeddings at shifted offsets, chunks touching edited text are deleted, and
+    only the text no kept chunk covers is split and embedded. Rows, text and
+    version change in one transaction, so searches see either the old or the new
+    version of the document, and a failure leaves the old version in place.
+
+    Moving chunks does not change the corpus fingerprint (chunk count and highest
+    id) that cached corpora are validated with, so if an edit only moves chunks,
+    one of them is re-inserted under a new id.
+
+    Returns:
+        int: Number of chunks embedded
+    """
+    new_text = "".join(text_pages)
+    page_offsets = None
+    if numbered_pages:
+        page_offsets = [0, *accumulate(len(page) for page in text_pages)][:len(text_pages)]
+
+    conn, cursor = get_db_connection()
+    try:
+        if job_id is not None:
+            start_ingestion_job(cursor, job_id)
+            conn.commit()
+
+        cursor.execute('SELECT document_text FROM documents WHERE id = %s', (document_id,))
+        old_text = cursor.fetchone()["document_text"]
+        cursor.execute('SELECT id, start_index, end_index, page_number FROM chunks WHERE document_id = %s',
+                       (document_id,))
+        plan = plan_reingest(cursor.fetchall(), old_text, new_text, _get_text_splitter(maxChunkSize), page_offsets)
+        moved = plan.moved
+
+        # Embed before changing any rows, so the old version stays searchable meanwhile
+        cache_stats = {"cache_hits": 0, "cache_misses": 0}
+        new_rows = []
+        for batch in batched(plan.added, INGEST_BATCH_SIZE):
+            chunk_texts = [new_text[start:end] for start, end, _ in batch]
+            embeddings = get_embeddings_batch(chunk_texts, batch_size=len(batch), stats=cache_stats)
+            for (start, end, page_number), chunk_text, embedding in zip(batch, chunk_texts, embeddings):
+                if len(embedding) != EMBEDDING_DIMENSIONS:
+                    raise RuntimeError(f"Chunk embedding dimension mismatch: expected {EMBEDDING_DIMENSIONS}, got {len(embedding)}")
+                new_rows.append((start, end, document_id, *_encode_chunk_embedding(embedding),
+                                 encode_term_counts(chunk_text), page_number))
+            if job_id is not None:
+                record_ingestion_progress(cursor, job_id, len(new_rows), 0)
+                conn.commit()
+
+        # The plan is only valid for the text it was made against
+        cursor.execute('SELECT content_hash FROM documents WHERE id = %s FOR UPDATE', (document_id,))
+        stored_hash = cursor.fetchone()["content_hash"]
+        if stored_hash is not None and stored_hash != _content_hash(old_text):
+            raise RuntimeError(f"Document {document_id} changed while it was being re-ingested")
+
+        for removed in batched(plan.removed, 500):
+            cursor.execute(f'DELETE FROM chunks WHERE id IN ({", ".join(["%s"] * len(removed))})', tuple(removed))
+        if moved:
+            cursor.executemany(
+                'UPDATE chunks SET start_index = %s, end_index = %s, page_number = %s WHERE id = %s',
+                [(start, end, page_number, chunk_id) for chunk_id, start, end, page_number, _ in moved]
+            )
+        if new_rows:
+            cursor.executemany(
+                'INSERT INTO chunks (start_index, end_index, document_id, embedding_vector, embedding_int8, embedding_binary, term_counts, page_number) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)',
+                new_rows
+            )
+        elif moved and not plan.removed:
+            chunk_id = moved[-1][0]
+            cursor.execute("""
+                INSERT INTO chunks (start_index, end_index, document_id, embedding_vector, embedding_int8, embedding_binary, term_counts, page_number)
+                SELECT start_index, end_index, document_id, embedding_vector, embedding_int8, embedding_binary, term_counts, page_number
+                FROM chunks WHERE id = %s
+            """, (chunk_id,))
+            cursor.execute('DELETE FROM chunks WHERE id = %s', (chunk_id,))
+
+        chunk_count = len(plan.kept) + len(new_rows)
+        cursor.execute(
+            'UPDATE documents SET document_text = %s, content_hash = %s, chunk_count = %s, version = version + 1 WHERE id = %s',
+            (new_text, _content_hash(new_text), chunk_count, document_id)
+        )
+        if job_id is not None:
+            record_ingestion_progress(cursor, job_id, len(new_rows), len(new_rows))
+            finish_ingestion_job(cursor, job_id)
+        conn.commit()
+
+        # The corpus' ANN index holds removed chunk ids; it is rebuilt on the next large search
+        ann_key = _document_corpus_key(cursor, document_id)
+        if ann_key is not None and (plan.removed or moved or new_rows):
+            ann_index_store.drop(ann_key)
+
+        print(f"Re-ingested document {document_id}: kept {len(plan.kept)} chunks ({len(moved)} moved), "
+              f"removed {len(plan.removed)}, embedded {len(new_rows)} "
+              f"({cache_stats['cache_hits']} from the embedding cache)")
+        return len(new_rows)
+    except Exception as e:
+        conn.rollback()
+        if job_id is not None:
+            try:
+                finish_ingestion_job(cursor, job_id, error=e)
+                conn.commit()
+            except Exception as job_error:
+                print(f"[ERROR] Failed to mark ingestion job {job_id} as failed: {job_error}")
+        raise
+    finally:
+        conn.close()
 
 def fast_pdf_ingestion(text_pages, maxChunkSize, document_id):
     """
     Fast PDF ingestion using RecursiveCharacterTextSplitter for semantic chunking and optimized batch embedding generation.
-    This is the fastest way to process PDFs for embedding while preserving semantic boundaries.
+    Pages are split, embedded and inserted as a pipeline (see ingest_document_chunks).
     
     Args:
         text_pages (list): List of page texts from PDF
@@ -1004,319 +1432,822 @@ def fast_pdf_ingestion(text_pages, maxChunkSize, document_id):
         int: Number of chunks processed
     """
     print(f"Starting fast semantic PDF ingestion for document {document_id}")
-    
-    # Prepare all chunks using semantic chunking
-    chunk_texts, chunk_metadata = prepare_chunks_for_embedding(text_pages, maxChunkSize)
-    print(f"Prepared {len(chunk_texts)} semantic chunks for processing")
-    
-    # Generate all embeddings in optimized batches
-    print("Generating embeddings in optimized batches...")
-    embeddings = get_embeddings_batch(chunk_texts, batch_size=64)  # Larger batch for speed
-    
-    # Validate all embeddings
-    for i, embedding in enumerate(embeddings):
-        if len(embedding) != EMBEDDING_DIMENSIONS:
-            raise RuntimeError(f"Chunk {i} embedding dimension mismatch: expected {EMBEDDING_DIMENSIONS}, got {len(embedding)}")
-    
-    # Batch insert to database
-    conn, cursor = get_db_connection()
-    try:
-        chunk_data = []
-        for metadata, embedding in zip(chunk_metadata, embeddings):
-            embedding_array = np.array(embedding)
-            blob = embedding_array.tobytes()
-            
-            chunk_data.append((
-                metadata["global_start"],
-                metadata["global_end"], 
-                document_id,
-                blob,
-                metadata["page_number"]
-            ))
 
-        # Single batch insert for maximum speed
-        cursor.executemany(
-            'INSERT INTO chunks (start_index, end_index, document_id, embedding_vector, page_number) VALUES (%s,%s,%s,%s,%s)',
-            chunk_data
-        )
-        conn.commit()
-        
-        print(f"Fast semantic PDF ingestion completed: {len(chunk_data)} chunks processed")
-        return len(chunk_data)
-        
+    try:
+        chunk_count = ingest_document_chunks(text_pages, maxChunkSize, document_id)
+        print(f"Fast semantic PDF ingestion completed: {chunk_count} chunks processed")
+        return chunk_count
     except Exception as e:
         print(f"[ERROR] Fast semantic PDF ingestion failed: {e}")
         raise RuntimeError(f"Fast semantic PDF ingestion failed: {str(e)}")
-    finally:
-        conn.close()
 
 
 @ray.remote
-def chunk_document_optimized(text, maxChunkSize, document_id):
+def chunk_document_optimized(text, maxChunkSize, document_id, job_id=None):
     """
     Chunk documents into smaller pieces with RecursiveCharacterTextSplitter and use optimized batch embedding creation.
+    A list of page texts or a ParsedDocument is ingested with page numbers.
     """
+    try:
+        if isinstance(text, ParsedDocument):
+            text = text.pages
+        if isinstance(text, (list, tuple)):
+            chunk_count = ingest_document_chunks(text, maxChunkSize, document_id, job_id=job_id)
+        else:
+            chunk_count = ingest_document_chunks([text], maxChunkSize, document_id, numbered_pages=False, job_id=job_id)
+        print(f"Successfully processed {chunk_count} semantic chunks with batch embeddings")
+        return chunk_count
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"[FATAL ERROR] Exception during optimized semantic chunking: {e}")
+        _fail_job_of_task(job_id, e)
+        raise RuntimeError("Optimized semantic chunking failed due to internal error")
 
-    conn, cursor = get_db_connection()
 
-    chunk_texts = []
-    chunk_metadata = []
-    
+def _document_corpus_key(cursor, document_id):
+    # Corpus key of the chat or workflow a document belongs to, or None
+    cursor.execute('SELECT chat_id, workflow_id FROM documents WHERE id = %s', (document_id,))
+    document = cursor.fetchone()
+    if not document:
+        return None
+    if document["workflow_id"] is not None:
+        return workflow_corpus_key(document["workflow_id"])
+    if document["chat_id"] is not None:
+        return chat_corpus_key(document["chat_id"])
+    return None
+
+def _add_chunks_to_ann_index(cursor, key, document_id, embeddings, after_chunk_id=0):
+    """
+    Append a document's freshly inserted chunks (those with an id above
+    after_chunk_id) to its corpus' on-disk ANN index, if one exists.
+    Corpora without an index get one built lazily on their first large search.
+
+    Returns:
+        int: The highest chunk id covered, to pass as after_chunk_id next time
+    """
     try:
-        # Get the global text splitter instance for semantic-aware chunking  
-        text_splitter = _get_text_splitter(maxChunkSize)
-        
-        # Split text into semantic chunks
-        chunks = text_splitter.split_text(text)
-        print(f"RecursiveCharacterTextSplitter created {len(chunks)} semantic chunks")
-        
-        # Finding each chunk's positions in original text
-        current_pos = 0
-        for chunk in chunks:
-            # Find chunk in the original text starting from current position
-            chunk_start = text.find(chunk, current_pos)
-            if chunk_start == -1:
-                chunk_start = text.find(chunk)
-            
-            chunk_end = chunk_start + len(chunk)
-            
-            chunk_texts.append(chunk)
-            chunk_metadata.append({
-                "start_index": chunk_start,
-                "end_index": chunk_end
-            })
-            
-            # Update current position for next search
-            current_pos = chunk_start + 1
+        cursor.execute('SELECT id FROM chunks WHERE document_id = %s AND id > %s ORDER BY id',
+                       (document_id, after_chunk_id))
+        chunk_ids = [row["id"] for row in cursor.fetchall()][:len(embeddings)]
+        if len(chunk_ids) != len(embeddings):
+            return after_chunk_id
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        added = ann_index_store.add_chunks(key, chunk_ids, vectors / norms)
+        if added:
+            print(f"Added {added} chunks to ANN index for {key}")
+        return chunk_ids[-1]
+    except Exception as e:
+        # The index catches up on its next search, so this must not fail ingestion
+        print(f"[WARNING] Failed to update ANN index for document {document_id}: {e}")
+        return after_chunk_id
 
-        # Generate embeddings for all chunks in batches
-        print(f"Generating embeddings for {len(chunk_texts)} semantic chunks in batches...")
-        embeddings = get_embeddings_batch(chunk_texts, batch_size=32)
-        
-        # Make sure dimensions match
-        for i, embedding in enumerate(embeddings):
-            if len(embedding) != EMBEDDING_DIMENSIONS:
-                raise RuntimeError(f"Chunk {i} embedding dimension mismatch: expected {EMBEDDING_DIMENSIONS}, got {len(embedding)}")
-        
-        # Insert all of the chunks into database
-        chunk_data = []
-        for i, (metadata, embedding) in enumerate(zip(chunk_metadata, embeddings)):
-            embedding_array = np.array(embedding)
-            blob = embedding_array.tobytes()
-            
-            chunk_data.append((
-                metadata["start_index"],
-                metadata["end_index"], 
-                document_id,
-                blob
-            ))
 
-        # Batch insert into database
-        cursor.executemany(
-            'INSERT INTO chunks (start_index, end_index, document_id, embedding_vector) VALUES (%s,%s,%s,%s)',
-            chunk_data
-        )
+def migrate_legacy_embeddings(batch_size=None, pause_seconds=None):
+    """
+    Rewrite legacy float64 embedding BLOBs in the versioned float32 format,
+    then backfill the int8/binary codes of chunks written before they existed.
 
-        print(f"Successfully processed {len(chunk_data)} semantic chunks with batch embeddings")
-        conn.commit()
-        
+    Walks chunks and chat_share_chunks in primary key order, converting
+    batch_size rows per transaction so the migration can run next to live
+    traffic. Reads keep working throughout because decode_embedding accepts
+    both formats and quantized corpora fall back to the full vector.
+
+    Args:
+        batch_size (int, optional): Rows per batch. Defaults to EMBEDDING_MIGRATION_BATCH_SIZE.
+        pause_seconds (float, optional): Sleep between batches. Defaults to EMBEDDING_MIGRATION_PAUSE_SECONDS.
+
+    Returns:
+        int: Number of rows rewritten
+    """
+    batch_size = batch_size or EMBEDDING_MIGRATION_BATCH_SIZE
+    pause_seconds = EMBEDDING_MIGRATION_PAUSE_SECONDS if pause_seconds is None else pause_seconds
+    legacy_length = EMBEDDING_DIMENSIONS * np.dtype(np.float64).itemsize
+
+    conn, cursor = get_db_connection()
+    migrated = 0
+    try:
+        for table in ("chunks", "chat_share_chunks"):
+            last_id = 0
+            while True:
+                cursor.execute(
+                    f"SELECT id, embedding_vector FROM {table} WHERE id > %s AND LENGTH(embedding_vector) = %s ORDER BY id LIMIT %s",
+                    (last_id, legacy_length, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                updates = []
+                for row in rows:
+                    embedding = decode_embedding(row["embedding_vector"])
+                    if embedding is not None:
+                        updates.append((encode_embedding(embedding), row["id"]))
+
+                if updates:
+                    cursor.executemany(f"UPDATE {table} SET embedding_vector = %s WHERE id = %s", updates)
+                    conn.commit()
+
+                migrated += len(updates)
+                last_id = rows[-1]["id"]
+                print(f"Migrated {migrated} legacy embeddings to float32 (up to {table}.id={last_id})")
+
+                if pause_seconds:
+                    time.sleep(pause_seconds)
+
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT id, embedding_vector FROM chunks WHERE id > %s AND (embedding_int8 IS NULL OR embedding_binary IS NULL) ORDER BY id LIMIT %s",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for row in rows:
+                embedding = decode_embedding(row["embedding_vector"])
+                if embedding is not None:
+                    updates.append((*_encode_chunk_embedding(embedding)[1:], row["id"]))
+
+            if updates:
+                cursor.executemany("UPDATE chunks SET embedding_int8 = %s, embedding_binary = %s WHERE id = %s", updates)
+                conn.commit()
+
+            migrated += len(updates)
+            last_id = rows[-1]["id"]
+            print(f"Backfilled quantized embedding codes up to chunks.id={last_id}")
+
+            if pause_seconds:
+                time.sleep(pause_seconds)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"[FATAL ERROR] Exception during optimized semantic chunking: {e}")
-        raise RuntimeError("Optimized semantic chunking failed due to internal error")
+        print(f"[ERROR] Legacy embedding migration failed: {e}")
+        raise RuntimeError(f"Legacy embedding migration failed: {str(e)}")
     finally:
         conn.close()
 
+    print(f"Legacy embedding migration completed: {migrated} rows rewritten")
+    return migrated
 
-def knn(x, y):
+def start_embedding_migration():
+    """
+    Run migrate_legacy_embeddings on a daemon thread so it does not block startup.
     """
-    Calculate k-nearest neighbors using cosine similarity.
+    def _run():
+        try:
+            migrate_legacy_embeddings()
+        except Exception as e:
+            print(f"[WARNING] Background embedding migration stopped: {e}")
+
+    thread = threading.Thread(target=_run, name="embedding-migration", daemon=True)
+    thread.start()
+    return thread
+
+
+def knn(x, y, k=None, normalized=False):
+    """
+    Find the k nearest document vectors for one or more queries by cosine similarity.
+
+    Only the top k are selected (argpartition) and sorted, so the cost is
+    O(N + k log k) per query instead of a full O(N log N) argsort.
     
     Args:
-        x (np.array): Query vector (1D)
-        y (np.array): Document vectors (2D: N x dimensions)
+        x (np.array): Query vector (1D) or batch of query vectors (2D: Q x dimensions)
+        y (np.array or QuantizedMatrix): Document vectors (2D: N x dimensions), or their
+            int8/binary codes for an approximate first pass
+        k (int, optional): Number of neighbours to return. Defaults to all N.
+        normalized (bool): Skip re-normalization when x and y are already unit-length
     
     Returns:
-        list: Results sorted by similarity (best first)
+        tuple: (indices, scores) arrays sorted by similarity (best first).
+            Shape (k,) for a 1D query and (Q, k) for a batch of queries.
     """
-    # Ensure x is 2D: (1, dimensions)
-    if x.ndim == 1:
-        x = np.expand_dims(x, axis=0)
-    
-    # Ensure y is 2D: (N, dimensions)
-    if y.ndim == 1:
-        y = np.expand_dims(y, axis=0)
+    single_query = x.ndim == 1
+
+    # Ensure x is 2D: (Q, dimensions) and y is 2D: (N, dimensions)
+    x = np.atleast_2d(x)
+    if not isinstance(y, QuantizedMatrix):
+        y = np.atleast_2d(y)
     
     # Validate dimensions match
     if x.shape[1] != y.shape[1]:
         raise ValueError(f"Dimension mismatch: query has {x.shape[1]} dims, documents have {y.shape[1]} dims")
-    
-    # Calculate cosine similarity with safety checks
-    x_norm = np.linalg.norm(x, axis=1, keepdims=True)
-    y_norm = np.linalg.norm(y, axis=1, keepdims=True)
-    
-    # Avoid division by zero
-    x_norm = np.where(x_norm == 0, 1e-8, x_norm)
-    y_norm = np.where(y_norm == 0, 1e-8, y_norm)
-    
-    # Normalize vectors
-    x_normalized = x / x_norm
-    y_normalized = y / y_norm
-    
-    # Calculate similarities
-    similarities = np.dot(x_normalized, y_normalized.T).flatten()
-    
-    # Convert similarities to distances (lower is better)
-    distances = 1 - similarities
-    
-    # Sort by similarity (best first)
-    nearest_neighbors = np.argsort(distances)
 
-    results = []
-    for i in range(len(nearest_neighbors)):
-        item = {
-            "index": nearest_neighbors[i],
-            "similarity_score": distances[nearest_neighbors[i]]
-        }
-        results.append(item)
+    if isinstance(y, QuantizedMatrix):
+        # Codes are of unit-length vectors; only the query may need normalizing
+        if not normalized:
+            x_norm = np.linalg.norm(x, axis=1, keepdims=True)
+            x = x / np.where(x_norm == 0, 1e-8, x_norm)
+        similarities = y.similarities(x)
+    else:
+        # Score in the document matrix precision (float32 for cached corpora)
+        x = x.astype(y.dtype, copy=False)
+
+        if not normalized:
+            # Avoid division by zero
+            x_norm = np.linalg.norm(x, axis=1, keepdims=True)
+            y_norm = np.linalg.norm(y, axis=1, keepdims=True)
+            x = x / np.where(x_norm == 0, 1e-8, x_norm)
+            y = y / np.where(y_norm == 0, 1e-8, y_norm)
+
+        # Calculate similarities: (Q, N)
+        similarities = x @ y.T
+    num_docs = similarities.shape[1]
+    k = num_docs if k is None else max(0, min(int(k), num_docs))
+
+    if k == 0:
+        empty_indices = np.empty((x.shape[0], 0), dtype=np.int64)
+        empty_scores = np.empty((x.shape[0], 0), dtype=similarities.dtype)
+        return (empty_indices[0], empty_scores[0]) if single_query else (empty_indices, empty_scores)
+
+    # Select the top k without sorting the rest, then sort just those k
+    if k < num_docs:
+        candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(num_docs), (similarities.shape[0], 1))
+    candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    if single_query:
+        return indices[0], scores[0]
+    return indices, scores
+
+
+_CHAT_FINGERPRINT_QUERY = """
+SELECT COUNT(c.id) AS chunk_count, MAX(c.id) AS max_chunk_id
+FROM chunks c
+JOIN documents d ON c.document_id = d.id
+JOIN chats ch ON d.chat_id = ch.id
+JOIN users u ON ch.user_id = u.id
+WHERE u.email = %s AND ch.id = %s
+"""
+
+_CHAT_CHUNKS_QUERY = """
+SELECT c.id, c.start_index, c.end_index, {embedding_columns}, c.document_id, c.page_number, d.document_name,
+    d.created AS document_created
+FROM chunks c
+JOIN documents d ON c.document_id = d.id
+JOIN chats ch ON d.chat_id = ch.id
+JOIN users u ON ch.user_id = u.id
+WHERE u.email = %s AND ch.id = %s
+ORDER BY c.id
+"""
+
+_WORKFLOW_FINGERPRINT_QUERY = """
+SELECT COUNT(c.id) AS chunk_count, MAX(c.id) AS max_chunk_id
+FROM chunks c
+JOIN documents d ON c.document_id = d.id
+JOIN workflows w ON d.workflow_id = w.id
+JOIN users u ON w.user_id = u.id
+WHERE u.email = %s AND w.id = %s
+"""
+
+_WORKFLOW_CHUNKS_QUERY = """
+SELECT c.id, c.start_index, c.end_index, {embedding_columns}, c.document_id, c.page_number, d.document_name,
+    d.created AS document_created
+FROM chunks c
+JOIN documents d ON c.document_id = d.id
+JOIN workflows w ON d.workflow_id = w.id
+JOIN users u ON w.user_id = u.id
+WHERE u.email = %s AND w.id = %s
+ORDER BY c.id
+"""
+
+# Chunks written before term_counts existed are tokenized from their span of the document text
+_TERM_COUNT_COLUMNS = """c.id, c.term_counts,
+CASE WHEN c.term_counts IS NULL
+    THEN SUBSTRING(d.document_text, GREATEST(c.start_index, 0) + 1, c.end_index - GREATEST(c.start_index, 0))
+END AS chunk_text"""
+
+_CHAT_TERMS_QUERY = f"""
+SELECT {_TERM_COUNT_COLUMNS}
+FROM chunks c
+JOIN documents d ON c.document_id = d.id
+JOIN chats ch ON d.chat_id = ch.id
+JOIN users u ON ch.user_id = u.id
+WHERE u.email = %s AND ch.id = %s AND c.id > %s
+ORDER BY c.id
+"""
+
+_WORKFLOW_TERMS_QUERY = f"""
+SELECT {_TERM_COUNT_COLUMNS}
+FROM chunks c
+JOIN documents d ON c.document_id = d.id
+JOIN workflows w ON d.workflow_id = w.id
+JOIN users u ON w.user_id = u.id
+WHERE u.email = %s AND w.id = %s AND c.id > %s
+ORDER BY c.id
+"""
+
+def _embedding_columns(quantization):
+    # Quantized corpora read the compact code and only fall back to the full vector for rows without one
+    if quantization not in QUANTIZATION_KINDS:
+        return "c.embedding_vector"
+    column = f"c.embedding_{quantization}"
+    return f"{column} AS embedding_code, CASE WHEN {column} IS NULL THEN c.embedding_vector END AS embedding_vector"
+
+def _corpus_fingerprint(cursor, fingerprint_query, params):
+    """
+    (chunk count, max chunk id) of a chat or workflow, or None if it has no chunks.
 
-    return results
+    The fingerprint changes on every chunk insert or delete, so it doubles as the
+    corpus version. The query also enforces ownership, so a user who does not own
+    the corpus gets None.
+    """
+    cursor.execute(fingerprint_query, params)
+    row = cursor.fetchone()
+    if not row or not row["chunk_count"]:
+        return None
+    return (row["chunk_count"], row["max_chunk_id"])
 
-def get_relevant_chunks(k: int, question: str, chat_id: int, user_email: str):
-    conn, cursor = get_db_connection()
+def _load_corpus(cursor, key, fingerprint_query, chunks_query, params, fingerprint=None):
+    """
+    Return the cached CorpusMatrix for a chat or workflow, reloading it from the
+    database when the corpus fingerprint (chunk count, max chunk id) has changed.
 
-    #Fetch all document chunks with their embeddings for the given user and chat
-    query = """
-    SELECT c.start_index, c.end_index, c.embedding_vector, c.document_id, d.document_name, d.document_text
-    FROM chunks c
-    JOIN documents d ON c.document_id = d.id
-    JOIN chats ch ON d.chat_id = ch.id
-    JOIN users u ON ch.user_id = u.id
-    WHERE u.email = %s AND ch.id = %s
-    """
-    cursor.execute(query, (user_email, chat_id))
+    Pass `fingerprint` if it was already read with _corpus_fingerprint.
+    """
+    if fingerprint is None:
+        fingerprint = _corpus_fingerprint(cursor, fingerprint_query, params)
+    if fingerprint is None:
+        return None
+
+    corpus = corpus_cache.get(key, fingerprint)
+    if corpus is not None:
+        return corpus
+
+    cursor.execute(chunks_query.format(embedding_columns=_embedding_columns(EMBEDDING_QUANTIZATION)), params)
     rows = cursor.fetchall()
+    corpus = build_corpus_matrix(rows, fingerprint, EMBEDDING_DIMENSIONS, decode_embedding,
+                                 quantization=EMBEDDING_QUANTIZATION)
+    corpus_cache.put(key, corpus)
+    return corpus
 
-    #Prepare chunk embeddings and metadata
-    chunk_embeddings = []
-    chunk_metadata = []
-    for row in rows:
-        embedding_blob = row["embedding_vector"]
-        embedding = np.frombuffer(embedding_blob)
+def _resolve_chunk_texts(cursor, corpus, indices):
+    """
+    Map corpus row indices to (chunk_text, document_name) tuples.
 
-        if len(embedding) != EMBEDDING_DIMENSIONS:
-            print(f"[WARNING] Skipping chunk with bad dimensions: {len(embedding)}")
-            continue
+    Only the selected spans are read, via SUBSTRING on the server, so the
+    transfer is O(k x chunk size) instead of whole documents.
+    """
+    return _resolve_chunk_texts_batch(cursor, corpus, [indices])[0]
 
-        chunk_embeddings.append(embedding)
-        chunk_metadata.append({
-            "start": row["start_index"],
-            "end": row["end_index"],
-            "document_id": row["document_id"],
-            "document_name": row["document_name"],
-            "document_text": row["document_text"]
-        })
+def _resolve_chunk_texts_batch(cursor, corpus, indices_per_query):
+    """
+    _resolve_chunk_texts for several result lists, with one query for all of them.
+    """
+    chunk_ids = sorted({int(corpus.chunk_ids[idx]) for indices in indices_per_query for idx in indices})
+    if not chunk_ids:
+        return [[] for _ in indices_per_query]
+
+    placeholders = ", ".join(["%s"] * len(chunk_ids))
+    cursor.execute(f"""
+        SELECT c.id, SUBSTRING(d.document_text, GREATEST(c.start_index, 0) + 1, c.end_index - GREATEST(c.start_index, 0)) AS chunk_text
+        FROM chunks c
+        JOIN documents d ON c.document_id = d.id
+        WHERE c.id IN ({placeholders})
+    """, chunk_ids)
+    chunk_texts = {row["id"]: row["chunk_text"] or "" for row in cursor.fetchall()}
 
-    #Return early if no valid embeddings found
-    if not chunk_embeddings:
-        return []
+    results = []
+    for indices in indices_per_query:
+        source_chunks = []
+        for idx in indices:
+            document_name = corpus.document_names[int(corpus.document_ids[idx])]
+            source_chunks.append((chunk_texts.get(int(corpus.chunk_ids[idx]), ""), document_name))
+        results.append(source_chunks)
+    return results
+
+def _rerank_quantized(cursor, corpus, query_embedding, k, rows=None):
+    """
+    Scan a quantized corpus' codes, then rescore the best QUANTIZED_RERANK_CANDIDATES
+    rows with their full-precision vectors read from the chunks table.
+
+    With `rows`, only the codes of those corpus rows are scanned.
+    """
+    codes = corpus.codes if rows is None else corpus.codes.subset(rows)
+    candidates, _ = knn(query_embedding, codes, k=max(k, QUANTIZED_RERANK_CANDIDATES), normalized=True)
+    if rows is not None:
+        candidates = rows[candidates]
+    if len(candidates) == 0:
+        return candidates
+
+    chunk_ids = [int(corpus.chunk_ids[idx]) for idx in candidates]
+    placeholders = ", ".join(["%s"] * len(chunk_ids))
+    cursor.execute(f"SELECT id, embedding_vector FROM chunks WHERE id IN ({placeholders})", chunk_ids)
+    vectors_by_id = {row["id"]: decode_embedding(row["embedding_vector"]) for row in cursor.fetchall()}
+
+    rows = []
+    vectors = []
+    for idx, chunk_id in zip(candidates, chunk_ids):
+        vector = vectors_by_id.get(chunk_id)
+        if vector is not None and len(vector) == EMBEDDING_DIMENSIONS:
+            rows.append(idx)
+            vectors.append(vector)
+    if not rows:
+        return candidates[:k]
+
+    top, _ = knn(query_embedding, np.asarray(vectors, dtype=np.float32), k=k)
+    return np.asarray(rows)[top]
+
+def _search_corpus(cursor, key, corpus, query_embedding, k, rows=None):
+    """
+    Top-k row indices of a corpus for one query vector.
+
+    Quantized corpora are scanned by code and reranked exactly. Otherwise large
+    corpora (ANN_MIN_CHUNKS and up) go through the IVF-flat index, and
+    everything else, or any case the index cannot serve, uses exact search.
+
+    With `rows` (a metadata filter's matching rows), only those rows are
+    scored, exactly.
+    """
+    if corpus.codes is not None:
+        return _rerank_quantized(cursor, corpus, query_embedding, k, rows)
+    if rows is not None:
+        indices, _ = knn(query_embedding, corpus.matrix[rows], k=k, normalized=True)
+        return rows[indices]
+    approximate = ann_index_store.search(key, corpus, query_embedding, k)
+    if approximate is not None:
+        return approximate[0]
+    indices, _ = knn(query_embedding, corpus.matrix, k=k, normalized=True)
+    return indices
+
+def _hybrid_search(cursor, key, corpus, question, query_embedding, k, terms_query, params, rows=None):
+    """
+    Top-k row indices from dense and BM25 rankings fused by reciprocal rank.
+
+    The corpus' lexical index is brought up to date incrementally, reading
+    term counts only for chunks added since it was last used. `rows`
+    restricts both rankings to a metadata filter's matching rows.
+    """
+    if not HYBRID_RETRIEVAL:
+        return _search_corpus(cursor, key, corpus, query_embedding, k, rows)
+
+    dense_rows = _search_corpus(cursor, key, corpus, query_embedding, max(k, HYBRID_CANDIDATES), rows)
+    return _fuse_with_lexical(cursor, key, corpus, question, dense_rows, k, terms_query, params, rows)
+
+def _fuse_with_lexical(cursor, key, corpus, question, dense_rows, k, terms_query, params, rows=None):
+    """
+    Fuse a dense ranking of corpus rows with the corpus' BM25 ranking for the question.
+    """
+    candidates = max(k, HYBRID_CANDIDATES)
+
+    def load_rows_after(last_chunk_id):
+        cursor.execute(terms_query, (*params, last_chunk_id))
+        return [
+            (row["id"], decode_term_counts(row["term_counts"]) if row["term_counts"] is not None
+             else term_counts(row["chunk_text"]))
+            for row in cursor.fetchall()
+        ]
 
-    #Get embedding for the query
     try:
-        query_embedding = np.array(get_embedding(question))
-        if len(query_embedding) != EMBEDDING_DIMENSIONS:
-            raise ValueError(f"Query embedding has wrong dimensions: {len(query_embedding)}")
+        lexical_index = lexical_index_store.refresh(key, corpus.fingerprint, load_rows_after)
+        lexical_ids, _ = lexical_index.search(question, candidates,
+                                              corpus.chunk_ids[rows] if rows is not None else None)
     except Exception as e:
-        print(f"[ERROR] Failed to generate query embedding: {e}")
-        return []
+        print(f"[WARNING] Lexical retrieval failed, using dense results only: {e}")
+        return dense_rows[:k]
+
+    # Map chunk ids to corpus rows, dropping chunks the corpus skipped
+    lexical_rows = np.searchsorted(corpus.chunk_ids, lexical_ids)
+    in_corpus = lexical_rows < len(corpus)
+    in_corpus[in_corpus] = corpus.chunk_ids[lexical_rows[in_corpus]] == lexical_ids[in_corpus]
+    lexical_rows = lexical_rows[in_corpus]
+
+    fused = reciprocal_rank_fusion([dense_rows.tolist(), lexical_rows.tolist()], k)
+    return np.asarray(fused, dtype=np.int64)
+
+# Settings that change retrieval results, part of every retrieval result cache key
+_RETRIEVAL_VARIANT = (f"{EMBEDDING_MODEL}|hybrid={HYBRID_RETRIEVAL}|quantization={EMBEDDING_QUANTIZATION}"
+                      f"|ann={ANN_ENABLED}")
+
+def _retrieval_variant(rerank, mmr, retrieval_filter=None):
+    variant = _RETRIEVAL_VARIANT
+    if rerank:
+        variant += f"|rerank={RERANK_MODEL}"
+    if mmr:
+        variant += f"|mmr={MMR_LAMBDA}"
+    if retrieval_filter is not None:
+        variant += f"|filter={retrieval_filter.cache_key()}"
+    return variant
+
+def _filter_rows(corpus, retrieval_filter):
+    """
+    Corpus rows matching a RetrievalFilter, or None to search the whole corpus.
+    """
+    if retrieval_filter is None:
+        return None
+    return np.flatnonzero(retrieval_filter.mask(corpus))
 
-    #Compute similarity and get top-k indices
-    results = knn(query_embedding, np.array(chunk_embeddings))
-    top_k = min(k, len(results))
+def _diversify(corpus, query_embedding, rows, k):
+    """
+    Pick k of the candidate corpus rows by maximal marginal relevance.
 
-    #Prepare result chunks
-    source_chunks = []
-    for i in range(top_k):
-        idx = results[i]['index']
-        meta = chunk_metadata[idx]
-        chunk_text = meta["document_text"][meta["start"]:meta["end"]]
-        document_name = meta["document_name"]
-        source_chunks.append((chunk_text, document_name))
+    Quantized corpora compare candidates by their dequantized codes.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) <= k:
+        return rows
+    vectors = corpus.matrix[rows] if corpus.matrix is not None else corpus.codes.vectors(rows)
+    return rows[maximal_marginal_relevance(query_embedding, vectors, k)]
+
+_CORPUS_QUERIES = {
+    "chat": (_CHAT_FINGERPRINT_QUERY, _CHAT_CHUNKS_QUERY, _CHAT_TERMS_QUERY),
+    "workflow": (_WORKFLOW_FINGERPRINT_QUERY, _WORKFLOW_CHUNKS_QUERY, _WORKFLOW_TERMS_QUERY),
+}
+
+def _search_corpus_batch(cursor, key, corpus, query_embeddings, k):
+    """
+    _search_corpus for a (Q x dimensions) batch of queries. Exact search over a
+    full-precision corpus is a single matrix product for all queries.
+    """
+    if corpus.codes is None and not ann_index_store.applies_to(corpus):
+        indices, _ = knn(query_embeddings, corpus.matrix, k=k, normalized=True)
+        return list(indices)
+    return [_search_corpus(cursor, key, corpus, query_embedding, k) for query_embedding in query_embeddings]
+
+def get_relevant_chunks_batch(k, questions, corpus, user_email):
+    """
+    Retrieve the top-k chunks for several questions against one chat or workflow.
+
+    All questions are embedded in one model call, the corpus matrix is loaded
+    once, and (for exact search) scored with a single matrix product.
+
+    Args:
+        k (int): Chunks per question
+        questions (list): Question strings
+        corpus (tuple): Corpus key from chat_corpus_key or workflow_corpus_key
+        user_email (str): Owner of the chat or workflow
 
-    return source_chunks
+    Returns:
+        list: One list of (chunk_text, document_name) tuples per question, in order.
+            Lists are empty if the corpus has no chunks or embedding fails.
+    """
+    if not questions:
+        return []
 
+    kind, corpus_id = corpus
+    fingerprint_query, chunks_query, terms_query = _CORPUS_QUERIES[kind]
+    params = (user_email, corpus_id)
 
-def get_relevant_chunks_wf(k, question, workflow_id, user_email):
     conn, cursor = get_db_connection()
+    try:
+        fingerprint = _corpus_fingerprint(cursor, fingerprint_query, params)
+        if fingerprint is None:
+            return [[] for _ in questions]
 
-    query = """
-    SELECT c.start_index, c.end_index, c.embedding_vector, c.document_id, c.page_number, d.document_name
-    FROM chunks c
-    JOIN documents d ON c.document_id = d.id
-    JOIN workflows w ON d.workflow_id = w.id
-    JOIN users u ON w.user_id = u.id
-    WHERE u.email = %s AND w.id = %s
+        results = [retrieval_result_cache.get(corpus, fingerprint, question, k, _RETRIEVAL_VARIANT)
+                   for question in questions]
+        pending = [i for i, sources in enumerate(results) if sources is None]
+        if not pending:
+            return results
+
+        corpus_matrix = _load_corpus(cursor, corpus, fingerprint_query, chunks_query, params, fingerprint)
+        if corpus_matrix is None:
+            return [[] for _ in questions]
+
+        pending_questions = [questions[i] for i in pending]
+        try:
+            query_embeddings = np.asarray(get_query_embeddings(pending_questions), dtype=np.float32)
+        except Exception as e:
+            print(f"[ERROR] Failed to generate batch query embeddings: {e}")
+            return [sources or [] for sources in results]
+
+        dense_k = max(k, HYBRID_CANDIDATES) if HYBRID_RETRIEVAL else k
+        dense_rows = _search_corpus_batch(cursor, corpus, corpus_matrix, query_embeddings, dense_k)
+        if HYBRID_RETRIEVAL:
+            indices_per_question = [
+                _fuse_with_lexical(cursor, corpus, corpus_matrix, question, rows, k, terms_query, params)
+                for question, rows in zip(pending_questions, dense_rows)
+            ]
+        else:
+            indices_per_question = dense_rows
+
+        resolved = _resolve_chunk_texts_batch(cursor, corpus_matrix, indices_per_question)
+        for i, question, sources in zip(pending, pending_questions, resolved):
+            retrieval_result_cache.put(corpus, fingerprint, question, k, sources, _RETRIEVAL_VARIANT)
+            results[i] = sources
+        return results
+    finally:
+        conn.close()
+
+def get_retrieval_cache_stats():
+    """
+    Hit/miss counters of the per-process retrieval caches.
     """
+    return {
+        "corpus_cache": corpus_cache.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "retrieval_result_cache": retrieval_result_cache.stats(),
+        "semantic_answer_cache": semantic_answer_cache.stats(),
+    }
+
+_CHAT_DOCUMENTS_QUERY = """
+SELECT d.content_hash, d.document_name, d.chunk_count
+FROM documents d
+JOIN chats ch ON d.chat_id = ch.id
+JOIN users u ON ch.user_id = u.id
+WHERE u.email = %s AND ch.id = %s
+"""
+
+def lookup_cached_answer(question, chat_id, user_email, model_type, model_key=None):
+    """
+    Look up the answer to a semantically equivalent question already asked with
+    the same model, about the same documents and after the same chat history.
 
-    cursor.execute(query, (user_email, workflow_id))
-    rows = cursor.fetchall()
+    The cache is keyed by document content rather than by chat, so a question
+    asked in any of the user's chats with the same documents can be answered.
+    Follow-ups are keyed by the history before them, so "can you elaborate?"
+    only matches the same turn of an identical conversation.
 
-    embeddings = []
-    for row in rows:
-        embeddingVectorBlob = row["embedding_vector"]
-        embeddingVector = np.frombuffer(embeddingVectorBlob)
-        
-        # Basic validation - should match our configured embedding dimensions
-        if len(embeddingVector) != EMBEDDING_DIMENSIONS:
-            print(f"[WARNING] Found workflow embedding with unexpected dimension: {len(embeddingVector)}, expected {EMBEDDING_DIMENSIONS}")
-            
-        embeddings.append(embeddingVector)
+    Returns:
+        tuple: (hit, cache key). `hit` is a dict with answer, sources, question
+            and similarity, or None; pass the key to store_cached_answer once
+            the question has been answered.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
 
-    if (len(embeddings) == 0):
-        res_list = []
-        for i in range(k):
-            res_list.append("No text found")
-        return res_list
+    try:
+        conn, cursor = get_db_connection()
+        try:
+            cursor.execute(_CHAT_DOCUMENTS_QUERY, (user_email, chat_id))
+            documents = cursor.fetchall()
+            # Documents still being ingested (no chunk_count yet) or never hashed are not cacheable
+            if not documents or any(row["chunk_count"] is None or row["content_hash"] is None for row in documents):
+                return None, None
+            cursor.execute('SELECT sent_from_user, message_text FROM messages WHERE chat_id = %s ORDER BY id',
+                           (chat_id,))
+            history = [(row["sent_from_user"], row["message_text"]) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        content_key = answer_content_key(
+            user_email, [(row["content_hash"], row["document_name"]) for row in documents], history
+        )
+        query_embedding = np.asarray(get_embedding(question), dtype=np.float32)
+        hit = semantic_answer_cache.lookup(content_key, (EMBEDDING_MODEL, model_type, model_key), query_embedding)
+        return hit, content_key
+    except Exception as e:
+        print(f"[WARNING] Semantic answer cache lookup failed: {e}")
+        return None, None
 
-    embeddings = np.array(embeddings)
+def store_cached_answer(question, content_key, model_type, model_key, answer, sources):
+    """
+    Cache an answer for lookup_cached_answer under the key the lookup returned.
+    Only answers grounded in retrieved sources are cached.
+    """
+    if content_key is None or not answer or not sources or sources == ["No text found"]:
+        return
 
     try:
-        embeddingVector = get_embedding(question) 
-        embeddingVector = np.array(embeddingVector)
-        
-        # Validate query embedding dimensions
-        if len(embeddingVector) != EMBEDDING_DIMENSIONS:
-            raise ValueError(f"Workflow query embedding dimension mismatch: expected {EMBEDDING_DIMENSIONS}, got {len(embeddingVector)}")
-            
+        query_embedding = np.asarray(get_embedding(question), dtype=np.float32)
+        semantic_answer_cache.store(content_key, (EMBEDDING_MODEL, model_type, model_key),
+                                    query_embedding, question, answer, sources)
     except Exception as e:
-        print(f"[ERROR] Failed to generate workflow query embedding: {e}")
-        res_list = []
-        for i in range(k):
-            res_list.append("Error generating embedding")
-        return res_list
+        print(f"[WARNING] Failed to cache answer: {e}")
 
-    res = knn(embeddingVector, embeddings)
-    num_results = min(k, len(res))
+def get_relevant_chunks(k: int, question: str, chat_id: int, user_email: str, rerank: Optional[bool] = None,
+                        mmr: Optional[bool] = None, filters=None):
+    """
+    Retrieve the k chunks of a chat most relevant to a question.
 
-    #Get the k most relevant chunks
-    source_chunks = []
-    for i in range(num_results):
-        source_id = res[i]['index']
+    With `rerank` (default: RERANK_ENABLED), RERANK_CANDIDATES chunks are
+    retrieved and reordered by the cross-encoder before keeping k.
+    With `mmr` (default: MMR_ENABLED), the k chunks are picked from the
+    candidates by maximal marginal relevance to skip near-duplicates; the
+    reranker then only orders those k.
+    `filters` (a RetrievalFilter or a dict of its fields) restricts the search
+    to matching documents and pages; only the matching rows are scored.
 
-        document_id = rows[source_id]['document_id']
-        #page_number = rows[source_id]['page_number']
-        document_name = rows[source_id]['document_name']
+    Returns:
+        list: (chunk_text, document_name) tuples, best first
+
+    Raises:
+        ValueError: If a filter value cannot be parsed
+    """
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    mmr = MMR_ENABLED if mmr is None else mmr
+    retrieval_filter = RetrievalFilter.from_dict(filters)
+    variant = _retrieval_variant(rerank, mmr, retrieval_filter)
+    conn, cursor = get_db_connection()
+
+    try:
+        key = chat_corpus_key(chat_id)
+        params = (user_email, chat_id)
+        fingerprint = _corpus_fingerprint(cursor, _CHAT_FINGERPRINT_QUERY, params)
+        if fingerprint is None:
+            return []
+
+        #Identical retrievals against an unchanged corpus are served from the shared cache
+        cached = retrieval_result_cache.get(key, fingerprint, question, k, variant)
+        if cached is not None:
+            return cached
 
+        #Load the chat's embedding matrix (cached across questions)
+        corpus = _load_corpus(cursor, key, _CHAT_FINGERPRINT_QUERY, _CHAT_CHUNKS_QUERY, params, fingerprint)
 
-        cursor.execute('SELECT document_text FROM documents WHERE id = %s', [document_id])
-        doc_text = cursor.fetchone()['document_text']
+        #Return early if no valid embeddings found
+        if corpus is None:
+            return []
 
-        source_chunk = doc_text[rows[source_id]['start_index']:rows[source_id]['end_index']]
-        source_chunks.append((source_chunk, document_name))
-        #source_chunks.append(source_chunk)
+        rows = _filter_rows(corpus, retrieval_filter)
+        if rows is not None and len(rows) == 0:
+            return []
 
-    return source_chunks
+        #Get embedding for the query
+        try:
+            query_embedding = np.array(get_embedding(question))
+            if len(query_embedding) != EMBEDDING_DIMENSIONS:
+                raise ValueError(f"Query embedding has wrong dimensions: {len(query_embedding)}")
+        except Exception as e:
+            print(f"[ERROR] Failed to generate query embedding: {e}")
+            return []
+
+        #Rank chunks by dense similarity fused with BM25 (stored and query vectors are unit-length)
+        fetch_k = max(k, RERANK_CANDIDATES if rerank else 0, MMR_CANDIDATES if mmr else 0)
+        indices = _hybrid_search(cursor, key, corpus, question, query_embedding, fetch_k, _CHAT_TERMS_QUERY, params,
+                                 rows)
+        if mmr:
+            indices = _diversify(corpus, query_embedding, indices, k)
+
+        #Prepare result chunks
+        sources = _resolve_chunk_texts(cursor, corpus, indices)
+        if rerank:
+            sources, reranked = rerank_chunks(question, sources, k)
+            if not reranked:
+                # Do not cache a bi-encoder fallback under the reranked key
+                return sources
+        retrieval_result_cache.put(key, fingerprint, question, k, sources, variant)
+        return sources
+    finally:
+        conn.close()
+
+
+def get_relevant_chunks_wf(k, question, workflow_id, user_email, rerank=None, mmr=None, filters=None):
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    mmr = MMR_ENABLED if mmr is None else mmr
+    retrieval_filter = RetrievalFilter.from_dict(filters)
+    variant = _retrieval_variant(rerank, mmr, retrieval_filter)
+    conn, cursor = get_db_connection()
+
+    try:
+        key = workflow_corpus_key(workflow_id)
+        params = (user_email, workflow_id)
+        fingerprint = _corpus_fingerprint(cursor, _WORKFLOW_FINGERPRINT_QUERY, params)
+        if fingerprint is not None:
+            cached = retrieval_result_cache.get(key, fingerprint, question, k, variant)
+            if cached is not None:
+                return cached
+
+        corpus = None
+        if fingerprint is not None:
+            corpus = _load_corpus(cursor, key, _WORKFLOW_FINGERPRINT_QUERY, _WORKFLOW_CHUNKS_QUERY, params, fingerprint)
+
+        rows = _filter_rows(corpus, retrieval_filter) if corpus is not None else None
+        if corpus is None or (rows is not None and len(rows) == 0):
+            res_list = []
+            for i in range(k):
+                res_list.append("No text found")
+            return res_list
+
+        try:
+            embeddingVector = get_embedding(question) 
+            embeddingVector = np.array(embeddingVector)
+            
+            # Validate query embedding dimensions
+            if len(embeddingVector) != EMBEDDING_DIMENSIONS:
+                raise ValueError(f"Workflow query embedding dimension mismatch: expected {EMBEDDING_DIMENSIONS}, got {len(embeddingVector)}")
+                
+        except Exception as e:
+            print(f"[ERROR] Failed to generate workflow query embedding: {e}")
+            res_list = []
+            for i in range(k):
+                res_list.append("Error generating embedding")
+            return res_list
+
+        fetch_k = max(k, RERANK_CANDIDATES if rerank else 0, MMR_CANDIDATES if mmr else 0)
+        indices = _hybrid_search(cursor, key, corpus, question, embeddingVector, fetch_k, _WORKFLOW_TERMS_QUERY, params,
+                                 rows)
+        if mmr:
+            indices = _diversify(corpus, embeddingVector, indices, k)
+
+        #Get the k most relevant chunks
+        sources = _resolve_chunk_texts(cursor, corpus, indices)
+        if rerank:
+            sources, reranked = rerank_chunks(question, sources, k)
+            if not reranked:
+                return sources
+        retrieval_result_cache.put(key, fingerprint, question, k, sources, variant)
+        return sources
+    finally:
+        conn.close()
 
 
 def add_sources_to_db(message_id, sources):
@@ -1435,7 +2366,7 @@ def delete_doc_from_db(doc_id, user_email):
     conn, cursor = get_db_connection()
 
     verification_query = """
-            SELECT d.id
+            SELECT d.id, d.chat_id
             FROM documents d
             JOIN chats c ON d.chat_id = c.id
             JOIN users u ON c.user_id = u.id
@@ -1450,6 +2381,7 @@ def delete_doc_from_db(doc_id, user_email):
         delete_document_query = "DELETE FROM documents WHERE id = %s"
         cursor.execute(delete_document_query, (doc_id,))
         conn.commit()
+        corpus_cache.invalidate_chat(verification_result['chat_id'])
     else:
         print("Document does not belong to the user or does not exist.")
 
@@ -1533,17 +2465,21 @@ def download_10K_url_ticker(ticker):
 
     return url, ticker
 
-def download_filing_as_pdf(url, ticker):
+def fetch_filing_pdf(url):
+    # PDF rendering of an EDGAR filing, as bytes
     API_ENDPOINT = "https://api.sec-api.io/filing-reader"
 
     api_url = API_ENDPOINT + "?token=" + sec_api_key + "&url=" + url + "&type=pdf"
 
     response = requests.get(api_url)
 
+    return response.content
+
+def download_filing_as_pdf(url, ticker):
     file_name = f"{ticker}.pdf"
 
     with open(file_name, 'wb') as f:
-        f.write(response.content)
+        f.write(fetch_filing_pdf(url))
 
     return file_name
 
@@ -1604,25 +2540,11 @@ def add_ticker_to_chat_db(chat_id, ticker, user_email, isUpdate):
 
 #specific to PDF reader
 def get_text_from_single_file(file):
-    reader = PyPDF2.PdfReader(file)
-    text = ""
-
-    for page_num in range(len(reader.pages)):
-
-        text += reader.pages[page_num].extract_text()
-
-    return text
+    # Pages are extracted in parallel (see pdf_extraction) and joined once
+    return "".join(iter_pdf_pages(file))
 
 def get_text_pages_from_single_file(file):
-    reader = PyPDF2.PdfReader(file)
-    pages_text = []
-
-    for page_num in range(len(reader.pages)):
-        page_text = reader.pages[page_num].extract_text()
-        pages_text.append(page_text)
-
-
-    return pages_text #text
+    return extract_pdf_pages(file)
 
 def add_ticker_to_workflow_db(user_email, workflow_id, ticker):
     print("add_ticker_to_workflow_db")
@@ -1711,10 +2633,10 @@ def process_ticker_info_wf(user_email, workflow_id, ticker):
         reset_uploaded_docs_for_workflow(workflow_id, user_email)
 
         url, ticker = download_10K_url_ticker(ticker)
-        filename = download_filing_as_pdf(url, ticker)
+        # Parsed straight from the downloaded bytes, once, without a temporary file
+        document = parse_pdf(fetch_filing_pdf(url), f"{ticker}.pdf")
 
-        text = get_text_from_single_file(filename)
-        doc_id, doesExist = add_document_to_wfs_db(text, filename, workflow_id)
+        doc_id, doesExist = add_document_to_wfs_db(document, document.name, workflow_id)
         add_ticker_to_workflow_db(user_email, workflow_id, ticker)
         print("ADDED TICKER TO DB")
 
@@ -1722,16 +2644,10 @@ def process_ticker_info_wf(user_email, workflow_id, ticker):
         # print("Doc Id: ", doc_id)
 
         if not doesExist:
-            chunk_document.remote(text, chunk_size, doc_id)
-
-        if os.path.exists(filename):
-            os.remove(filename)
-            print(f"File '{filename}' has been deleted.")
-        else:
-            print(f"The file '{filename}' does not exist.")
+            chunk_document.remote(document, chunk_size, doc_id)
 
 
-def process_prompt_answer(prompt, workflow_id, user_email):
+def process_prompt_answer(prompt, workflow_id, user_email, sources=None):
     # model_type = request.json.get('model_type')
     print("process_prompt_answer")
     print(workflow_id)
@@ -1742,7 +2658,8 @@ def process_prompt_answer(prompt, workflow_id, user_email):
     print("SUCCESSFULLY ADDED PROMPT")
 
     # Get most relevant section from the document
-    sources = get_relevant_chunks_wf(2, query, workflow_id, user_email)
+    if sources is None:
+        sources = get_relevant_chunks_wf(2, query, workflow_id, user_email)
     print("get_relevant_chunks")
     sources_str = " ".join([", ".join(str(elem) for elem in source) for source in sources])
 
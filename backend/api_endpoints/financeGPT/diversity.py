@@ -0,0 +1,58 @@
+"""
+Maximal marginal relevance (MMR) selection over retrieved chunk candidates.
+
+Overlapping chunks (CHUNK_OVERLAP) and repeated boilerplate in long filings
+produce near-duplicate candidates. MMR picks each next chunk by trading its
+similarity to the query against its highest similarity to the chunks already
+picked, so the prompt gets k distinct passages instead of k copies of one.
+"""
+import os
+
+import numpy as np
+
+MMR_ENABLED = os.getenv("ENABLE_MMR", "false").lower() == "true"
+# 1.0 is pure relevance, 0.0 pure diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+
+
+def maximal_marginal_relevance(query_embedding, candidate_embeddings, k, lambda_mult=None):
+    """
+    Select k candidates by maximal marginal relevance.
+
+    Relevance and the candidate-candidate similarity matrix are computed with
+    two matrix products up front; each selection step is then a vectorized
+    update of every candidate's highest similarity to the selected set.
+
+    Args:
+        query_embedding (numpy.ndarray): Unit-length query vector
+        candidate_embeddings (numpy.ndarray): Unit-length candidate vectors (N x dimensions)
+        k (int): Number of candidates to select
+        lambda_mult (float, optional): Relevance weight. Defaults to MMR_LAMBDA.
+
+    Returns:
+        numpy.ndarray: Positions into candidate_embeddings, in selection order
+    """
+    lambda_mult = MMR_LAMBDA if lambda_mult is None else lambda_mult
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    n = candidates.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    relevance = candidates @ np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    similarity = candidates @ candidates.T
+
+    selected = np.empty(k, dtype=np.int64)
+    available = np.ones(n, dtype=bool)
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    weighted_relevance = lambda_mult * relevance
+
+    selected[0] = int(np.argmax(relevance))
+    available[selected[0]] = False
+    for step in range(1, k):
+        np.maximum(redundancy, similarity[selected[step - 1]], out=redundancy)
+        scores = np.where(available, weighted_relevance - (1.0 - lambda_mult) * redundancy, -np.inf)
+        selected[step] = int(np.argmax(scores))
+        available[selected[step]] = False
+    return selected
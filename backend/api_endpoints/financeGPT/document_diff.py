@@ -0,0 +1,117 @@
+"""
+Planning the re-ingestion of an edited document.
+
+A chunk's row depends only on the text between its offsets, so when a document
+is uploaded again with edits, every chunk lying in a stretch of text the two
+versions share is still valid at its shifted offsets. plan_reingest() diffs
+the stored and the new text line by line, keeps those chunks and re-splits
+only the new text no kept chunk covers, so re-ingesting costs embeddings in
+proportion to the edit rather than to the document.
+"""
+import difflib
+from bisect import bisect_right
+from itertools import accumulate
+
+
+class ReingestPlan:
+    """
+    What re-ingesting a document changes in its chunk rows.
+
+    Attributes:
+        kept (list): (chunk id, new start, new end, new page number, moved) of the old
+            chunks still valid; moved is True if the offsets or page number changed
+        removed (list): IDs of the old chunks touching edited text
+        added (list): (start, end, page number) of the new chunks to embed
+    """
+
+    __slots__ = ("kept", "removed", "added")
+
+    def __init__(self, kept, removed, added):
+        self.kept = kept
+        self.removed = removed
+        self.added = added
+
+    @property
+    def moved(self):
+        return [chunk for chunk in self.kept if chunk[4]]
+
+
+def matching_spans(old_text, new_text):
+    """
+    Runs of whole lines the two texts have in common.
+
+    Returns:
+        list: (old start, old end, new start) character offsets, in text order
+    """
+    old_lines = old_text.splitlines(keepends=True)
+    new_lines = new_text.splitlines(keepends=True)
+    old_offsets = [0, *accumulate(len(line) for line in old_lines)]
+    new_offsets = [0, *accumulate(len(line) for line in new_lines)]
+
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    return [
+        (old_offsets[i], old_offsets[i + size], new_offsets[j])
+        for i, j, size in matcher.get_matching_blocks()
+        if size
+    ]
+
+
+def _page_number(page_offsets, start):
+    return bisect_right(page_offsets, start) if page_offsets else None
+
+
+def plan_reingest(old_chunks, old_text, new_text, splitter, page_offsets=None):
+    """
+    Work out which chunks of a document survive an edit and which text needs new chunks.
+
+    Args:
+        old_chunks (list): Rows (dicts with id, start_index, end_index, page_number)
+            of the document's current chunks
+        old_text (str): Text the current chunks' offsets refer to
+        new_text (str): The document's new text
+        splitter (SpanTextSplitter): Splitter the document is chunked with
+        page_offsets (list, optional): Offset of each page in new_text; chunks are not
+            split across pages and get page numbers if given
+
+    Returns:
+        ReingestPlan
+    """
+    spans = matching_spans(old_text, new_text)
+    span_starts = [span[0] for span in spans]
+
+    kept = []
+    removed = []
+    for chunk in old_chunks:
+        start, end = chunk["start_index"], chunk["end_index"]
+        i = bisect_right(span_starts, start) - 1 if start is not None and start >= 0 else -1
+        if i < 0 or end is None or end > spans[i][1]:
+            removed.append(chunk["id"])
+            continue
+        shift = spans[i][2] - spans[i][0]
+        page_number = _page_number(page_offsets, start + shift)
+        moved = shift != 0 or page_number != chunk["page_number"]
+        kept.append((chunk["id"], start + shift, end + shift, page_number, moved))
+    kept.sort(key=lambda chunk: (chunk[1], chunk[2]))
+
+    # Text outside every kept chunk is chunked afresh, a page at a time
+    gaps = []
+    covered = 0
+    for _, start, end, _, _ in kept:
+        if start > covered:
+            gaps.append((covered, start))
+        covered = max(covered, end)
+    if len(new_text) > covered:
+        gaps.append((covered, len(new_text)))
+
+    pages = page_offsets or [0]
+    page_ends = [*pages[1:], len(new_text)]
+    added = []
+    for gap_start, gap_end in gaps:
+        first_page = max(bisect_right(pages, gap_start) - 1, 0)
+        for page_start, page_end in zip(pages[first_page:], page_ends[first_page:]):
+            if page_start >= gap_end:
+                break
+            for start, end in splitter.split_spans(new_text, max(gap_start, page_start), min(gap_end, page_end)):
+                added.append((start, end, _page_number(page_offsets, start)))
+
+    return ReingestPlan(kept, removed, added)
@@ -0,0 +1,96 @@
+"""
+Length-bucketed batching for the embedding model.
+
+Every text in a forward pass is padded to the longest one in its batch, so
+slicing texts in arrival order with a fixed batch size wastes most of the
+compute on mixed inputs, such as 10-K chunks where short table rows and headers
+sit next to full paragraphs. encode_length_bucketed() sorts the texts by token
+length, fills each batch up to EMBEDDING_TOKEN_BUDGET padded tokens (many short
+texts, or a few long ones) and returns the embeddings in the original order. It
+logs tokens/s and the share of padding, for tuning the budget.
+"""
+import os
+import time
+
+# Padded tokens (texts x longest text) per forward pass
+EMBEDDING_TOKEN_BUDGET = int(os.getenv("EMBEDDING_TOKEN_BUDGET", "16384"))
+# Upper bound on texts per forward pass, however short they are
+EMBEDDING_MAX_BATCH_TEXTS = int(os.getenv("EMBEDDING_MAX_BATCH_TEXTS", "256"))
+
+_DEFAULT_MAX_SEQ_LENGTH = 512
+
+
+def token_lengths(model, texts):
+    """
+    Number of tokens the model sees for each text, after truncation.
+
+    Uses the model's tokenizer, or about four characters per token if it has none.
+    """
+    max_length = getattr(model, "max_seq_length", None) or _DEFAULT_MAX_SEQ_LENGTH
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is not None:
+        try:
+            encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+            return [len(ids) for ids in encoded["input_ids"]]
+        except Exception as e:
+            print(f"[WARNING] Tokenizer failed, estimating token lengths: {e}")
+    return [min(len(text) // 4 + 2, max_length) for text in texts]
+
+
+def plan_token_batches(lengths, token_budget=EMBEDDING_TOKEN_BUDGET, max_batch=EMBEDDING_MAX_BATCH_TEXTS):
+    """
+    Group texts into batches of similar length that fit the token budget.
+
+    Args:
+        lengths (list): Token length of each text
+        token_budget (int): Maximum padded tokens per batch; a text longer than
+            the budget gets a batch of its own
+        max_batch (int): Maximum texts per batch
+
+    Returns:
+        list: Batches of indices into `lengths`, longest texts first
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    position = 0
+    while position < len(order):
+        longest = max(lengths[order[position]], 1)
+        size = max(1, min(max_batch, token_budget // longest))
+        batches.append(order[position:position + size])
+        position += size
+    return batches
+
+
+def encode_length_bucketed(model, texts, token_budget=EMBEDDING_TOKEN_BUDGET, max_batch=EMBEDDING_MAX_BATCH_TEXTS):
+    """
+    Embed texts (already prefixed) with normalized embeddings, in length-bucketed batches.
+
+    Returns:
+        list: One embedding (list of floats) per text, in the order of `texts`
+    """
+    if not texts:
+        return []
+
+    started = time.perf_counter()
+    lengths = token_lengths(model, texts)
+    batches = plan_token_batches(lengths, token_budget, max_batch)
+
+    embeddings = [None] * len(texts)
+    padded_tokens = 0
+    for batch in batches:
+        vectors = model.encode(
+            [texts[i] for i in batch],
+            normalize_embeddings=True,
+            batch_size=len(batch),
+            show_progress_bar=False,
+            convert_to_tensor=False
+        )
+        for i, vector in zip(batch, vectors):
+            embeddings[i] = vector.tolist()
+        padded_tokens += len(batch) * lengths[batch[0]]
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    tokens = sum(lengths)
+    print(f"Embedded {len(texts)} texts in {len(batches)} batches: {tokens} tokens in {elapsed:.2f}s "
+          f"({tokens / elapsed:.0f} tokens/s, {1 - tokens / max(padded_tokens, 1):.0%} padding)")
+    return embeddings
@@ -0,0 +1,191 @@
+"""
+Persistent cache of chunk embeddings, keyed by SHA-256 of (model, prefix, text).
+
+get_embeddings_batch looks chunks up here before running the model, so
+re-ingesting an edited document, re-running a workflow's ticker ingestion or
+re-chunking text that reproduces existing chunks only embeds the novel ones.
+Entries live in the chunk_embedding_cache table and are shared by every worker.
+Lookups refresh an entry's last_used time, and entries unused for
+CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS are pruned, so the table holds the chunks of
+documents that are still being re-ingested rather than every text ever seen.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from database.db import get_db_connection
+from api_endpoints.financeGPT.embedding_format import encode_embedding, decode_embedding
+
+CHUNK_EMBEDDING_CACHE_ENABLED = os.getenv("CHUNK_EMBEDDING_CACHE", "true").lower() == "true"
+# Entries not looked up for this many days are deleted; 0 keeps them forever
+CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS = int(os.getenv("CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS", "30"))
+# Each process prunes at most this often, after a write
+CHUNK_EMBEDDING_CACHE_PRUNE_INTERVAL_SECONDS = int(os.getenv("CHUNK_EMBEDDING_CACHE_PRUNE_INTERVAL_SECONDS", "3600"))
+
+# Keys per SELECT ... IN (...) lookup
+_LOOKUP_BATCH_SIZE = 500
+
+# Rows per DELETE when pruning, so pruning never holds long locks
+_PRUNE_BATCH_SIZE = 5000
+# last_used is refreshed at most this often, so repeated hits do not write every time
+_TOUCH_INTERVAL_HOURS = 24
+
+# MySQL ER_NO_SUCH_TABLE: the upgrade creating chunk_embedding_cache has not been run
+_NO_SUCH_TABLE = 1146
+# MySQL ER_BAD_FIELD_ERROR: the table predates the last_used column
+_BAD_FIELD = 1054
+
+
+def embedding_cache_key(model, prefix, text):
+    return hashlib.sha256(f"{model}\x00{prefix}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingStore:
+    """
+    Embeddings in the chunk_embedding_cache table.
+
+    If the table has not been created yet, the store reports it once and turns
+    itself off for the process; if it has no last_used column, only usage
+    tracking and pruning are turned off. Other failures (a lost connection, a
+    deadlock, a timeout) only skip the lookup or write at hand. Either way
+    embedding proceeds without the cache.
+    """
+
+    def __init__(self, enabled=CHUNK_EMBEDDING_CACHE_ENABLED, max_age_days=CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS,
+                 prune_interval_seconds=CHUNK_EMBEDDING_CACHE_PRUNE_INTERVAL_SECONDS):
+        self.enabled = enabled
+        self.track_usage = True
+        self.max_age_days = max_age_days
+        self.prune_interval_seconds = prune_interval_seconds
+        self._last_prune = None
+        self._prune_lock = threading.Lock()
+
+    def _handle_error(self, e, action):
+        errno = getattr(e, "errno", None)
+        if errno == _NO_SUCH_TABLE:
+            print(f"[WARNING] Chunk embedding cache table missing, embedding without it: {e}")
+            self.enabled = False
+        elif errno == _BAD_FIELD:
+            print(f"[WARNING] Chunk embedding cache has no last_used column, not pruning it: {e}")
+            self.track_usage = False
+        else:
+            print(f"[WARNING] Chunk embedding cache {action} failed, skipping it: {e}")
+
+    def get_many(self, keys):
+        """
+        Returns:
+            dict: key -> embedding (list of floats) for the keys found
+        """
+        if not self.enabled or not keys:
+            return {}
+
+        found = {}
+        try:
+            conn, cursor = get_db_connection()
+            try:
+                for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+                    batch = keys[start:start + _LOOKUP_BATCH_SIZE]
+                    placeholders = ", ".join(["%s"] * len(batch))
+                    cursor.execute(
+                        f"SELECT text_hash, embedding_vector FROM chunk_embedding_cache WHERE text_hash IN ({placeholders})",
+                        batch,
+                    )
+                    for row in cursor.fetchall():
+                        vector = decode_embedding(row["embedding_vector"])
+                        if vector is not None:
+                            found[row["text_hash"]] = vector.tolist()
+                if found and self.track_usage:
+                    self._touch(conn, cursor, list(found))
+            finally:
+                conn.close()
+        except Exception as e:
+            self._handle_error(e, "lookup")
+        return found
+
+    def _touch(self, conn, cursor, keys):
+        # Mark entries as used; a failure here must not lose the lookup's results
+        try:
+            for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + _LOOKUP_BATCH_SIZE]
+                placeholders = ", ".join(["%s"] * len(batch))
+                cursor.execute(
+                    f"UPDATE chunk_embedding_cache SET last_used = CURRENT_TIMESTAMP "
+                    f"WHERE text_hash IN ({placeholders}) AND last_used < NOW() - INTERVAL {_TOUCH_INTERVAL_HOURS} HOUR",
+                    batch,
+                )
+            conn.commit()
+        except Exception as e:
+            self._handle_error(e, "usage update")
+
+    def put_many(self, items):
+        """
+        Args:
+            items (list): (key, embedding) pairs
+        """
+        if not self.enabled or not items:
+            return
+
+        try:
+            conn, cursor = get_db_connection()
+            try:
+                cursor.executemany(
+                    "INSERT IGNORE INTO chunk_embedding_cache (text_hash, embedding_vector) VALUES (%s, %s)",
+                    [(key, encode_embedding(embedding)) for key, embedding in items],
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            self._handle_error(e, "write")
+            return
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        # Prune in the background at most once per interval, so writes never wait on it
+        if not self.track_usage or self.max_age_days <= 0:
+            return
+        with self._prune_lock:
+            now = time.monotonic()
+            if self._last_prune is not None and now - self._last_prune < self.prune_interval_seconds:
+                return
+            self._last_prune = now
+        threading.Thread(target=self.prune, daemon=True).start()
+
+    def prune(self, max_age_days=None):
+        """
+        Delete entries not looked up for max_age_days, _PRUNE_BATCH_SIZE rows at a time.
+
+        Args:
+            max_age_days (int, optional): Defaults to CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS
+
+        Returns:
+            int: Number of entries deleted
+        """
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        if not self.enabled or not self.track_usage or max_age_days <= 0:
+            return 0
+
+        deleted = 0
+        try:
+            conn, cursor = get_db_connection()
+            try:
+                while True:
+                    cursor.execute(
+                        "DELETE FROM chunk_embedding_cache WHERE last_used < NOW() - INTERVAL %s DAY LIMIT %s",
+                        (max_age_days, _PRUNE_BATCH_SIZE),
+                    )
+                    conn.commit()
+                    deleted += cursor.rowcount
+                    if cursor.rowcount < _PRUNE_BATCH_SIZE:
+                        break
+            finally:
+                conn.close()
+        except Exception as e:
+            self._handle_error(e, "prune")
+        if deleted:
+            print(f"Pruned {deleted} chunk embedding cache entries unused for {max_age_days} days")
+        return deleted
+
+
+chunk_embedding_store = ChunkEmbeddingStore()
@@ -0,0 +1,183 @@
+"""
+Binary encoding of the chunk embeddings stored in chunks.embedding_vector.
+
+Version 1 BLOBs start with an 8-byte header followed by the raw little-endian vector:
+
+    magic b"EV" (2 bytes) | version (1 byte) | dtype code (1 byte) | dimensions (uint32)
+
+Rows written before the header existed are bare float64 arrays (np.array(...).tobytes()),
+and decode_embedding still accepts them so old and new rows can live side by side
+while migrate_legacy_embeddings rewrites the table.
+
+The same header also frames the compact codes in chunks.embedding_int8 and
+chunks.embedding_binary: an int8 code is a float32 scale followed by one signed
+byte per dimension, a binary code is the packed sign bits of the vector.
+"""
+import struct
+
+import numpy as np
+
+EMBEDDING_FORMAT_MAGIC = b"EV"
+EMBEDDING_FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<2sBBI")
+
+_DTYPE_TO_CODE = {
+    np.dtype("<f4"): 1,
+    np.dtype("<f2"): 2,
+}
+_CODE_TO_DTYPE = {code: dtype for dtype, code in _DTYPE_TO_CODE.items()}
+
+_QUANTIZED_TO_CODE = {
+    "int8": 3,
+    "binary": 4,
+}
+_CODE_TO_QUANTIZED = {code: kind for kind, code in _QUANTIZED_TO_CODE.items()}
+_INT8_SCALE = np.dtype("<f4")
+
+_LEGACY_DTYPE = np.dtype("<f8")
+
+
+def encode_embedding(vector, dtype=np.float32):
+    """
+    Encode an embedding as a versioned BLOB.
+
+    Args:
+        vector (list or np.array): The embedding vector
+        dtype: Storage dtype, float32 (default) or float16
+
+    Returns:
+        bytes: Header plus vector payload
+    """
+    storage_dtype = np.dtype(dtype).newbyteorder("<")
+    if storage_dtype not in _DTYPE_TO_CODE:
+        raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+
+    array = np.asarray(vector, dtype=storage_dtype).ravel()
+    header = _HEADER.pack(EMBEDDING_FORMAT_MAGIC, EMBEDDING_FORMAT_VERSION,
+                          _DTYPE_TO_CODE[storage_dtype], array.shape[0])
+    return header + array.tobytes()
+
+
+def _parse_header(blob):
+    if len(blob) < _HEADER.size:
+        return None
+    magic, version, dtype_code, dimensions = _HEADER.unpack_from(blob)
+    if magic != EMBEDDING_FORMAT_MAGIC or version != EMBEDDING_FORMAT_VERSION:
+        return None
+    dtype = _CODE_TO_DTYPE.get(dtype_code)
+    if dtype is None or len(blob) != _HEADER.size + dimensions * dtype.itemsize:
+        return None
+    return dtype, dimensions
+
+
+def is_legacy_embedding(blob):
+    """True if the BLOB is a headerless float64 vector written before format v1."""
+    return bool(blob) and _parse_header(blob) is None
+
+
+def decode_embedding(blob):
+    """
+    Decode an embedding BLOB in either the versioned or the legacy float64 format.
+
+    Args:
+        blob (bytes): The stored embedding
+
+    Returns:
+        np.array: The vector (read-only view of the BLOB), or None if it cannot be decoded
+    """
+    if not blob:
+        return None
+
+    parsed = _parse_header(blob)
+    if parsed is not None:
+        dtype, dimensions = parsed
+        return np.frombuffer(blob, dtype=dtype, count=dimensions, offset=_HEADER.size)
+
+    if _parse_code_header(blob) is not None or len(blob) % _LEGACY_DTYPE.itemsize != 0:
+        return None
+    return np.frombuffer(blob, dtype=_LEGACY_DTYPE)
+
+
+def _code_payload_size(kind, dimensions):
+    if kind == "int8":
+        return _INT8_SCALE.itemsize + dimensions
+    return (dimensions + 7) // 8
+
+
+def _parse_code_header(blob):
+    if len(blob) < _HEADER.size:
+        return None
+    magic, version, dtype_code, dimensions = _HEADER.unpack_from(blob)
+    kind = _CODE_TO_QUANTIZED.get(dtype_code)
+    if magic != EMBEDDING_FORMAT_MAGIC or version != EMBEDDING_FORMAT_VERSION or kind is None:
+        return None
+    if len(blob) != _HEADER.size + _code_payload_size(kind, dimensions):
+        return None
+    return kind, dimensions
+
+
+def quantize_embedding(vector, kind):
+    """
+    Quantize a unit-length embedding.
+
+    Args:
+        vector (list or np.array): The embedding vector
+        kind (str): "int8" (symmetric per-vector scale) or "binary" (sign bits)
+
+    Returns:
+        tuple: (codes, scale). int8 codes come with their float scale, so that
+            vector ~= codes * scale; binary codes are packed bits and scale is None.
+    """
+    array = np.asarray(vector, dtype=np.float32).ravel()
+    if kind == "int8":
+        max_abs = float(np.max(np.abs(array))) if array.size else 0.0
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+        return np.clip(np.rint(array / scale), -127, 127).astype(np.int8), scale
+    if kind == "binary":
+        return np.packbits(array > 0), None
+    raise ValueError(f"Unsupported embedding quantization: {kind}")
+
+
+def encode_embedding_code(vector, kind):
+    """
+    Encode the int8 or binary code of an embedding as a versioned BLOB.
+
+    Args:
+        vector (list or np.array): The full-precision embedding vector
+        kind (str): "int8" or "binary"
+
+    Returns:
+        bytes: Header plus code payload
+    """
+    codes, scale = quantize_embedding(vector, kind)
+    dimensions = np.asarray(vector).size
+    header = _HEADER.pack(EMBEDDING_FORMAT_MAGIC, EMBEDDING_FORMAT_VERSION, _QUANTIZED_TO_CODE[kind], dimensions)
+    if kind == "int8":
+        return header + np.array(scale, dtype=_INT8_SCALE).tobytes() + codes.tobytes()
+    return header + codes.tobytes()
+
+
+def decode_embedding_code(blob, kind):
+    """
+    Decode a code BLOB written by encode_embedding_code.
+
+    Args:
+        blob (bytes): The stored code
+        kind (str): The expected quantization kind
+
+    Returns:
+        tuple: (codes, scale, dimensions), or None if the BLOB is missing or of another kind
+    """
+    if not blob:
+        return None
+    parsed = _parse_code_header(blob)
+    if parsed is None or parsed[0] != kind:
+        return None
+    dimensions = parsed[1]
+    if kind == "int8":
+        scale = float(np.frombuffer(blob, dtype=_INT8_SCALE, count=1, offset=_HEADER.size)[0])
+        codes = np.frombuffer(blob, dtype=np.int8, count=dimensions, offset=_HEADER.size + _INT8_SCALE.itemsize)
+        return codes, scale, dimensions
+    codes = np.frombuffer(blob, dtype=np.uint8, count=(dimensions + 7) // 8, offset=_HEADER.size)
+    return codes, None, dimensions
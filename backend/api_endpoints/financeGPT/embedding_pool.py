@@ -0,0 +1,210 @@
+"""
+Long-lived pool of embedding model workers for passage embedding.
+
+Ingestion tasks run in short-lived Ray workers; loading the sentence-transformer
+in each of them costs seconds per cold worker and a model copy per process.
+Instead, EMBEDDING_POOL_SIZE named Ray actors load the model once and serve
+embedding requests from every task. Each actor merges requests that arrive
+within EMBEDDING_POOL_BATCH_WAIT_MS (up to EMBEDDING_POOL_MAX_BATCH texts) into a
+single model call, so concurrent uploads are batched together.
+
+Without Ray, EMBEDDING_POOL_BACKEND=process runs the same number of local worker
+processes instead. Its spawned workers re-import the main module, so it is not
+the default; by default, or with EMBEDDING_POOL_SIZE=0, embedding outside Ray
+uses the in-process model.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import ray
+
+from api_endpoints.financeGPT.embedding_batching import encode_length_bucketed
+
+EMBEDDING_POOL_SIZE = int(os.getenv("EMBEDDING_POOL_SIZE", "2"))
+# auto (Ray actors when Ray is running, else the in-process model) | ray | process
+EMBEDDING_POOL_BACKEND = os.getenv("EMBEDDING_POOL_BACKEND", "auto").lower()
+EMBEDDING_POOL_MAX_BATCH = int(os.getenv("EMBEDDING_POOL_MAX_BATCH", "128"))
+EMBEDDING_POOL_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_POOL_BATCH_WAIT_MS", "10"))
+EMBEDDING_POOL_NUM_GPUS = float(os.getenv("EMBEDDING_POOL_NUM_GPUS", "0"))
+
+# Actors are shared by every driver (Flask workers, MCP server) through this namespace
+_ACTOR_NAMESPACE = "embedding_pool"
+
+
+def load_embedding_model(model_name):
+    """Load the sentence-transformer, on the GPU if one is available."""
+    from sentence_transformers import SentenceTransformer
+    import torch
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = SentenceTransformer(model_name, device=device)
+    print(f"Model {model_name} loaded on device: {device}")
+    return model
+
+
+@ray.remote
+class EmbeddingWorker:
+    """
+    Ray actor holding one copy of the embedding model.
+
+    encode() calls are queued; a batcher coroutine takes the first waiting
+    request, adds any others that arrive within the batch window and runs them
+    through the model together, off the event loop so requests keep queueing.
+    """
+
+    def __init__(self, model_name, max_batch=EMBEDDING_POOL_MAX_BATCH, batch_wait_ms=EMBEDDING_POOL_BATCH_WAIT_MS):
+        self.model = load_embedding_model(model_name)
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000.0
+        self._queue = None
+
+    async def encode(self, texts):
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            loop.create_task(self._run_batches())
+
+        result = loop.create_future()
+        await self._queue.put((texts, result))
+        return await result
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            size = len(requests[0][0])
+            deadline = loop.time() + self.batch_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                embeddings = await loop.run_in_executor(None, encode_length_bucketed, self.model, texts)
+            except Exception as e:
+                for _, result in requests:
+                    if not result.done():
+                        result.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, result in requests:
+                if not result.done():
+                    result.set_result(embeddings[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+_process_model = None
+
+
+def _init_process_worker(model_name):
+    global _process_model
+    _process_model = load_embedding_model(model_name)
+
+
+def _encode_in_process_worker(texts):
+    return encode_length_bucketed(_process_model, texts)
+
+
+class EmbeddingPool:
+    """
+    Fixed-size set of model workers, either Ray actors or local processes.
+
+    With the auto backend the pool is active only while Ray is running.
+
+    encode() splits the texts into batches, spreads them over the workers
+    round-robin and returns the embeddings in order.
+    """
+
+    def __init__(self, model_name, size=EMBEDDING_POOL_SIZE, backend=EMBEDDING_POOL_BACKEND):
+        self.model_name = model_name
+        self.size = size
+        self.backend = backend
+        self._workers = None
+        self._executor = None
+        self._next_worker = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        if self.backend == "auto":
+            return ray.is_initialized()
+        return self.backend in ("ray", "process")
+
+    def _ray_workers(self):
+        if self._workers is None:
+            with self._lock:
+                if self._workers is None:
+                    self._workers = [
+                        EmbeddingWorker.options(
+                            name=f"embedding-worker-{self.model_name.split('/')[-1]}-{i}",
+                            namespace=_ACTOR_NAMESPACE,
+                            get_if_exists=True,
+                            lifetime="detached",
+                            num_gpus=EMBEDDING_POOL_NUM_GPUS,
+                        ).remote(self.model_name)
+                        for i in range(self.size)
+                    ]
+        return self._workers
+
+    def _process_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn, so workers do not inherit the parent's torch state
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.size,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_process_worker,
+                        initargs=(self.model_name,),
+                    )
+        return self._executor
+
+    def encode(self, texts, batch_size):
+        """
+        Embed texts (already prefixed) with normalized embeddings.
+
+        batch_size is the number of texts per request to a worker; workers size
+        their forward passes by token budget (see embedding_batching).
+
+        Returns:
+            list: One embedding (list of floats) per text
+        """
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        if self.backend != "process":
+            workers = self._ray_workers()
+            refs = [workers[next(self._next_worker) % len(workers)].encode.remote(batch) for batch in batches]
+            results = ray.get(refs)
+        else:
+            executor = self._process_executor()
+            results = [future.result() for future in
+                       [executor.submit(_encode_in_process_worker, batch) for batch in batches]]
+        return [embedding for result in results for embedding in result]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_embedding_pool(model_name):
+    """
+    The process's pool for a model, or None if embedding should use the in-process model.
+    """
+    if EMBEDDING_POOL_SIZE <= 0:
+        return None
+    with _pools_lock:
+        if model_name not in _pools:
+            _pools[model_name] = EmbeddingPool(model_name)
+        pool = _pools[model_name]
+    return pool if pool.active else None
@@ -0,0 +1,169 @@
+"""
+Ingestion jobs: progress and outcome of a document's chunking and embedding.
+
+Upload routes create one job per document and return its id right away; the
+Ray task ingesting the document (ingest_document_chunks) records per-stage
+progress on the job row as batches are embedded and inserted, and finally
+marks it completed or failed. Clients poll the job or follow its SSE stream and
+only wait when they need the document to be searchable.
+"""
+import os
+import uuid
+
+from database.db import get_db_connection
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+FINISHED_JOB_STATUSES = (JOB_COMPLETED, JOB_FAILED)
+
+# Seconds between checks of a job's row while streaming its progress
+INGEST_JOB_POLL_SECONDS = float(os.getenv("INGEST_JOB_POLL_SECONDS", "0.5"))
+# Longest a progress stream stays open; a job whose Ray worker died never finishes
+INGEST_JOB_STREAM_SECONDS = float(os.getenv("INGEST_JOB_STREAM_SECONDS", "1800"))
+
+_JOB_QUERY = """
+    SELECT j.id, j.document_id, d.document_name, j.status, j.pages_parsed, j.chunks_embedded,
+           j.rows_inserted, j.error, j.created, j.started, j.finished,
+           TIMESTAMPDIFF(MICROSECOND, j.started, COALESCE(j.finished, CURRENT_TIMESTAMP(3))) / 1000000 AS elapsed_seconds
+    FROM ingestion_jobs j
+    JOIN documents d ON d.id = j.document_id
+    LEFT JOIN chats c ON c.id = d.chat_id
+    LEFT JOIN workflows w ON w.id = d.workflow_id
+    JOIN users u ON u.id = COALESCE(c.user_id, w.user_id)
+    WHERE j.id = %s AND u.email = %s
+"""
+
+
+def create_ingestion_job(document_id, pages_parsed=1):
+    """
+    Create the job tracking a document's ingestion.
+
+    Args:
+        document_id (int): Database document ID
+        pages_parsed (int): Pages extracted from the uploaded file
+
+    Returns:
+        str: The job ID
+    """
+    job_id = str(uuid.uuid4())
+    conn, cursor = get_db_connection()
+    try:
+        cursor.execute(
+            'INSERT INTO ingestion_jobs (id, document_id, status, pages_parsed) VALUES (%s, %s, %s, %s)',
+            (job_id, document_id, JOB_QUEUED, pages_parsed)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+def existing_ingestion_job(document_id, pages_parsed=1):
+    """
+    Job for a document that needs no chunking, e.g. one uploaded again or reusing
+    the chunks of an identical upload.
+
+    Returns:
+        tuple: (job ID, status) of the document's latest job, or of a new job that is
+            completed from the start if the document has none
+    """
+    conn, cursor = get_db_connection()
+    try:
+        cursor.execute(
+            'SELECT id, status FROM ingestion_jobs WHERE document_id = %s ORDER BY created DESC LIMIT 1',
+            (document_id,)
+        )
+        job = cursor.fetchone()
+        if job:
+            return job["id"], job["status"]
+
+        job_id = str(uuid.uuid4())
+        cursor.execute(
+            'INSERT INTO ingestion_jobs (id, document_id, status, pages_parsed, chunks_embedded, rows_inserted, started, finished) '
+            'SELECT %s, %s, %s, %s, COUNT(*), COUNT(*), CURRENT_TIMESTAMP(3), CURRENT_TIMESTAMP(3) FROM chunks WHERE document_id = %s',
+            (job_id, document_id, JOB_COMPLETED, pages_parsed, document_id)
+        )
+        conn.commit()
+        return job_id, JOB_COMPLETED
+    finally:
+        conn.close()
+
+
+def start_ingestion_job(cursor, job_id):
+    cursor.execute(
+        'UPDATE ingestion_jobs SET status = %s, started = CURRENT_TIMESTAMP(3) WHERE id = %s',
+        (JOB_RUNNING, job_id)
+    )
+
+
+def record_ingestion_progress(cursor, job_id, chunks_embedded, rows_inserted):
+    cursor.execute(
+        'UPDATE ingestion_jobs SET chunks_embedded = %s, rows_inserted = %s WHERE id = %s',
+        (chunks_embedded, rows_inserted, job_id)
+    )
+
+
+def finish_ingestion_job(cursor, job_id, error=None):
+    """
+    Mark a job completed, or failed with the given error.
+    """
+    cursor.execute(
+        'UPDATE ingestion_jobs SET status = %s, error = %s, finished = CURRENT_TIMESTAMP(3) WHERE id = %s',
+        (JOB_FAILED if error else JOB_COMPLETED, str(error)[:2000] if error else None, job_id)
+    )
+
+
+def fail_ingestion_job(job_id, error):
+    """
+    Mark a job failed from outside ingest_document_chunks, e.g. when its Ray task
+    failed before ingestion started. Finished jobs are left as they are.
+    """
+    conn, cursor = get_db_connection()
+    try:
+        cursor.execute(
+            'UPDATE ingestion_jobs SET status = %s, error = %s, finished = CURRENT_TIMESTAMP(3) '
+            'WHERE id = %s AND status IN (%s, %s)',
+            (JOB_FAILED, str(error)[:2000], job_id, JOB_QUEUED, JOB_RUNNING)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_ingestion_job(job_id, user_email):
+    """
+    Current state of a job on one of the user's chats or workflows.
+
+    Returns:
+        dict: job_id, document_id, document_name, status, the per-stage counts
+            (pages_parsed, chunks_embedded, rows_inserted), elapsed_seconds,
+            chunks_per_second and error, or None if the user has no such job
+    """
+    conn, cursor = get_db_connection()
+    try:
+        cursor.execute(_JOB_QUERY, (job_id, user_email))
+        job = cursor.fetchone()
+    finally:
+        conn.close()
+
+    if not job:
+        return None
+
+    elapsed = float(job["elapsed_seconds"]) if job["elapsed_seconds"] is not None else None
+    return {
+        "job_id": job["id"],
+        "document_id": job["document_id"],
+        "document_name": job["document_name"],
+        "status": job["status"],
+        "pages_parsed": job["pages_parsed"],
+        "chunks_embedded": job["chunks_embedded"],
+        "rows_inserted": job["rows_inserted"],
+        "elapsed_seconds": elapsed,
+        "chunks_per_second": job["rows_inserted"] / elapsed if elapsed else None,
+        "error": job["error"],
+        "created": job["created"].isoformat() if job["created"] else None,
+        "finished": job["finished"].isoformat() if job["finished"] else None,
+    }
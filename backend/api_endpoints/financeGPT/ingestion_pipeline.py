@@ -0,0 +1,106 @@
+"""
+Bounded-queue pipeline for document ingestion.
+
+Each stage (e.g. split → embed → insert) runs in its own thread and hands
+batches to the next through a queue of at most INGEST_QUEUE_SIZE items, so a
+slow stage applies backpressure to the ones before it and only a few batches
+are ever held in memory, whatever the size of the document.
+"""
+import os
+import queue
+import threading
+from itertools import islice
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+
+# How often blocked stages check whether another stage has failed
+_POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` consecutive items."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_pipeline(source, stages, queue_size=None):
+    """
+    Push the items of `source` through `stages`, each running in its own thread.
+
+    The source is consumed in a thread of its own as well. Every stage but the
+    last passes its return value on to the next stage; the last stage is a sink.
+    If any stage raises, the others stop and the first exception is re-raised
+    here once all threads have exited.
+
+    Args:
+        source (iterable): Items (typically batches) to process
+        stages (list): Callables taking one item
+        queue_size (int, optional): Items buffered between stages. Defaults to INGEST_QUEUE_SIZE.
+    """
+    queues = [queue.Queue(maxsize=queue_size or INGEST_QUEUE_SIZE) for _ in stages]
+    stop = threading.Event()
+    errors = []
+
+    def put(target, item):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(source_queue):
+        while not stop.is_set():
+            try:
+                return source_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(e):
+        errors.append(e)
+        stop.set()
+
+    def feed():
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+            put(queues[0], _DONE)
+        except Exception as e:
+            fail(e)
+
+    def work(stage, inbox, outbox):
+        try:
+            while True:
+                item = get(inbox)
+                if item is _DONE:
+                    if outbox is not None:
+                        put(outbox, _DONE)
+                    return
+                result = stage(item)
+                if outbox is not None and not put(outbox, result):
+                    return
+        except Exception as e:
+            fail(e)
+
+    threads = [threading.Thread(target=feed, name="ingest-source", daemon=True)]
+    for i, stage in enumerate(stages):
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        threads.append(threading.Thread(target=work, args=(stage, queues[i], outbox),
+                                        name=f"ingest-stage-{i}", daemon=True))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,216 @@
+"""
+Incremental BM25 indexes for hybrid (lexical + dense) chunk retrieval.
+
+Term counts are computed once per chunk at ingestion and stored in
+chunks.term_counts. Each chat/workflow corpus then gets an in-memory inverted
+index that is extended with only the chunks added since it was last seen, and
+rebuilt from the stored counts when chunks have been deleted.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+# Dense and lexical candidates considered for fusion, and the reciprocal rank constant
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_CACHE_MAX_ENTRIES = int(os.getenv("LEXICAL_CACHE_MAX_ENTRIES", "256"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keeps tickers, "7a", "10-k", "$1,234.5" and "12%" as single tokens
+_TOKEN_PATTERN = re.compile(r"\$?[a-z0-9]+(?:[-.,][a-z0-9]+)*%?")
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the this to was were which with
+what when where who how does did do their there these those our we you your i
+""".split())
+
+
+def tokenize(text):
+    """Lowercased tokens of a text, without stopwords."""
+    if not text:
+        return []
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def term_counts(text):
+    return Counter(tokenize(text))
+
+
+def encode_term_counts(text):
+    """Term counts of a chunk as the JSON stored in chunks.term_counts."""
+    return json.dumps(term_counts(text), separators=(",", ":"))
+
+
+def decode_term_counts(value):
+    if not value:
+        return {}
+    try:
+        return json.loads(value)
+    except ValueError:
+        return {}
+
+
+class LexicalIndex:
+    """Append-only BM25 inverted index over the chunks of one corpus."""
+
+    def __init__(self):
+        self.chunk_ids = []
+        self.lengths = []
+        self.postings = {}
+        self.max_chunk_id = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def add(self, chunk_id, term_counts):
+        position = len(self.chunk_ids)
+        self.chunk_ids.append(int(chunk_id))
+        length = 0
+        for term, count in term_counts.items():
+            positions, counts = self.postings.setdefault(term, ([], []))
+            positions.append(position)
+            counts.append(count)
+            length += count
+        self.lengths.append(length)
+        self._total_length += length
+        self.max_chunk_id = max(self.max_chunk_id, int(chunk_id))
+
+    def search(self, query, k, allowed_chunk_ids=None):
+        """
+        Top-k chunks by BM25 score.
+
+        Args:
+            query (str): The query text
+            k (int): Number of chunks to return
+            allowed_chunk_ids (numpy.ndarray, optional): Only rank these chunks
+
+        Returns:
+            tuple: (chunk ids, scores) as numpy arrays, best first
+        """
+        num_docs = len(self.chunk_ids)
+        terms = set(tokenize(query))
+        if not num_docs or not terms:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        lengths = np.asarray(self.lengths, dtype=np.float32)
+        average_length = self._total_length / num_docs or 1.0
+        scores = np.zeros(num_docs, dtype=np.float32)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            positions = np.asarray(posting[0], dtype=np.int64)
+            counts = np.asarray(posting[1], dtype=np.float32)
+            idf = math.log(1.0 + (num_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[positions] / average_length)
+            scores[positions] += idf * counts * (BM25_K1 + 1.0) / (counts + norm)
+
+        chunk_ids = np.asarray(self.chunk_ids, dtype=np.int64)
+        if allowed_chunk_ids is not None:
+            scores[~np.isin(chunk_ids, allowed_chunk_ids)] = 0.0
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return chunk_ids[matched], scores[matched]
+
+
+class LexicalIndexStore:
+    """
+    Per-process LRU of LexicalIndex objects keyed like the corpus cache.
+
+    `refresh` brings an index up to a corpus fingerprint (chunk count, max chunk id)
+    by loading only chunks with a higher id; if the counts do not add up
+    (chunks were deleted) the index is rebuilt from scratch. Chunks are loaded
+    outside the store's lock, which is only held to install or extend an entry.
+    """
+
+    def __init__(self, max_entries=LEXICAL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def refresh(self, key, fingerprint, load_rows_after):
+        """
+        Args:
+            key (tuple): Corpus key
+            fingerprint (tuple): Current (chunk count, max chunk id) of the corpus
+            load_rows_after (callable): Given a chunk id, returns rows (id, term_counts dict)
+                for the corpus' chunks with a greater id, ordered by id
+
+        Returns:
+            LexicalIndex: The up-to-date index
+        """
+        chunk_count, max_chunk_id = fingerprint
+
+        def is_current(index):
+            return index is not None and len(index) == chunk_count and index.max_chunk_id == max_chunk_id
+
+        # Rows are loaded without holding the lock, so building one large corpus
+        # does not block lexical retrieval on every other corpus
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                if is_current(index):
+                    return index
+                indexed = len(index)
+
+        if index is not None and indexed < chunk_count:
+            new_rows = load_rows_after(index.max_chunk_id)
+            with self._lock:
+                current = self._entries.get(key)
+                if is_current(current):
+                    return current
+                if current is index and len(index) == indexed and indexed + len(new_rows) == chunk_count:
+                    for chunk_id, term_counts in new_rows:
+                        index.add(chunk_id, term_counts)
+                    return index
+
+        rebuilt = LexicalIndex()
+        for chunk_id, term_counts in load_rows_after(0):
+            rebuilt.add(chunk_id, term_counts)
+        with self._lock:
+            current = self._entries.get(key)
+            if is_current(current):
+                return current
+            self._entries[key] = rebuilt
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return rebuilt
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def reciprocal_rank_fusion(rankings, k):
+    """
+    Fuse ranked lists of ids with reciprocal rank fusion (score = sum of 1 / (RRF_K + rank)).
+
+    Ties keep the order of the first ranking.
+
+    Returns:
+        list: Up to k ids, best first
+    """
+    scores = {}
+    first_seen = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (RRF_K + rank + 1)
+            first_seen.setdefault(item, len(first_seen))
+    return sorted(scores, key=lambda item: (-scores[item], first_seen[item]))[:k]
+
+
+lexical_index_store = LexicalIndexStore()
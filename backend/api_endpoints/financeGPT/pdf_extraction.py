@@ -0,0 +1,182 @@
+"""
+Parallel PDF text extraction.
+
+PyPDF2 text extraction is CPU-bound and single-threaded; a 300-page 10-K takes
+tens of seconds page by page. iter_pdf_pages() hands ranges of
+PDF_PAGES_PER_TASK pages to a shared process pool and yields the page texts in
+order as soon as each range is done, so consumers can start on the first pages
+while later ones are still being extracted. Short PDFs are extracted in-process.
+The pool's workers are spawned, never forked from the server process.
+
+parse_pdf() returns a ParsedDocument, so callers that need both the full text
+(for the documents table) and the pages (for page-numbered chunks) parse once.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+# PDFs with fewer pages are not worth the round trip to the pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn, not fork: forking a threaded server with torch models loaded can deadlock
+                # the children. Workers import only this module and PyPDF2 (plus the main
+                # script, which under `flask run` or a Ray worker is guarded by __main__ checks).
+                _executor = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _read_pdf_bytes(source):
+    # PDF bytes, a path, an uploaded FileStorage or a binary file object; streams
+    # are rewound so the caller can read them again
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+
+    stream = getattr(source, "stream", source)
+    position = stream.tell() if stream.seekable() else None
+    data = stream.read()
+    if position is not None:
+        stream.seek(position)
+    return data
+
+
+def _extract_page_range(data, start, end):
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_pdf_pages(source):
+    """
+    Yield the text of each page of a PDF, in page order.
+
+    Args:
+        source: PDF bytes, the path of a PDF file, an uploaded FileStorage or a binary file object
+
+    Yields:
+        str: Page text
+    """
+    data = _read_pdf_bytes(source)
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+
+    if page_count < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_WORKERS <= 1:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    try:
+        executor = _get_executor()
+        futures = [executor.submit(_extract_page_range, data, start, end) for start, end in ranges]
+    except (BrokenProcessPool, RuntimeError) as e:
+        print(f"[WARNING] PDF extraction pool unavailable, extracting in-process: {e}")
+        _reset_executor()
+        futures = []
+
+    try:
+        for i, (start, end) in enumerate(ranges):
+            pages = None
+            if i < len(futures):
+                try:
+                    pages = futures[i].result()
+                except BrokenProcessPool as e:
+                    print(f"[WARNING] PDF extraction pool failed, extracting in-process: {e}")
+                    _reset_executor()
+                    futures = futures[:i]
+            if pages is None:
+                pages = [reader.pages[page].extract_text() or "" for page in range(start, end)]
+            yield from pages
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def extract_pdf_pages(source):
+    """
+    Text of every page of a PDF, in page order.
+    """
+    return list(iter_pdf_pages(source))
+
+
+class ParsedDocument:
+    """
+    A document's page texts, parsed once.
+
+    `text` is the pages joined without separators, so page i spans
+    text[page_offsets[i]:page_offsets[i] + len(pages[i])], the same global
+    offsets ingest_document_chunks stores for page-numbered chunks.
+    """
+
+    __slots__ = ("name", "pages", "_text", "_page_offsets")
+
+    def __init__(self, name, pages):
+        self.name = name
+        self.pages = list(pages)
+        self._text = None
+        self._page_offsets = None
+
+    def __getstate__(self):
+        # The joined text is rebuilt on demand rather than shipped to Ray tasks
+        return {"name": self.name, "pages": self.pages}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], state["pages"])
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = "".join(self.pages)
+        return self._text
+
+    @property
+    def page_offsets(self):
+        if self._page_offsets is None:
+            offsets = []
+            offset = 0
+            for page in self.pages:
+                offsets.append(offset)
+                offset += len(page)
+            self._page_offsets = offsets
+        return self._page_offsets
+
+    @property
+    def page_count(self):
+        return len(self.pages)
+
+
+def parse_pdf(source, name=None):
+    """
+    Parse a PDF once into a ParsedDocument.
+
+    Args:
+        source: PDF bytes, the path of a PDF file, an uploaded FileStorage or a binary file object
+        name (str, optional): Document name. Defaults to the upload's filename or the path.
+    """
+    if name is None:
+        name = getattr(source, "filename", None) or (str(source) if isinstance(source, (str, os.PathLike)) else None)
+    return ParsedDocument(name, iter_pdf_pages(source))
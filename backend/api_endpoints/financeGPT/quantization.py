@@ -0,0 +1,147 @@
+"""
+Compact scoring tier for chunk embeddings.
+
+With EMBEDDING_QUANTIZATION set to "int8" or "binary", cached corpora hold only
+the quantized codes (4x / 32x smaller than float32). knn() scans the codes and
+the retrieval path rescores the best QUANTIZED_RERANK_CANDIDATES rows with the
+full-precision vectors read from the chunks table.
+"""
+import os
+
+import numpy as np
+
+from api_endpoints.financeGPT.embedding_format import quantize_embedding, decode_embedding_code
+
+# none | int8 | binary
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none").lower()
+QUANTIZED_RERANK_CANDIDATES = int(os.getenv("QUANTIZED_RERANK_CANDIDATES", "200"))
+
+QUANTIZATION_KINDS = ("int8", "binary")
+
+if EMBEDDING_QUANTIZATION not in QUANTIZATION_KINDS:
+    EMBEDDING_QUANTIZATION = None
+
+# Rows converted to float32 at a time when scoring int8 codes
+_SCORE_BLOCK_ROWS = 4096
+
+try:
+    _popcount = np.bitwise_count
+except AttributeError:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values]
+
+
+class QuantizedMatrix:
+    """
+    Quantized embeddings of a corpus, one row per chunk.
+
+    int8: `codes` is N x dimensions int8 and `scales` the per-row float32 scale.
+    binary: `codes` is N x ceil(dimensions / 8) packed sign bits.
+    """
+
+    __slots__ = ("kind", "codes", "scales", "dimensions")
+
+    def __init__(self, kind, codes, scales, dimensions):
+        self.kind = kind
+        self.codes = codes
+        self.scales = scales
+        self.dimensions = dimensions
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def shape(self):
+        return (len(self), self.dimensions)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def similarities(self, queries):
+        """
+        Approximate cosine similarity of unit-length queries (Q x dimensions) to every row.
+
+        int8 rows are dequantized block by block; binary rows are compared by
+        Hamming distance to the query sign bits, mapped to [-1, 1].
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.kind == "int8":
+            scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+            for start in range(0, len(self), _SCORE_BLOCK_ROWS):
+                block = self.codes[start:start + _SCORE_BLOCK_ROWS].astype(np.float32)
+                scores[:, start:start + len(block)] = (queries @ block.T) * self.scales[start:start + len(block)]
+            return scores
+
+        query_bits = np.packbits(queries > 0, axis=1)
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for i, bits in enumerate(query_bits):
+            hamming = _popcount(np.bitwise_xor(self.codes, bits)).sum(axis=1, dtype=np.int32)
+            scores[i] = 1.0 - 2.0 * hamming / self.dimensions
+        return scores
+
+    def subset(self, rows):
+        """QuantizedMatrix of the given rows only."""
+        return QuantizedMatrix(
+            kind=self.kind,
+            codes=self.codes[rows],
+            scales=self.scales[rows] if self.scales is not None else None,
+            dimensions=self.dimensions,
+        )
+
+    def vectors(self, rows):
+        """
+        Approximate float32 vectors of the given rows, for comparing candidates to each other.
+        """
+        if self.kind == "int8":
+            return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+        signs = np.unpackbits(self.codes[rows], axis=1)[:, :self.dimensions].astype(np.float32) * 2.0 - 1.0
+        return signs / np.sqrt(self.dimensions)
+
+
+def build_quantized_matrix(rows, kind, dimensions, decode):
+    """
+    Collect the codes of chunk rows into a QuantizedMatrix.
+
+    Rows carry either a stored `embedding_code` BLOB of the requested kind or,
+    for chunks written before codes existed, a full `embedding_vector` that is
+    quantized here.
+
+    Args:
+        rows (list): Dict rows with embedding_code and/or embedding_vector
+        kind (str): "int8" or "binary"
+        dimensions (int): Expected embedding dimensions
+        decode (callable): Turns an embedding_vector BLOB into a 1D numpy array
+
+    Returns:
+        tuple: (QuantizedMatrix or None, list of the rows that were usable)
+    """
+    codes = []
+    scales = []
+    kept = []
+    for row in rows:
+        decoded = decode_embedding_code(row.get("embedding_code"), kind)
+        if decoded is not None and decoded[2] == dimensions:
+            code, scale = decoded[0], decoded[1]
+        else:
+            vector = decode(row.get("embedding_vector"))
+            if vector is None or len(vector) != dimensions:
+                print(f"[WARNING] Skipping chunk {row['id']} with bad embedding dimensions")
+                continue
+            norm = np.linalg.norm(vector)
+            code, scale = quantize_embedding(vector / (norm if norm else 1.0), kind)
+        codes.append(code)
+        scales.append(scale)
+        kept.append(row)
+
+    if not kept:
+        return None, kept
+
+    return QuantizedMatrix(
+        kind=kind,
+        codes=np.ascontiguousarray(np.stack(codes)),
+        scales=np.asarray(scales, dtype=np.float32) if kind == "int8" else None,
+        dimensions=dimensions,
+    ), kept
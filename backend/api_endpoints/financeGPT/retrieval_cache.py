@@ -0,0 +1,321 @@
+"""
+Process-wide caches for the document retrieval path.
+
+The corpus cache keeps one contiguous, unit-normalized float32 embedding matrix
+(or, with EMBEDDING_QUANTIZATION enabled, its int8/binary codes) per chat or
+workflow so that repeated questions against the same documents do not re-read
+and re-decode every chunk BLOB from MySQL. The query embedding cache saves the
+model forward pass for questions that were already embedded, and the retrieval
+result cache (shared across workers) returns the resolved spans of identical
+retrievals against an unchanged corpus.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from api_endpoints.financeGPT.quantization import build_quantized_matrix
+from api_endpoints.financeGPT.shared_cache import SharedCache
+
+# Upper bounds for the corpus matrix cache (per process)
+CORPUS_CACHE_MAX_BYTES = int(os.getenv("CORPUS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CORPUS_CACHE_MAX_ENTRIES = int(os.getenv("CORPUS_CACHE_MAX_ENTRIES", "256"))
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+RETRIEVAL_CACHE_TTL_SECONDS = int(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def chat_corpus_key(chat_id):
+    return ("chat", int(chat_id))
+
+
+def workflow_corpus_key(workflow_id):
+    return ("workflow", int(workflow_id))
+
+
+class CorpusMatrix:
+    """
+    Embeddings and chunk metadata for one corpus, stored as parallel arrays.
+
+    Row i of `matrix` belongs to chunk `chunk_ids[i]`, which spans
+    `starts[i]:ends[i]` of document `document_ids[i]`. `document_names` and
+    `document_created` map document ids to their name and creation time. Quantized corpora
+    have `matrix` set to None and keep a QuantizedMatrix in `codes` instead.
+    """
+
+    __slots__ = (
+        "fingerprint", "chunk_ids", "matrix", "starts", "ends",
+        "document_ids", "page_numbers", "document_names", "codes", "document_created",
+    )
+
+    def __init__(self, fingerprint, chunk_ids, matrix, starts, ends, document_ids, page_numbers, document_names,
+                 codes=None, document_created=None):
+        self.fingerprint = fingerprint
+        self.chunk_ids = chunk_ids
+        self.matrix = matrix
+        self.starts = starts
+        self.ends = ends
+        self.document_ids = document_ids
+        self.page_numbers = page_numbers
+        self.document_names = document_names
+        self.codes = codes
+        self.document_created = document_created if document_created is not None else {}
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @property
+    def nbytes(self):
+        vectors = self.matrix if self.matrix is not None else self.codes
+        return (vectors.nbytes + self.chunk_ids.nbytes + self.starts.nbytes
+                + self.ends.nbytes + self.document_ids.nbytes + self.page_numbers.nbytes)
+
+
+def build_corpus_matrix(rows, fingerprint, dimensions, decode, quantization=None):
+    """
+    Build a CorpusMatrix from chunk rows.
+
+    Args:
+        rows (list): Dict rows with id, start_index, end_index, embedding_vector,
+            document_id, page_number, document_name and document_created
+        fingerprint (tuple): Corpus fingerprint the rows were read under
+        dimensions (int): Expected embedding dimensions
+        decode (callable): Turns an embedding BLOB into a 1D numpy array
+        quantization (str, optional): "int8" or "binary" to keep only compact codes
+            (rows may then carry an embedding_code BLOB instead of embedding_vector)
+
+    Returns:
+        CorpusMatrix: The corpus, or None if no row has a usable embedding
+    """
+    matrix = None
+    codes = None
+    if quantization:
+        codes, kept = build_quantized_matrix(rows, quantization, dimensions, decode)
+    else:
+        vectors = []
+        kept = []
+        for row in rows:
+            vector = decode(row["embedding_vector"])
+            if vector is None or len(vector) != dimensions:
+                print(f"[WARNING] Skipping chunk {row['id']} with bad embedding dimensions")
+                continue
+            vectors.append(vector)
+            kept.append(row)
+
+    if not kept:
+        return None
+
+    if not quantization:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+    document_names = {}
+    document_created = {}
+    for row in kept:
+        document_names[row["document_id"]] = row["document_name"]
+        document_created[row["document_id"]] = row.get("document_created")
+
+    return CorpusMatrix(
+        fingerprint=fingerprint,
+        chunk_ids=np.fromiter((row["id"] for row in kept), dtype=np.int64, count=len(kept)),
+        matrix=matrix,
+        starts=np.fromiter((row["start_index"] for row in kept), dtype=np.int64, count=len(kept)),
+        ends=np.fromiter((row["end_index"] for row in kept), dtype=np.int64, count=len(kept)),
+        document_ids=np.fromiter((row["document_id"] for row in kept), dtype=np.int64, count=len(kept)),
+        page_numbers=np.fromiter((row.get("page_number") or 0 for row in kept), dtype=np.int32, count=len(kept)),
+        document_names=document_names,
+        codes=codes,
+        document_created=document_created,
+    )
+
+
+class CorpusMatrixCache:
+    """
+    Thread-safe LRU cache of CorpusMatrix objects with an entry count and a byte budget.
+
+    Entries are validated against a fingerprint (chunk count, max chunk id) on
+    every lookup, because chunks are inserted by Ray workers in other processes
+    and never reach the explicit invalidation hooks of this one.
+    """
+
+    def __init__(self, max_bytes=CORPUS_CACHE_MAX_BYTES, max_entries=CORPUS_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, fingerprint):
+        with self._lock:
+            corpus = self._entries.get(key)
+            if corpus is None or corpus.fingerprint != fingerprint:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return corpus
+
+    def put(self, key, corpus):
+        if corpus is None or corpus.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = corpus
+            self._bytes += corpus.nbytes
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                oldest_key = next(iter(self._entries))
+                self._pop(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def invalidate_chat(self, chat_id):
+        if chat_id is None:
+            return
+        self.invalidate(chat_corpus_key(chat_id))
+
+    def invalidate_workflow(self, workflow_id):
+        if workflow_id is None:
+            return
+        self.invalidate(workflow_corpus_key(workflow_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _pop(self, key):
+        corpus = self._entries.pop(key, None)
+        if corpus is not None:
+            self._bytes -= corpus.nbytes
+        return corpus
+
+
+corpus_cache = CorpusMatrixCache()
+
+
+def normalize_query_text(text):
+    """Collapse whitespace and case so trivially re-worded queries share a cache entry."""
+    return _WHITESPACE.sub(" ", text or "").strip().casefold()
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU of query embeddings keyed by (model name, normalized query text).
+    """
+
+    def __init__(self, max_entries=QUERY_EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name, normalized_text):
+        key = (model_name, normalized_text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return list(embedding)
+
+    def put(self, model_name, normalized_text, embedding):
+        if self.max_entries <= 0:
+            return
+        key = (model_name, normalized_text)
+        with self._lock:
+            self._entries[key] = tuple(embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+query_embedding_cache = QueryEmbeddingCache()
+
+
+class RetrievalResultCache:
+    """
+    Resolved top-k spans keyed by (corpus, corpus version, normalized query, k, variant).
+
+    The corpus version is its fingerprint (chunk count, max chunk id), which changes
+    on every chunk insert or delete, so stale entries are never read and simply
+    expire. `variant` captures retrieval settings that change results (model,
+    hybrid fusion, quantization, ...).
+    """
+
+    def __init__(self, ttl_seconds=RETRIEVAL_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._store = SharedCache("retrieval")
+
+    def _key(self, corpus_key, version, query, k, variant):
+        kind, corpus_id = corpus_key
+        digest = hashlib.sha1(f"{variant}\x00{normalize_query_text(query)}".encode("utf-8")).hexdigest()
+        return f"{kind}:{corpus_id}:{version[0]}:{version[1]}:{k}:{digest}"
+
+    def get(self, corpus_key, version, query, k, variant=""):
+        if self.ttl_seconds <= 0:
+            return None
+        value = self._store.get(self._key(corpus_key, version, query, k, variant))
+        if value is None:
+            self._store.incr("misses")
+            return None
+        self._store.incr("hits")
+        return [tuple(source) for source in value]
+
+    def put(self, corpus_key, version, query, k, sources, variant=""):
+        if self.ttl_seconds <= 0:
+            return
+        self._store.set(self._key(corpus_key, version, query, k, variant),
+                        [list(source) for source in sources], ttl_seconds=self.ttl_seconds)
+
+    def stats(self):
+        hits = self._store.counter("hits")
+        misses = self._store.counter("misses")
+        lookups = hits + misses
+        return {
+            "backend": self._store.backend,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+retrieval_result_cache = RetrievalResultCache()
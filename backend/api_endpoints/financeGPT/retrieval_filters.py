@@ -0,0 +1,190 @@
+"""
+Metadata filters for chunk retrieval.
+
+A RetrievalFilter restricts a search to some documents (by id, name or creation
+time) and/or a page range. It is evaluated as a boolean mask over the rows of a
+cached CorpusMatrix, so only the matching rows are scored.
+"""
+import datetime
+import os
+import re
+
+import numpy as np
+
+from api_endpoints.financeGPT.lexical_index import tokenize
+
+_NAME_SEPARATORS = re.compile(r"[_\s]+")
+
+
+def _parse_time(value, name):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date or datetime, got {value!r}")
+    # documents.created is read back as a naive UTC timestamp
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_page(value, name):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a page number, got {value!r}")
+
+
+class RetrievalFilter:
+    """
+    Restricts retrieval to matching chunks.
+
+    Document ids and names select documents (a document matching either is kept);
+    names match case-insensitively as substrings of the document name. Creation
+    times and the page range further narrow that selection. Unset fields do not
+    filter.
+    """
+
+    __slots__ = ("document_ids", "document_names", "page_start", "page_end", "created_after", "created_before")
+
+    def __init__(self, document_ids=None, document_names=None, page_start=None, page_end=None,
+                 created_after=None, created_before=None):
+        self.document_ids = frozenset(int(doc_id) for doc_id in document_ids or ())
+        self.document_names = tuple(str(name).casefold() for name in document_names or () if str(name).strip())
+        self.page_start = _parse_page(page_start, "page_start")
+        self.page_end = _parse_page(page_end, "page_end")
+        self.created_after = _parse_time(created_after, "created_after")
+        self.created_before = _parse_time(created_before, "created_before")
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a filter from request/tool arguments, or return None if nothing is set.
+
+        Raises:
+            ValueError: If a value cannot be parsed
+        """
+        if not data:
+            return None
+        if isinstance(data, RetrievalFilter):
+            return data if not data.is_empty() else None
+        document_ids = data.get("document_ids")
+        document_names = data.get("document_names")
+        if isinstance(document_ids, (int, str)):
+            document_ids = [document_ids]
+        if isinstance(document_names, str):
+            document_names = [document_names]
+        retrieval_filter = cls(
+            document_ids=document_ids,
+            document_names=document_names,
+            page_start=data.get("page_start"),
+            page_end=data.get("page_end"),
+            created_after=data.get("created_after"),
+            created_before=data.get("created_before"),
+        )
+        return None if retrieval_filter.is_empty() else retrieval_filter
+
+    def is_empty(self):
+        return not (self.document_ids or self.document_names or self.page_start is not None
+                    or self.page_end is not None or self.created_after or self.created_before)
+
+    def cache_key(self):
+        """Stable string form, part of the retrieval result cache key."""
+        return "|".join([
+            ",".join(str(doc_id) for doc_id in sorted(self.document_ids)),
+            ",".join(sorted(self.document_names)),
+            str(self.page_start), str(self.page_end),
+            self.created_after.isoformat() if self.created_after else "",
+            self.created_before.isoformat() if self.created_before else "",
+        ])
+
+    def _matches_document(self, doc_id, name, created):
+        if self.document_ids or self.document_names:
+            folded = (name or "").casefold()
+            if doc_id not in self.document_ids and not any(part in folded for part in self.document_names):
+                return False
+        if self.created_after and (created is None or created < self.created_after):
+            return False
+        if self.created_before and (created is None or created > self.created_before):
+            return False
+        return True
+
+    def mask(self, corpus):
+        """
+        Boolean mask over the rows of a CorpusMatrix.
+
+        Document conditions are evaluated once per document, then expanded to
+        rows with a single vectorized membership test.
+        """
+        mask = np.ones(len(corpus), dtype=bool)
+        if self.document_ids or self.document_names or self.created_after or self.created_before:
+            kept_documents = [
+                doc_id for doc_id, name in corpus.document_names.items()
+                if self._matches_document(doc_id, name, corpus.document_created.get(doc_id))
+            ]
+            mask &= np.isin(corpus.document_ids, np.asarray(kept_documents, dtype=np.int64))
+        if self.page_start is not None:
+            mask &= corpus.page_numbers >= self.page_start
+        if self.page_end is not None:
+            mask &= corpus.page_numbers <= self.page_end
+        return mask
+
+
+# Terms that can single out a document by name: fiscal years, SEC form types and quarters
+_YEAR = re.compile(r"(?:fy)?((?:19|20)\d{2})")
+_FORM_TYPE = re.compile(r"10-?[kq]|8-?k|6-?k|20-?f|40-?f|s-?[14]|def-?14a")
+_QUARTER = re.compile(r"q[1-4]")
+# Tickers count only when written in capitals in the question, e.g. "AAPL"
+_TICKER = re.compile(r"\b[A-Z]{2,5}\b")
+
+
+def _canonical_selector(term):
+    # Year, form type or quarter in one spelling ("fy2023" -> "2023", "10-k" -> "10k"), else None
+    year = _YEAR.fullmatch(term)
+    if year:
+        return year.group(1)
+    if _FORM_TYPE.fullmatch(term) or _QUARTER.fullmatch(term):
+        return term.replace("-", "")
+    return None
+
+
+def _name_tokens(document_name):
+    stem = os.path.splitext(document_name or "")[0]
+    return {_canonical_selector(token) or token for token in tokenize(_NAME_SEPARATORS.sub(" ", stem))}
+
+
+def documents_named_in_query(query, documents):
+    """
+    Ids of the documents a query singles out by name, e.g. "the 2023 10-K".
+
+    Only discriminating query terms are selectors: years, SEC form types,
+    quarters and tickers written in capitals. A selector must appear in some but
+    not all document names; documents whose name has any selector are returned.
+    Ordinary words never select, so "what risks does the company face?" does not
+    narrow retrieval to company_overview.pdf. Returns an empty list when the
+    query does not discriminate between the documents.
+
+    Args:
+        query (str): The user question
+        documents (list): Dicts with id and document_name
+
+    Returns:
+        list: Selected document ids
+    """
+    if len(documents) < 2:
+        return []
+
+    tickers = {ticker.lower() for ticker in _TICKER.findall(query or "")}
+    terms = {_canonical_selector(term) or (term if term in tickers else None) for term in tokenize(query)}
+    terms.discard(None)
+
+    names = {doc["id"]: _name_tokens(doc["document_name"]) for doc in documents}
+    selectors = {term for term in terms if 0 < sum(term in tokens for tokens in names.values()) < len(names)}
+    if not selectors:
+        return []
+    return [doc_id for doc_id, tokens in names.items() if tokens & selectors]
@@ -0,0 +1,149 @@
+"""
+Key/value store shared by all Flask workers through Redis (REDIS_HOST / REDIS_PORT),
+falling back to an in-process TTL dict when Redis is not configured or unreachable.
+
+Values are JSON-serialisable objects. Counters are kept in the same store so hit
+rates reflect every worker, not just the one serving the stats request.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+REDIS_HOST = os.getenv("REDIS_HOST")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "4096"))
+
+# After a failed connection, wait this long before trying Redis again
+_REDIS_RETRY_SECONDS = 30
+
+_redis_client = None
+_redis_failed_at = None
+_redis_lock = threading.Lock()
+
+
+def get_redis_client():
+    """
+    Return a connected Redis client, or None if Redis is not available.
+    """
+    global _redis_client, _redis_failed_at
+
+    if redis is None or not REDIS_HOST:
+        return None
+    if _redis_client is not None:
+        return _redis_client
+    if _redis_failed_at is not None and time.time() - _redis_failed_at < _REDIS_RETRY_SECONDS:
+        return None
+
+    with _redis_lock:
+        if _redis_client is None:
+            try:
+                client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, socket_timeout=0.5, socket_connect_timeout=0.5)
+                client.ping()
+                _redis_client = client
+                _redis_failed_at = None
+            except Exception as e:
+                print(f"[WARNING] Redis unavailable at {REDIS_HOST}:{REDIS_PORT}, using in-process cache: {e}")
+                _redis_failed_at = time.time()
+    return _redis_client
+
+
+def _redis_error(e):
+    global _redis_client, _redis_failed_at
+    print(f"[WARNING] Redis error, falling back to in-process cache: {e}")
+    _redis_client = None
+    _redis_failed_at = time.time()
+
+
+class SharedCache:
+    """
+    Namespaced JSON cache with TTLs and counters, backed by Redis or a local LRU.
+    """
+
+    def __init__(self, namespace, max_local_entries=LOCAL_CACHE_MAX_ENTRIES):
+        self.namespace = namespace
+        self.max_local_entries = max_local_entries
+        self._local = OrderedDict()
+        self._local_counters = {}
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                value = client.get(self._key(key))
+                return json.loads(value) if value is not None else None
+            except Exception as e:
+                _redis_error(e)
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                client.set(self._key(key), json.dumps(value), ex=ttl_seconds)
+                return
+            except Exception as e:
+                _redis_error(e)
+
+        with self._lock:
+            expires_at = time.time() + ttl_seconds if ttl_seconds else None
+            self._local[key] = (expires_at, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+    def delete(self, key):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                client.delete(self._key(key))
+            except Exception as e:
+                _redis_error(e)
+        with self._lock:
+            self._local.pop(key, None)
+
+    def incr(self, counter, amount=1):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                return client.incrby(self._key(f"counter:{counter}"), amount)
+            except Exception as e:
+                _redis_error(e)
+        with self._lock:
+            self._local_counters[counter] = self._local_counters.get(counter, 0) + amount
+            return self._local_counters[counter]
+
+    def counter(self, counter):
+        client = get_redis_client()
+        if client is not None:
+            try:
+                value = client.get(self._key(f"counter:{counter}"))
+                return int(value) if value is not None else 0
+            except Exception as e:
+                _redis_error(e)
+        with self._lock:
+            return self._local_counters.get(counter, 0)
+
+    @property
+    def backend(self):
+        return "redis" if get_redis_client() is not None else "local"
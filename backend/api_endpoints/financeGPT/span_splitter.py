@@ -0,0 +1,123 @@
+"""
+Recursive character splitting that reports where each chunk is in the text.
+
+SpanTextSplitter produces the same chunks as LangChain's
+RecursiveCharacterTextSplitter (separators kept at the start of the following
+piece, whitespace stripped), but works on (start, end) offsets into the
+original text instead of copies of it. Callers get chunk offsets directly,
+without searching the text for each chunk, which is quadratic with overlapping
+chunks and returns the wrong occurrence for repeated boilerplate.
+"""
+from collections import deque
+
+
+class SpanTextSplitter:
+    """
+    Split text into chunks of at most chunk_size characters, preferring the
+    earliest separator in `separators` that occurs in the text, with up to
+    chunk_overlap characters shared between consecutive chunks.
+    """
+
+    def __init__(self, chunk_size, chunk_overlap, separators):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Chunk overlap ({chunk_overlap}) is larger than the chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+
+    def iter_spans(self, text, start=0, end=None):
+        """
+        Chunk text[start:end] lazily.
+
+        Yields:
+            tuple: (start, end) offsets into `text` of each chunk, in order
+        """
+        if end is None:
+            end = len(text)
+        return self._split(text, start, end, self.separators)
+
+    def split_spans(self, text, start=0, end=None):
+        """
+        Chunk text[start:end].
+
+        Returns:
+            list: (start, end) offsets into `text` of each chunk, in order
+        """
+        return list(self.iter_spans(text, start, end))
+
+    def split_text(self, text):
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def _split(self, text, start, end, separators):
+        separator = separators[-1]
+        remaining_separators = []
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                remaining_separators = separators[i + 1:]
+                break
+
+        small_pieces = []
+        for piece in self._pieces(text, start, end, separator):
+            if piece[1] - piece[0] < self.chunk_size:
+                small_pieces.append(piece)
+                continue
+            if small_pieces:
+                yield from self._merge(text, small_pieces)
+                small_pieces = []
+            if remaining_separators:
+                yield from self._split(text, piece[0], piece[1], remaining_separators)
+            else:
+                yield piece
+        if small_pieces:
+            yield from self._merge(text, small_pieces)
+
+    @staticmethod
+    def _pieces(text, start, end, separator):
+        # Pieces start at each occurrence of the separator
+        if not separator:
+            return [(i, i + 1) for i in range(start, end)]
+
+        pieces = []
+        piece_start = start
+        position = text.find(separator, start, end)
+        while position != -1:
+            if position > piece_start:
+                pieces.append((piece_start, position))
+            piece_start = position
+            position = text.find(separator, position + len(separator), end)
+        if end > piece_start:
+            pieces.append((piece_start, end))
+        return pieces
+
+    def _merge(self, text, pieces):
+        # Combine consecutive small pieces into chunks, carrying up to chunk_overlap characters over
+        current = deque()
+        total = 0
+        for piece in pieces:
+            length = piece[1] - piece[0]
+            if total + length > self.chunk_size and current:
+                chunk = _strip(text, current[0][0], current[-1][1])
+                if chunk is not None:
+                    yield chunk
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    first = current.popleft()
+                    total -= first[1] - first[0]
+            current.append(piece)
+            total += length
+
+        if current:
+            chunk = _strip(text, current[0][0], current[-1][1])
+            if chunk is not None:
+                yield chunk
+
+
+def _strip(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if end > start else None
@@ -1,7 +1,5 @@
 from flask import Flask, request, jsonify, Response, abort, redirect, stream_with_context, Blueprint
 from flask_cors import CORS, cross_origin
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import pandas as pd
 #from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
@@ -45,6 +43,7 @@ import click
 import threading
 import time
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from fpdf import FPDF
 import openai
 import shutil
@@ -80,7 +79,13 @@ from api_endpoints.financeGPT.chatbot_endpoints import add_prompt_to_workflow_db
     retrieve_chats_from_db, delete_chat_from_db, retrieve_message_from_db, retrieve_docs_from_db, add_sources_to_db, delete_doc_from_db, reset_chat_db, \
     change_chat_mode_db, update_chat_name_db, find_most_recent_chat_from_db, process_prompt_answer, \
     ensure_SDK_user_exists, get_chat_info, ensure_demo_user_exists, get_message_info, get_text_from_url, \
-    add_organization_to_db, get_organization_from_db, update_workflow_name_db, retrieve_messages_from_share_uuid
+    add_organization_to_db, get_organization_from_db, update_workflow_name_db, retrieve_messages_from_share_uuid, \
+    migrate_legacy_embeddings, start_embedding_migration, get_retrieval_cache_stats, get_relevant_chunks_batch, \
+    lookup_cached_answer, store_cached_answer, add_document_to_wfs_db
+from api_endpoints.financeGPT.pdf_extraction import parse_pdf
+from api_endpoints.financeGPT.retrieval_cache import chat_corpus_key, workflow_corpus_key
+from api_endpoints.financeGPT.ingestion_jobs import create_ingestion_job, existing_ingestion_job, get_ingestion_job, \
+    fail_ingestion_job, FINISHED_JOB_STATUSES, INGEST_JOB_POLL_SECONDS, INGEST_JOB_STREAM_SECONDS
 
 from agents.reactive_agent import ReactiveDocumentAgent, WorkflowReactiveAgent
 from agents.config import AgentConfig
@@ -184,6 +189,17 @@ stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
 ensure_ray_started()
 
+# Rewrite legacy float64 chunk embeddings to float32 in the background
+if os.getenv("EMBEDDING_MIGRATION_ON_STARTUP", "false").lower() == "true":
+    start_embedding_migration()
+
+@app.cli.command("migrate-embeddings")
+@click.option("--batch-size", type=int, default=None, help="Rows rewritten per transaction")
+def migrate_embeddings_command(batch_size):
+    """Rewrite legacy float64 chunk embeddings in the versioned float32 format."""
+    migrated = migrate_legacy_embeddings(batch_size=batch_size)
+    click.echo(f"Migrated {migrated} embeddings")
+
 def valid_api_key_required(fn):
   @wraps(fn)
   def wrapper(*args, **kwargs):
@@ -249,6 +265,11 @@ def import_shared_chat(playbook_url):
 def health_check():
     return "Healthy", 200
 
+@app.route('/retrieval-stats', methods=['GET'])
+@valid_api_key_required
+def retrieval_stats():
+    return jsonify(get_retrieval_cache_stats()), 200
+
 # Auth
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"  #this is to set our environment to https because OAuth 2.0 only supports https environments
 
@@ -808,6 +829,127 @@ def find_most_recent_chat():
     return jsonify(chat_info=chat_info)
 
 
+def _tika_page_count(parsed):
+    # Tika reports a PDF's page count as xmpTPg:NPages; other formats count as one page
+    pages = (parsed.get("metadata") or {}).get("xmpTPg:NPages", 1)
+    if isinstance(pages, list):
+        pages = pages[0]
+    try:
+        return int(pages)
+    except (TypeError, ValueError):
+        return 1
+
+def _queue_ingestion(text, max_chunk_size, doc_id, doesExist, document_name, pages=1):
+    """
+    Create the ingestion job for an uploaded document and start chunking it in the background.
+
+    A document that needs no chunking gets its latest job, or one that is completed from the start.
+
+    Returns:
+        dict: job_id, document_id, document_name and status, for the upload response
+    """
+    if doc_id is None:
+        # Guest sessions keep no documents
+        return {"job_id": None, "document_id": None, "document_name": document_name, "status": "skipped"}
+    if doesExist:
+        job_id, status = existing_ingestion_job(doc_id, pages)
+    else:
+        job_id = create_ingestion_job(doc_id, pages)
+        try:
+            chunk_document.remote(text, max_chunk_size, doc_id, job_id)
+        except Exception as e:
+            fail_ingestion_job(job_id, e)
+            raise
+        status = "queued"
+    return {"job_id": job_id, "document_id": doc_id, "document_name": document_name, "status": status}
+
+# Uploaded files and URLs parsed at once across all SDK uploads; chunking itself
+# runs in Ray tasks that share the embedding pool (see embedding_pool)
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+_upload_executor = ThreadPoolExecutor(max_workers=max(UPLOAD_CONCURRENCY, 1), thread_name_prefix="upload")
+
+def _ingest_uploaded_file(file, chat_id, max_chunk_size):
+    result = p.from_buffer(file)
+    text = (result["content"] or "").strip()
+    doc_id, doesExist = add_document_to_db(text, file.filename, chat_id=chat_id)
+    return _queue_ingestion(text, max_chunk_size, doc_id, doesExist, file.filename, _tika_page_count(result))
+
+def _ingest_uploaded_url(path, chat_id, max_chunk_size):
+    text = get_text_from_url(path)
+    doc_id, doesExist = add_document_to_db(text, path, chat_id=chat_id)
+    return _queue_ingestion(text, max_chunk_size, doc_id, doesExist, path)
+
+def _ingest_uploads(files, paths, chat_id, max_chunk_size):
+    """
+    Parse uploaded files and URLs and queue their ingestion, UPLOAD_CONCURRENCY at a time.
+
+    A file or URL that fails does not fail the others; its entry has status
+    "failed" and the error.
+
+    Returns:
+        list: One _queue_ingestion entry per file and URL, in upload order
+    """
+    uploads = [(file.filename, _upload_executor.submit(_ingest_uploaded_file, file, chat_id, max_chunk_size))
+               for file in files]
+    uploads += [(path, _upload_executor.submit(_ingest_uploaded_url, path, chat_id, max_chunk_size))
+                for path in paths]
+
+    jobs = []
+    for document_name, future in uploads:
+        try:
+            jobs.append(future.result())
+        except Exception as e:
+            print(f"[ERROR] Failed to ingest {document_name}: {e}")
+            jobs.append({"job_id": None, "document_id": None, "document_name": document_name,
+                         "status": "failed", "error": str(e)})
+    return jobs
+
+def _ingestion_job_events(job_id, user_email):
+    """
+    SSE events with the job's state whenever it changes, until it completes or fails,
+    or a "timeout" event after INGEST_JOB_STREAM_SECONDS
+    """
+    last = None
+    deadline = time.monotonic() + INGEST_JOB_STREAM_SECONDS
+    while True:
+        job = get_ingestion_job(job_id, user_email)
+        if job is None:
+            yield f"data: {json.dumps({'type': 'error', 'job_id': job_id, 'error': 'Ingestion job not found'})}\n\n"
+            return
+
+        state = (job["status"], job["chunks_embedded"], job["rows_inserted"])
+        if state != last:
+            last = state
+            yield f"data: {json.dumps({'type': 'progress', **job})}\n\n"
+        if job["status"] in FINISHED_JOB_STATUSES:
+            yield f"data: {json.dumps({'type': job['status'], **job})}\n\n"
+            return
+        if time.monotonic() >= deadline:
+            yield f"data: {json.dumps({'type': 'timeout', **job})}\n\n"
+            return
+        time.sleep(INGEST_JOB_POLL_SECONDS)
+
+@app.route('/ingestion-jobs/<job_id>', methods=['GET'])
+def ingestion_job_status(job_id):
+    try:
+        user_email = extractUserEmailFromRequest(request)
+    except InvalidTokenError:
+        return jsonify({"error": "Invalid JWT"}), 401
+
+    job = get_ingestion_job(job_id, user_email)
+    if job is None:
+        return jsonify({"error": "Ingestion job not found"}), 404
+    return jsonify(job), 200
+
+@app.route('/ingestion-jobs/<job_id>/events', methods=['GET'])
+def ingestion_job_events(job_id):
+    try:
+        user_email = extractUserEmailFromRequest(request)
+    except InvalidTokenError:
+        return jsonify({"error": "Invalid JWT"}), 401
+
+    return Response(stream_with_context(_ingestion_job_events(job_id, user_email)), mimetype="text/event-stream")
+
 @app.route('/ingest-pdf', methods=['POST'])
 def ingest_pdfs():
     try:
@@ -825,6 +967,7 @@ def ingest_pdfs():
     MAX_CHUNK_SIZE = 1000
 
     print("before files loop time is", datetime.now() - start_time)
+    jobs = []
     for file in files:
         #text = get_text_from_single_file(file)
         #text_pages = get_text_pages_from_single_file(file)
@@ -836,11 +979,10 @@ def ingest_pdfs():
 
         doc_id, doesExist = add_document_to_db(text, filename, chat_id=chat_id)
 
-        if not doesExist:
-            chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
+        jobs.append(_queue_ingestion(text, MAX_CHUNK_SIZE, doc_id, doesExist, filename, _tika_page_count(result)))
 
 
-    return jsonify({"Success": "Document Uploaded"}), 200
+    return jsonify({"Success": "Document Uploaded", "jobs": jobs}), 200
 
 
     #return text, filename
@@ -856,17 +998,16 @@ def ingest_pdfs_wf():
 
     MAX_CHUNK_SIZE = 1000
 
+    jobs = []
     for file in files:
-        text = get_text_from_single_file(file)
-        text_pages = get_text_pages_from_single_file(file)
+        # One parse gives both the text stored with the document and the pages to chunk
+        document = parse_pdf(file)
         filename = file.filename
 
-        text
-        doc_id, doesExist = add_document_to_db(text, filename, workflow_id)
+        doc_id, doesExist = add_document_to_wfs_db(document, filename, workflow_id)
 
-        if not doesExist:
-            chunk_document.remote(text_pages, MAX_CHUNK_SIZE, doc_id)
-    return text, filename
+        jobs.append(_queue_ingestion(document, MAX_CHUNK_SIZE, doc_id, doesExist, filename, document.page_count))
+    return jsonify({"Success": "Document Uploaded", "jobs": jobs}), 200
 
 @app.route('/retrieve-current-docs', methods=['POST'])
 def retrieve_current_docs():
@@ -967,6 +1108,11 @@ def process_message_pdf():
             # Process the query using the reactive agent
             if not user_email or not isinstance(user_email, str):
                 return jsonify({"error": "User email is missing or invalid"}), 401
+
+            # A paraphrase of an answered question about unchanged documents skips the agent
+            hit, cache_key = lookup_cached_answer(message.strip(), chat_id, user_email, model_type, model_key)
+            if hit is not None:
+                return Response(_stream_cached_answer(message.strip(), chat_id, hit), status=200)
             
             result = agent.process_query_stream(message.strip(), chat_id, user_email)
             def generate():
@@ -981,6 +1127,10 @@ def process_message_pdf():
                         else:
                             chunk_data = chunk
 
+                        if isinstance(chunk_data, dict) and chunk_data.get("type") == "response-complete":
+                            store_cached_answer(message.strip(), cache_key, model_type, model_key,
+                                                chunk_data.get("answer"), chunk_data.get("sources"))
+
                         json_data = json.dumps(chunk_data, cls=CustomJSONEncoder)
                         yield f"data: {json_data}\n\n"
                         print(f"Streamed chunk: {chunk}")
@@ -1008,10 +1158,37 @@ def process_message_pdf():
         # Agents disabled, use original implementation
         return _process_message_pdf_fallback(message, chat_id, model_type, model_key, user_email)
 
+def _record_cached_answer(query, chat_id, hit):
+    """Save a question answered from the semantic answer cache to the chat history"""
+    add_message_to_db(query, chat_id, 1)
+    message_id = add_message_to_db(hit["answer"], chat_id, 0)
+
+    try:
+        add_sources_to_db(message_id, hit["sources"])
+    except:
+        print("no sources")
+
+    return message_id
+
+def _stream_cached_answer(query, chat_id, hit):
+    """SSE events for an answer served from the semantic answer cache, flagged with cached=True"""
+    cache_info = {"cached": True, "similarity": hit["similarity"], "cached_question": hit["question"]}
+
+    yield f"data: {json.dumps({'type': 'start', 'message': 'Processing your query...', 'timestamp': time.time(), **cache_info})}\n\n"
+    yield f"data: {json.dumps({'type': 'complete', 'answer': hit['answer'], 'sources': hit['sources'], 'thought': 'Answered from cache: a similar question was already answered for these documents', 'timestamp': time.time(), **cache_info})}\n\n"
+
+    message_id = _record_cached_answer(query, chat_id, hit)
+    yield f"data: {json.dumps({'type': 'response-complete', 'answer': hit['answer'], 'message_id': message_id, 'sources': hit['sources'], 'message': 'Response served from cache', 'timestamp': time.time(), **cache_info})}\n\n"
+
 def _process_message_pdf_fallback(message, chat_id, model_type, model_key, user_email):
     """Fallback implementation using the original direct LLM approach without the ReActive Agent"""
     query = message.strip()
 
+    hit, cache_key = lookup_cached_answer(query, chat_id, user_email, model_type, model_key)
+    if hit is not None:
+        _record_cached_answer(query, chat_id, hit)
+        return jsonify(answer=hit["answer"], cached=True)
+
     #This adds user message to db
     add_message_to_db(query, chat_id, 1)
 
@@ -1065,6 +1242,8 @@ def _process_message_pdf_fallback(message, chat_id, model_type, model_key, user_
         )
         answer = completion.completion
 
+    store_cached_answer(query, cache_key, model_type, model_key, answer, sources)
+
     #This adds bot message
     message_id = add_message_to_db(answer, chat_id, 0)
 
@@ -1274,11 +1453,9 @@ def process_ticker_info():
         print("test1")
         doc_id, doesExist = add_document_to_db(text, filename, chat_id)
 
-        if not doesExist:
-            print("test")
-            chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-            #remote_task = chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-            #result = ray.get(remote_task)
+        job = _queue_ingestion(text, MAX_CHUNK_SIZE, doc_id, doesExist, filename)
+        #remote_task = chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
+        #result = ray.get(remote_task)
 
         #if os.path.exists(filename):
         #    os.remove(filename)
@@ -1286,6 +1463,7 @@ def process_ticker_info():
         #else:
         #    print(f"The file '{filename}' does not exist.")
 
+        return jsonify({"Success": "Ticker Uploaded", "jobs": [job]}), 200
 
     return jsonify({"error": "Invalid JWT"}), 200
 
@@ -1411,17 +1589,20 @@ def generate_financial_report():
             process_ticker_info_wf(user_email, workflowId, ticker)
             print("SUCCESSFULLY PROCESSED TICKER")
 
+            # Retrieve sources for every question with one embedding call and one corpus scan
+            sources_per_question = get_relevant_chunks_batch(2, questions, workflow_corpus_key(workflowId), user_email)
+
             # Including Q&A in PDF
-            for question in questions:
+            for question, sources in zip(questions, sources_per_question):
                 print(f"Processing question: {question}")
                 try:
                     # Use workflow reactive agent for processing
                     workflow_agent = WorkflowReactiveAgent()
-                    answer = workflow_agent.process_workflow_query(question, workflowId, user_email)
+                    answer = workflow_agent.process_workflow_query(question, workflowId, user_email, sources=sources)
                 except Exception as e:
                     print(f"Workflow agent failed, using fallback: {e}")
                     # Fallback to original process_prompt_answer
-                    answer = process_prompt_answer(question, workflowId, user_email)
+                    answer = process_prompt_answer(question, workflowId, user_email, sources=sources)
                 
                 print("Successfully processed answer")
                 answer_encoded = answer.encode('latin-1', 'replace').decode('latin-1')
@@ -1522,29 +1703,8 @@ def upload():
         #Ingest pdf
         MAX_CHUNK_SIZE = 1000
 
-        for file in files:
-            print("file is here")
-            result = p.from_buffer(file)
-            text = result["content"].strip()
-
-            filename = file.filename
-
-            doc_id, doesExist = add_document_to_db(text, filename, chat_id=chat_id)
-
-            if not doesExist:
-                #chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-                result_id = chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-                result = ray.get(result_id)
-        for path in paths:
-
-            text = get_text_from_url(path)
-
-            doc_id, doesExist = add_document_to_db(text, path, chat_id=chat_id)
-
-            if not doesExist:
-                #chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-                result_id = chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-                result = ray.get(result_id)
+        # Chunking runs in the background; clients follow the returned jobs
+        jobs = _ingest_uploads(files, paths, chat_id, MAX_CHUNK_SIZE)
     elif chat_type == "edgar": #edgar
         print("ticker")
         ticker = request.form.getlist('ticker')[0]
@@ -1556,6 +1716,7 @@ def upload():
         chat_number = 0 if chat_type == "documents" else 1 if chat_type == "edgar" else None
         chat_id = add_chat_to_db(user_email, chat_number, model_number)
 
+        jobs = []
         if ticker:
             MAX_CHUNK_SIZE = 1000
 
@@ -1570,16 +1731,26 @@ def upload():
             print("test1")
             doc_id, doesExist = add_document_to_db(text, filename, chat_id)
 
-            if not doesExist:
-                #print("test")
-                #chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-                result_id = chunk_document.remote(text, MAX_CHUNK_SIZE, doc_id)
-                
-                result = ray.get(result_id)
+            jobs.append(_queue_ingestion(text, MAX_CHUNK_SIZE, doc_id, doesExist, filename))
     else:
         return jsonify({"id": "Please enter a valid task type"}), 400
 
-    return jsonify({"id": chat_id}), 200
+    return jsonify({"id": chat_id, "jobs": jobs}), 200
+
+
+@app.route('/public/ingestion-jobs/<job_id>', methods=['GET'])
+@valid_api_key_required
+def public_ingestion_job_status(job_id):
+    job = get_ingestion_job(job_id, USER_EMAIL_API)
+    if job is None:
+        return jsonify({"error": "Ingestion job not found"}), 404
+    return jsonify(job), 200
+
+
+@app.route('/public/ingestion-jobs/<job_id>/events', methods=['GET'])
+@valid_api_key_required
+def public_ingestion_job_events(job_id):
+    return Response(stream_with_context(_ingestion_job_events(job_id, USER_EMAIL_API)), mimetype="text/event-stream")
 
 
 @app.route('/public/chat', methods=['POST'])
@@ -1596,9 +1767,17 @@ def public_ingest_pdf():
 
     if AgentConfig.is_agent_enabled():
         try:
+            hit, cache_key = lookup_cached_answer(message.strip(), chat_id, user_email, model_type, model_key)
+            if hit is not None:
+                message_id = _record_cached_answer(message.strip(), chat_id, hit)
+                sources_swapped = [[str(elem) for elem in source[::-1]] for source in hit["sources"]]
+                return jsonify(message_id=message_id, answer=hit["answer"], sources=sources_swapped, cached=True)
+
             # Use reactive agent for public API
             agent = ReactiveDocumentAgent(model_type=model_type, model_key=model_key)
             result = agent.process_query(message.strip(), chat_id, user_email)
+            store_cached_answer(message.strip(), cache_key, model_type, model_key,
+                                result.get("answer"), result.get("sources"))
             
             # Format sources for compatibility
             sources_swapped = [[str(elem) for elem in source[::-1]] for source in result.get("sources", [])]
@@ -1620,15 +1799,22 @@ def public_ingest_pdf():
         # Agents disabled, use original implementation
         return _public_chat_fallback(message, chat_id, model_type, model_key, user_email)
 
-def _public_chat_fallback(message, chat_id, model_type, model_key, user_email):
+def _public_chat_fallback(message, chat_id, model_type, model_key, user_email, sources=None):
     """Fallback implementation for public chat API"""
     query = message.strip()
 
+    hit, cache_key = lookup_cached_answer(query, chat_id, user_email, model_type, model_key)
+    if hit is not None:
+        message_id = _record_cached_answer(query, chat_id, hit)
+        sources_swapped = [[str(elem) for elem in source[::-1]] for source in hit["sources"]]
+        return jsonify(message_id=message_id, answer=hit["answer"], sources=sources_swapped, cached=True)
+
     #This adds user message to db
     add_message_to_db(query, chat_id, 1)
 
-    #Get most relevant section from the document
-    sources = get_relevant_chunks(2, query, chat_id, user_email)
+    #Get most relevant section from the document, unless retrieved in a batch beforehand
+    if sources is None:
+        sources = get_relevant_chunks(2, query, chat_id, user_email)
     sources_str = " ".join([", ".join(str(elem) for elem in source) for source in sources])
 
     sources_swapped = [[str(elem) for elem in source[::-1]] for source in sources]
@@ -1674,6 +1860,8 @@ def _public_chat_fallback(message, chat_id, model_type, model_key, user_email):
         )
         answer = completion.completion
 
+    store_cached_answer(query, cache_key, model_type, model_key, answer, sources)
+
     #This adds bot message
     message_id = add_message_to_db(answer, chat_id, 0)
 
@@ -1684,6 +1872,31 @@ def _public_chat_fallback(message, chat_id, model_type, model_key, user_email):
 
     return jsonify(message_id=message_id, answer=answer, sources=sources_swapped)
 
+@app.route('/public/chat-batch', methods=['POST'])
+@valid_api_key_required
+def public_chat_batch():
+    """Answer several messages against one chat, retrieving sources for all of them in one batch"""
+    user_email = USER_EMAIL_API
+    ensure_SDK_user_exists(user_email)
+
+    messages = request.json.get('messages') or []
+    chat_id = request.json['chat_id']
+    model_key = request.json.get('model_key')
+
+    model_type, task_type = get_chat_info(chat_id)
+    if model_type != 0 and model_key:
+        return jsonify({"Error": "You cannot enter a fine-tuned model key when using Claude"}), 400
+
+    queries = [message.strip() for message in messages]
+    sources_per_query = get_relevant_chunks_batch(2, queries, chat_corpus_key(chat_id), user_email)
+
+    results = []
+    for query, sources in zip(queries, sources_per_query):
+        response = _public_chat_fallback(query, chat_id, model_type, model_key, user_email, sources=sources)
+        results.append(response.get_json())
+
+    return jsonify(results=results)
+
 @app.route('/public/evaluate', methods = ['POST'])
 @valid_api_key_required
 def evaluate():
@@ -3,7 +3,9 @@ DROP TABLE IF EXISTS StripeInfo;
 DROP TABLE IF EXISTS freeTrialsAccessed;
 DROP TABLE IF EXISTS prompt_answers;
 DROP TABLE IF EXISTS prompts;
+DROP TABLE IF EXISTS ingestion_jobs;
 DROP TABLE IF EXISTS chunks;
+DROP TABLE IF EXISTS chunk_embedding_cache;
 DROP TABLE IF EXISTS documents;
 DROP TABLE IF EXISTS messages;
 DROP TABLE IF EXISTS chat_share_chunks;
@@ -170,9 +172,13 @@ CREATE TABLE documents (
     storage_key TEXT NOT NULL,
     document_name VARCHAR(255) NOT NULL,
     document_text LONGTEXT NOT NULL,
+    content_hash CHAR(64),
+    chunk_count INTEGER,
+    version INTEGER NOT NULL DEFAULT 1,
     FOREIGN KEY (workflow_id) REFERENCES workflows(id),
     FOREIGN KEY (chat_id) REFERENCES chats(id),
-    FOREIGN KEY (organization_id) REFERENCES organizations(id)
+    FOREIGN KEY (organization_id) REFERENCES organizations(id),
+    INDEX idx_documents_content_hash (content_hash)
 );
 
 CREATE TABLE chunks (
@@ -181,10 +187,39 @@ CREATE TABLE chunks (
     end_index INTEGER,
     document_id INTEGER NOT NULL,
     embedding_vector BLOB,
+    embedding_int8 BLOB,
+    embedding_binary BLOB,
+    term_counts MEDIUMTEXT,
     page_number INTEGER,
     FOREIGN KEY (document_id) REFERENCES documents(id)
 );
 
+-- Progress of a document's background chunking and embedding, polled by upload clients
+CREATE TABLE ingestion_jobs (
+    id CHAR(36) PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    pages_parsed INTEGER NOT NULL DEFAULT 0,
+    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+    rows_inserted INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    started TIMESTAMP(3) NULL,
+    finished TIMESTAMP(3) NULL,
+    FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE,
+    INDEX idx_ingestion_jobs_document_id (document_id)
+);
+
+-- Chunk embeddings keyed by SHA-256 of (model, prefix, chunk text), reused across ingestions.
+-- Entries unused for CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS are pruned by last_used.
+CREATE TABLE chunk_embedding_cache (
+    text_hash CHAR(64) PRIMARY KEY,
+    embedding_vector BLOB NOT NULL,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_used TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_chunk_embedding_cache_last_used (last_used)
+);
+
 CREATE TABLE prompts (
     id INTEGER PRIMARY KEY AUTO_INCREMENT,
     workflow_id INTEGER NOT NULL,
@@ -0,0 +1,7 @@
+-- Chunk embeddings keyed by SHA-256 of (model, prefix, chunk text), so re-ingested
+-- or re-chunked text only embeds chunks that have not been seen before
+CREATE TABLE IF NOT EXISTS chunk_embedding_cache (
+    text_hash CHAR(64) PRIMARY KEY,
+    embedding_vector BLOB NOT NULL,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
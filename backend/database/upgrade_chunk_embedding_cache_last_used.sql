@@ -0,0 +1,5 @@
+-- Last lookup of each cached chunk embedding; entries unused for
+-- CHUNK_EMBEDDING_CACHE_MAX_AGE_DAYS are pruned
+ALTER TABLE chunk_embedding_cache
+    ADD COLUMN last_used TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP AFTER created,
+    ADD INDEX idx_chunk_embedding_cache_last_used (last_used);
@@ -0,0 +1,5 @@
+-- Per-chunk term counts for the BM25 side of hybrid retrieval (HYBRID_RETRIEVAL)
+ALTER TABLE chunks
+    ADD COLUMN term_counts MEDIUMTEXT AFTER embedding_binary;
+
+-- Existing rows may stay NULL: they are tokenized from the document text when their corpus is first searched
@@ -0,0 +1,12 @@
+-- SHA-256 of the document text, so identical uploads reuse already computed chunks,
+-- and the number of chunks once ingestion has finished (NULL while ingesting)
+ALTER TABLE documents
+    ADD COLUMN content_hash CHAR(64) AFTER document_text,
+    ADD COLUMN chunk_count INTEGER AFTER content_hash,
+    ADD INDEX idx_documents_content_hash (content_hash);
+
+UPDATE documents SET content_hash = SHA2(document_text, 256);
+
+UPDATE documents d
+JOIN (SELECT document_id, COUNT(*) AS chunk_count FROM chunks GROUP BY document_id) c ON c.document_id = d.id
+SET d.chunk_count = c.chunk_count;
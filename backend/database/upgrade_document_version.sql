@@ -0,0 +1,3 @@
+-- Incremented each time an edited re-upload of a document is re-ingested
+ALTER TABLE documents
+    ADD COLUMN version INTEGER NOT NULL DEFAULT 1 AFTER chunk_count;
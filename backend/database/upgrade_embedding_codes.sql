@@ -0,0 +1,6 @@
+-- Compact int8 / binary codes next to each chunk embedding (EMBEDDING_QUANTIZATION)
+ALTER TABLE chunks
+    ADD COLUMN embedding_int8 BLOB AFTER embedding_vector,
+    ADD COLUMN embedding_binary BLOB AFTER embedding_int8;
+
+-- Existing rows are backfilled by `flask migrate-embeddings`
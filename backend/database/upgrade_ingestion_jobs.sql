@@ -0,0 +1,15 @@
+-- Progress of a document's background chunking and embedding, polled by upload clients
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id CHAR(36) PRIMARY KEY,
+    document_id INTEGER NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    pages_parsed INTEGER NOT NULL DEFAULT 0,
+    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+    rows_inserted INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    started TIMESTAMP(3) NULL,
+    finished TIMESTAMP(3) NULL,
+    FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE,
+    INDEX idx_ingestion_jobs_document_id (document_id)
+);
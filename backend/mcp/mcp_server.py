@@ -4,7 +4,7 @@ import os
 import sys
 import json
 import ray
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 # Add the backend directory to the Python path
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,11 +24,11 @@ from api_endpoints.financeGPT.chatbot_endpoints import (
 mcp = FastMCP("Document Agent Server")
 
 @mcp.tool()
-def retrieve_relevant_chunks(query: str, chat_id: int, user_email: str, k: int = 2) -> str:
-    """Retrieve relevant document chunks based on a given user query"""
+def retrieve_relevant_chunks(query: str, chat_id: int, user_email: str, k: int = 2, mmr: Optional[bool] = None) -> str:
+    """Retrieve relevant document chunks based on a given user query. Set mmr to skip near-duplicate chunks."""
 
     try:
-        sources = get_relevant_chunks(k, query, chat_id, user_email)
+        sources = get_relevant_chunks(k, query, chat_id, user_email, mmr=mmr)
         
         if not sources or sources == ["No text found"]:
             return "No relevant documents found."
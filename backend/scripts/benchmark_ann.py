@@ -0,0 +1,113 @@
+"""
+Recall@k vs latency of the IVF-flat ANN index against exact (brute-force) search.
+
+By default runs on a synthetic clustered corpus shaped like our chunk embeddings
+(768-dim, unit length). Pass --workflow-id or --chat-id with --user-email to
+benchmark a real corpus from the database instead.
+
+    python scripts/benchmark_ann.py --corpus-size 50000 --nprobe 4 8 12 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.ann_index import IVFFlatIndex
+
+
+def synthetic_corpus(size, dimensions, topics, spread, seed):
+    """Unit vectors drawn around `topics` random directions, like chunks of many filings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(0, topics, size)] + spread * rng.standard_normal((size, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.arange(1, size + 1, dtype=np.int64), vectors
+
+
+def database_corpus(args):
+    from api_endpoints.financeGPT import chatbot_endpoints as endpoints
+    from database.db import get_db_connection
+
+    conn, cursor = get_db_connection()
+    try:
+        if args.workflow_id is not None:
+            corpus = endpoints._load_corpus(cursor, endpoints.workflow_corpus_key(args.workflow_id),
+                                            endpoints._WORKFLOW_FINGERPRINT_QUERY, endpoints._WORKFLOW_CHUNKS_QUERY,
+                                            (args.user_email, args.workflow_id))
+        else:
+            corpus = endpoints._load_corpus(cursor, endpoints.chat_corpus_key(args.chat_id),
+                                            endpoints._CHAT_FINGERPRINT_QUERY, endpoints._CHAT_CHUNKS_QUERY,
+                                            (args.user_email, args.chat_id))
+    finally:
+        conn.close()
+    if corpus is None:
+        raise SystemExit("Corpus is empty or not owned by this user")
+    return corpus.chunk_ids, corpus.matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-size", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=2.0, help="Within-topic noise; higher is harder for ANN")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 12, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workflow-id", type=int)
+    parser.add_argument("--chat-id", type=int)
+    parser.add_argument("--user-email")
+    args = parser.parse_args()
+
+    if args.workflow_id is not None or args.chat_id is not None:
+        chunk_ids, matrix = database_corpus(args)
+        # Real questions are not chunks: perturb sampled chunks so they are not exact matches
+        rng = np.random.default_rng(args.seed + 1)
+        queries = matrix[rng.choice(len(matrix), args.queries, replace=False)]
+        queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    else:
+        # Queries are held-out draws from the same topic mixture
+        chunk_ids, matrix = synthetic_corpus(args.corpus_size + args.queries, args.dimensions, args.topics,
+                                               args.spread, args.seed)
+        chunk_ids, matrix, queries = chunk_ids[:-args.queries], matrix[:-args.queries], matrix[-args.queries:]
+
+    started = time.perf_counter()
+    index = IVFFlatIndex.train(chunk_ids, matrix)
+    print(f"corpus={len(matrix)} dims={matrix.shape[1]} nlist={index.nlist} "
+          f"train={time.perf_counter() - started:.2f}s k={args.k}")
+
+    truth = []
+    started = time.perf_counter()
+    for query in queries:
+        scores = matrix @ query
+        top = np.argpartition(-scores, args.k - 1)[:args.k]
+        truth.append(set(top.tolist()))
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    print(f"{'search':<14}{'recall@k':>10}{'ms/query':>11}{'scanned':>10}")
+    print(f"{'exact':<14}{1.0:>10.3f}{exact_ms:>11.3f}{len(matrix):>10}")
+
+    for nprobe in args.nprobe:
+        hits = 0
+        scanned = 0
+        started = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            rows = np.searchsorted(chunk_ids, index.candidates(query, nprobe))
+            scores = matrix[rows] @ query
+            k = min(args.k, len(rows))
+            top = rows[np.argpartition(-scores, k - 1)[:k]]
+            hits += len(expected.intersection(top.tolist()))
+            scanned += len(rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        print(f"{f'ivf nprobe={nprobe}':<14}{hits / (len(queries) * args.k):>10.3f}"
+              f"{elapsed_ms:>11.3f}{scanned // len(queries):>10}")
+
+
+if __name__ == "__main__":
+    main()
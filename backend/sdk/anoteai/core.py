@@ -6,6 +6,9 @@ import csv
 from handlers.public_handlers import *
 from handlers.private_handlers import *
 
+# Seconds upload() and wait_for_ingestion() wait for ingestion unless told otherwise
+DEFAULT_INGESTION_TIMEOUT = 600
+
 class ModelType(IntEnum):
     FTGPT = 0
     LLAMA3 = 1
@@ -49,7 +52,7 @@ class PrivateChatbot:
             'Authorization': f'Bearer {api_key}'
         }
 
-    def upload(self, task_type, model_type, ticker=None, file_paths=None):
+    def upload(self, task_type, model_type, ticker=None, file_paths=None, wait=True, timeout=DEFAULT_INGESTION_TIMEOUT):
         """Upload documents or specify a ticker for data retrieval and Q&A. This method supports various tasks, such as uploading documents or querying the government's EDGAR database.
 
         Args:
@@ -57,9 +60,11 @@ class PrivateChatbot:
             model_type (str): Determines the AI model to use for processing the request. Different model types available are "gpt" for GPT-4 and "claude" for Claude.
             ticker (str, optional): The ticker symbol for financial data analysis tasks. Required if the task_type is 'edgar'. Example: 'AAPL' for Apple Inc.
             file_paths (list[str], optional): A list of file paths to documents for document-based tasks. Required if task_type is 'documents'. Example: ['path/to/file1.pdf', 'path/to/file2.pdf'].
+            wait (bool, optional): Wait until the documents are ingested and searchable. With `wait=False` the call returns as soon as the documents are uploaded; follow them with `wait_for_ingestion` or `ingestion_status`.
+            timeout (float, optional): Maximum number of seconds to wait for ingestion, 600 by default. Jobs still running afterwards are returned with their current status.
 
         Returns:
-            response (dict): A JSON response from the API, including the `chat_id` for interactions based on the uploaded content or specified ticker.
+            response (dict): A JSON response from the API, including the `chat_id` for interactions based on the uploaded content or specified ticker, and `jobs` with the ingestion job of each document (their final state when waiting). A document that could not be parsed has status "failed" and an `error` instead of a job.
         """
 
         if task_type is None:
@@ -74,12 +79,42 @@ class PrivateChatbot:
         if self.is_private == False:
             if model_type != "gpt" and model_type != "claude":
                 return {"error": "Model type is not valid. Please enter a valid model type"}
-            return upload_public(self.API_BASE_URL, self.headers, task_type, model_type, ticker, file_paths)
+            response = upload_public(self.API_BASE_URL, self.headers, task_type, model_type, ticker, file_paths)
+            if wait and response.get("jobs"):
+                # Documents that failed to upload have no job to wait for
+                states = self.wait_for_ingestion([job["job_id"] for job in response["jobs"] if job.get("job_id")], timeout=timeout)
+                states = {state.get("job_id"): state for state in states}
+                response["jobs"] = [states.get(job.get("job_id"), job) for job in response["jobs"]]
+            return response
         else:
             if model_type != "llama" and model_type != "mistral":
                 return {"error": "Model type is not valid. Please enter a valid model type"}
             return upload_private(task_type, model_type, ticker, file_paths)
 
+    def ingestion_status(self, job_id):
+        """Get the progress of a document's ingestion.
+
+        Args:
+            job_id (str): An ingestion job ID, as returned in the `jobs` of `upload`.
+
+        Returns:
+            response (dict): The job's `status` ("queued", "running", "completed" or "failed"), `pages_parsed`, `chunks_embedded`, `rows_inserted`, `chunks_per_second` and `error`.
+        """
+        return ingestion_job_public(self.API_BASE_URL, self.headers, job_id)
+
+    def wait_for_ingestion(self, job_ids, timeout=DEFAULT_INGESTION_TIMEOUT, poll_seconds=1.0):
+        """Wait until uploaded documents are ingested and can be chatted with.
+
+        Args:
+            job_ids (list[str]): Ingestion job IDs, as returned in the `jobs` of `upload`.
+            timeout (float, optional): Maximum number of seconds to wait, 600 by default; None waits until every job has finished.
+            poll_seconds (float, optional): Seconds between checks of the jobs.
+
+        Returns:
+            response (list[dict]): The latest state of each job, as returned by `ingestion_status`.
+        """
+        return wait_for_ingestion_public(self.API_BASE_URL, self.headers, job_ids, poll_seconds, timeout)
+
     def train(self, model_name, fine_tuning_type, x_train_csv, y_train_csv, document_files, model_type = ModelType.FTGPT, is_private=False):
         """
         Train or Fine Tune a model via supervised or unsupervised fine tuning
@@ -219,6 +254,39 @@ class PrivateChatbot:
             return chat_private(chat_id, message, finetuned_model_key)
 
 
+    def chat_batch(self, chat_id, messages, finetuned_model_key=None):
+        """Send several messages to the chatbot at once, e.g. a list of standard questions.
+
+        Sources for all messages are retrieved together, which is much faster than calling `chat` in a loop.
+
+        Args:
+            chat_id (int): The ID of the chat that has had documents uploaded.
+            messages (list[str]): The messages to send to the chatbot.
+            finetuned_model_key (str, optional): An optional custom model OpenAI key. If provided, the chatbot uses this finetuned model for the responses.
+
+        Returns:
+            response (dict): The JSON response from the API, with `results` holding one `answer`, `message_id` and `sources` entry per message, in order.
+        """
+
+        if not chat_id:
+            return {"error": "Chat ID is not set. Please upload documents first and enter the chat ID."}
+
+        if not messages:
+            return {"error": "Messages are not set. Please enter the messages to send."}
+
+        if self.is_private == False:
+            url = f"{self.API_BASE_URL}/public/chat-batch"
+            data = {
+                "chat_id": chat_id,
+                "messages": messages,
+                "model_key": finetuned_model_key
+            }
+            response = requests.post(url, json=data, headers=self.headers)
+            return response.json()
+        else:
+            return {"results": [chat_private(chat_id, message, finetuned_model_key) for message in messages]}
+
+
     def evaluate(self, message_id):
         """Evaluate predictions on one or multiple documents/text.
 
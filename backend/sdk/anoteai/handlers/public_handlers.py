@@ -1,6 +1,7 @@
 import requests
 import os
 import re
+import time
 
 
 def upload_public(API_url, headers, task_type, model_type, ticker=None, file_paths=None):
@@ -66,6 +67,35 @@ def upload_public(API_url, headers, task_type, model_type, ticker=None, file_pat
     else:
         return {"error": "Task type is not recognized. Please enter a valid task type."}
     
+def ingestion_job_public(API_url, headers, job_id):
+    url = f"{API_url}/public/ingestion-jobs/{job_id}"
+    headers = {key: val for key, val in headers.items() if key.lower() != 'content-type'}
+
+    try:
+        response = requests.get(url, headers=headers)
+        return response.json()
+    except requests.exceptions.JSONDecodeError as e:
+        return {"error": f"Failed to decode JSON response {e}"}
+
+
+def wait_for_ingestion_public(API_url, headers, job_ids, poll_seconds=1.0, timeout=None):
+    """Poll ingestion jobs until each has completed or failed (or the timeout has passed) and return their states"""
+    deadline = time.time() + timeout if timeout is not None else None
+    jobs = {}
+    pending = [job_id for job_id in job_ids if job_id]
+    while pending:
+        for job_id in list(pending):
+            job = ingestion_job_public(API_url, headers, job_id)
+            jobs[job_id] = job
+            if "status" not in job or job["status"] in ("completed", "failed"):
+                pending.remove(job_id)
+        if pending:
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(poll_seconds)
+    return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+
 def is_file_or_isHtml(path):
     if os.path.isfile(path):
         return "file"
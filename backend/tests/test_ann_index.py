@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.ann_index import ANN_NPROBE, IVFFlatIndex
+
+
+def _clustered_vectors(rng, num_vectors, dimensions=64, num_clusters=40):
+    # Embeddings of a filing corpus cluster by topic rather than spreading uniformly
+    centers = rng.standard_normal((num_clusters, dimensions))
+    vectors = centers[rng.integers(num_clusters, size=num_vectors)] + 0.6 * rng.standard_normal((num_vectors, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+class TestIVFFlatIndex(unittest.TestCase):
+    """Candidate lists of the IVF-flat index against exact search"""
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.matrix = _clustered_vectors(self.rng, 4000)
+        self.chunk_ids = np.arange(1000, 1000 + len(self.matrix))
+        self.index = IVFFlatIndex.train(self.chunk_ids, self.matrix, seed=0)
+
+    def test_recall_against_exact_knn_at_default_nprobe(self):
+        k = 10
+        queries = _clustered_vectors(self.rng, 50)
+        position_of = {chunk_id: i for i, chunk_id in enumerate(self.chunk_ids)}
+        found = 0
+        for query in queries:
+            exact = set(self.chunk_ids[np.argsort(-(self.matrix @ query))[:k]])
+            candidates = self.index.candidates(query, ANN_NPROBE)
+            rows = np.array([position_of[chunk_id] for chunk_id in candidates])
+            approximate = set(candidates[np.argsort(-(self.matrix[rows] @ query))[:k]])
+            found += len(exact & approximate)
+        self.assertGreaterEqual(found / (k * len(queries)), 0.9)
+
+    def test_every_chunk_is_in_one_list(self):
+        self.assertEqual(len(self.index), len(self.chunk_ids))
+        members = self.index.candidates(self.matrix[0], self.index.nlist)
+        self.assertEqual(sorted(members), sorted(self.chunk_ids))
+
+    def test_add_assigns_new_chunks_and_ignores_known_ids(self):
+        new_vectors = _clustered_vectors(self.rng, 5)
+        new_ids = np.arange(9000, 9005)
+
+        self.assertEqual(self.index.add(new_ids, new_vectors), 5)
+        self.assertEqual(self.index.add(new_ids, new_vectors), 0)
+        self.assertEqual(len(self.index), len(self.chunk_ids) + 5)
+        for chunk_id, vector in zip(new_ids, new_vectors):
+            # A chunk is always found when probing the list nearest to its own vector
+            self.assertIn(chunk_id, self.index.candidates(vector, 1))
+
+    def test_retain_drops_deleted_chunks(self):
+        kept_ids = self.chunk_ids[::2]
+        self.index.retain(kept_ids)
+
+        self.assertEqual(len(self.index), len(kept_ids))
+        members = self.index.candidates(self.matrix[0], self.index.nlist)
+        self.assertEqual(sorted(members), sorted(kept_ids))
+
+    def test_needs_retraining_once_the_corpus_doubles(self):
+        self.assertFalse(self.index.needs_retraining())
+        more = _clustered_vectors(self.rng, len(self.chunk_ids) + 1)
+        self.index.add(np.arange(20000, 20000 + len(more)), more)
+        self.assertTrue(self.index.needs_retraining())
+
+
+if __name__ == "__main__":
+    unittest.main()
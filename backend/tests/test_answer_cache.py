@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.answer_cache import SemanticAnswerCache, answer_content_key
+
+MODEL = ("all-mpnet-base-v2", 0, None)
+DOCUMENTS = [("a" * 64, "10k.pdf"), ("b" * 64, "10q.pdf")]
+
+
+class TestAnswerContentKey(unittest.TestCase):
+    """What a cached answer is keyed by"""
+
+    def test_same_documents_in_any_order_share_a_key(self):
+        self.assertEqual(answer_content_key("user@example.com", DOCUMENTS, []),
+                         answer_content_key("user@example.com", DOCUMENTS[::-1], []))
+
+    def test_documents_user_and_history_change_the_key(self):
+        key = answer_content_key("user@example.com", DOCUMENTS, [])
+        self.assertNotEqual(key, answer_content_key("user@example.com", DOCUMENTS[:1], []))
+        self.assertNotEqual(key, answer_content_key("user@example.com", [("c" * 64, "10k.pdf"), DOCUMENTS[1]], []))
+        self.assertNotEqual(key, answer_content_key("other@example.com", DOCUMENTS, []))
+        self.assertNotEqual(key, answer_content_key("user@example.com", DOCUMENTS, [(1, "What was revenue?")]))
+        self.assertNotEqual(answer_content_key("user@example.com", DOCUMENTS, [(1, "Revenue?")]),
+                            answer_content_key("user@example.com", DOCUMENTS, [(0, "Revenue?")]))
+
+
+class TestSemanticAnswerCache(unittest.TestCase):
+    """Answering reworded questions from the in-process cache"""
+
+    def setUp(self):
+        self.cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60)
+        self.key = answer_content_key("user@example.com", DOCUMENTS, [])
+        self.cache.store(self.key, MODEL, [1.0, 0.0], "What was revenue?", "Revenue was $10M.",
+                         [("Revenue: $10M", "10k.pdf")])
+
+    def test_reworded_question_hits(self):
+        hit = self.cache.lookup(self.key, MODEL, [0.99, 0.141])
+
+        self.assertEqual(hit["answer"], "Revenue was $10M.")
+        self.assertEqual(hit["sources"], [("Revenue: $10M", "10k.pdf")])
+        self.assertEqual(hit["question"], "What was revenue?")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_different_question_model_or_content_misses(self):
+        self.assertIsNone(self.cache.lookup(self.key, MODEL, [0.0, 1.0]))
+        self.assertIsNone(self.cache.lookup(self.key, ("all-mpnet-base-v2", 1, None), [1.0, 0.0]))
+        follow_up_key = answer_content_key("user@example.com", DOCUMENTS, [(1, "What was revenue?")])
+        self.assertIsNone(self.cache.lookup(follow_up_key, MODEL, [1.0, 0.0]))
+        self.assertEqual(self.cache.stats()["misses"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -305,6 +305,285 @@ class TestFlaskApp(unittest.TestCase):
             self.assertIn("shared message 1", response_data)
             self.assertIn("shared message 2", response_data)
 
+    @patch("app.is_api_key_valid", return_value=True)
+    def test_retrieval_stats(self, mock_key_valid):
+        """Test retrieval cache counters are exposed to API key holders"""
+        with patch("app.get_retrieval_cache_stats") as mock_stats:
+            mock_stats.return_value = {
+                "query_embedding_cache": {"entries": 1, "hits": 3, "misses": 1, "hit_rate": 0.75},
+            }
+
+            response = self.app.get("/retrieval-stats", headers=self.test_headers)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["query_embedding_cache"]["hits"], 3)
+            mock_key_valid.assert_called_once_with("test_token")
+
+    @patch("app.get_retrieval_cache_stats")
+    def test_retrieval_stats_requires_api_key(self, mock_stats):
+        """Test retrieval cache counters are not exposed without an API key"""
+        response = self.app.get("/retrieval-stats")
+
+        self.assertEqual(response.status_code, 401)
+        mock_stats.assert_not_called()
+
+    @patch("app.is_api_key_valid", return_value=True)
+    @patch("app.ensure_SDK_user_exists")
+    @patch("app.get_chat_info", return_value=(0, 0))
+    @patch("app.get_relevant_chunks_batch")
+    @patch("app._public_chat_fallback")
+    def test_public_chat_batch_retrieves_once(self, mock_fallback, mock_batch, mock_chat_info,
+                                              mock_ensure_user, mock_key_valid):
+        """Test batch chat retrieves sources for all messages in a single call"""
+        mock_batch.return_value = [[("chunk a", "doc.pdf")], [("chunk b", "doc.pdf")]]
+        mock_fallback.side_effect = lambda query, *args, **kwargs: MagicMock(
+            get_json=MagicMock(return_value={"answer": f"answer to {query}"})
+        )
+
+        data = {"chat_id": 7, "messages": ["Revenue?", " Risks? "]}
+        response = self.app.post("/public/chat-batch", json=data, headers=self.test_headers)
+
+        self.assertEqual(response.status_code, 200)
+        mock_batch.assert_called_once_with(2, ["Revenue?", "Risks?"], ("chat", 7), unittest.mock.ANY)
+        self.assertEqual(mock_fallback.call_args_list[1].kwargs["sources"], [("chunk b", "doc.pdf")])
+        self.assertEqual(response.get_json()["results"][1]["answer"], "answer to Risks?")
+
+    @patch("app.is_api_key_valid", return_value=True)
+    @patch("app.ensure_SDK_user_exists")
+    @patch("app.get_chat_info", return_value=(0, 0))
+    @patch("app.lookup_cached_answer")
+    @patch("app.add_message_to_db", return_value=42)
+    @patch("app.add_sources_to_db")
+    @patch("app.ReactiveDocumentAgent")
+    def test_public_chat_semantic_cache_hit(self, mock_agent, mock_add_sources, mock_add_message, mock_lookup,
+                                            mock_chat_info, mock_ensure_user, mock_key_valid):
+        """Test a cached answer to a similar question skips the agent"""
+        mock_lookup.return_value = ({
+            "answer": "Revenue was $10M.",
+            "sources": [("Revenue: $10M", "10k.pdf")],
+            "question": "What was revenue?",
+            "similarity": 0.97,
+        }, (12, 340))
+
+        data = {"chat_id": 7, "message": "What was the revenue?"}
+        response = self.app.post("/public/chat", json=data, headers=self.test_headers)
+
+        self.assertEqual(response.status_code, 200)
+        mock_agent.assert_not_called()
+        response_data = response.get_json()
+        self.assertTrue(response_data["cached"])
+        self.assertEqual(response_data["message_id"], 42)
+        self.assertEqual(response_data["sources"], [["10k.pdf", "Revenue: $10M"]])
+
+    def _answer_cache_database(self, history_by_chat):
+        """get_db_connection for lookup_cached_answer: every chat holds the same 10-K"""
+        def connection():
+            cursor = MagicMock()
+
+            def execute(query, params):
+                if "FROM documents" in query:
+                    cursor.fetchall.return_value = [
+                        {"content_hash": "a" * 64, "document_name": "10k.pdf", "chunk_count": 12}
+                    ]
+                else:
+                    cursor.fetchall.return_value = history_by_chat.get(params[0], [])
+            cursor.execute.side_effect = execute
+            return MagicMock(), cursor
+        return connection
+
+    @patch("app.is_api_key_valid", return_value=True)
+    @patch("app.ensure_SDK_user_exists")
+    @patch("app.get_chat_info", return_value=(0, 0))
+    @patch("api_endpoints.financeGPT.chatbot_endpoints.get_db_connection")
+    @patch("api_endpoints.financeGPT.chatbot_endpoints.get_embedding")
+    @patch("app.add_message_to_db", return_value=43)
+    @patch("app.add_sources_to_db")
+    @patch("app.ReactiveDocumentAgent")
+    def test_public_chat_reworded_question_answered_from_cache(self, mock_agent, mock_add_sources, mock_add_message,
+                                                               mock_get_embedding, mock_get_db_connection,
+                                                               mock_chat_info, mock_ensure_user, mock_key_valid):
+        """Test a reworded question about the same documents, in a new chat, is answered from the cache"""
+        from api_endpoints.financeGPT.answer_cache import SemanticAnswerCache
+
+        embeddings = {"What was revenue?": [1.0, 0.0], "What was the revenue?": [0.99, 0.141]}
+        mock_get_embedding.side_effect = lambda question: embeddings[question]
+        mock_get_db_connection.side_effect = self._answer_cache_database({})
+        mock_agent.return_value.process_query.return_value = {
+            "answer": "Revenue was $10M.", "sources": [("Revenue: $10M", "10k.pdf")], "message_id": 1,
+        }
+
+        with patch("api_endpoints.financeGPT.chatbot_endpoints.semantic_answer_cache", SemanticAnswerCache()):
+            first = self.app.post("/public/chat", json={"chat_id": 7, "message": "What was revenue?"},
+                                  headers=self.test_headers)
+            second = self.app.post("/public/chat", json={"chat_id": 8, "message": "What was the revenue?"},
+                                   headers=self.test_headers)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn("cached", first.get_json())
+        self.assertEqual(second.status_code, 200)
+        mock_agent.return_value.process_query.assert_called_once()
+        self.assertTrue(second.get_json()["cached"])
+        self.assertEqual(second.get_json()["answer"], "Revenue was $10M.")
+        self.assertEqual(second.get_json()["sources"], [["10k.pdf", "Revenue: $10M"]])
+
+    @patch("app.is_api_key_valid", return_value=True)
+    @patch("app.ensure_SDK_user_exists")
+    @patch("app.get_chat_info", return_value=(0, 0))
+    @patch("api_endpoints.financeGPT.chatbot_endpoints.get_db_connection")
+    @patch("api_endpoints.financeGPT.chatbot_endpoints.get_embedding", return_value=[1.0, 0.0])
+    @patch("app.add_message_to_db", return_value=43)
+    @patch("app.ReactiveDocumentAgent")
+    def test_public_chat_follow_up_misses_opening_question_cache(self, mock_agent, mock_add_message,
+                                                                 mock_get_embedding, mock_get_db_connection,
+                                                                 mock_chat_info, mock_ensure_user, mock_key_valid):
+        """Test a follow-up is keyed by the chat history, so it does not match an opening question"""
+        from api_endpoints.financeGPT.answer_cache import SemanticAnswerCache
+
+        history = [{"sent_from_user": 1, "message_text": "What was revenue?"},
+                   {"sent_from_user": 0, "message_text": "Revenue was $10M."}]
+        mock_get_db_connection.side_effect = self._answer_cache_database({8: history})
+        mock_agent.return_value.process_query.side_effect = [
+            {"answer": "Revenue was $10M.", "sources": [("Revenue: $10M", "10k.pdf")]},
+            {"answer": "In 2022 revenue was $8M.", "sources": [("Revenue 2022: $8M", "10k.pdf")]},
+        ]
+
+        with patch("api_endpoints.financeGPT.chatbot_endpoints.semantic_answer_cache", SemanticAnswerCache()):
+            self.app.post("/public/chat", json={"chat_id": 7, "message": "What about 2022?"}, headers=self.test_headers)
+            response = self.app.post("/public/chat", json={"chat_id": 8, "message": "What about 2022?"},
+                                     headers=self.test_headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_agent.return_value.process_query.call_count, 2)
+        self.assertEqual(response.get_json()["answer"], "In 2022 revenue was $8M.")
+
+    @patch("app.is_api_key_valid", return_value=True)
+    @patch("app.ensure_SDK_user_exists")
+    @patch("app.add_chat_to_db", return_value=7)
+    @patch("app.add_document_to_db", return_value=(11, False))
+    @patch("app.create_ingestion_job", return_value="job-1")
+    @patch("app.chunk_document")
+    @patch("app.p")
+    def test_public_upload_returns_jobs_without_waiting(self, mock_parser, mock_chunk_document, mock_create_job,
+                                                        mock_add_document, mock_add_chat, mock_ensure_user,
+                                                        mock_key_valid):
+        """Test SDK uploads start ingestion in the background and return a job per document"""
+        from io import BytesIO
+        mock_parser.from_buffer.return_value = {"content": " 10-K text ", "metadata": {"xmpTPg:NPages": "3"}}
+
+        data = {"task_type": "documents", "model_type": "gpt", "files[]": (BytesIO(b"%PDF"), "10k.pdf")}
+        response = self.app.post("/public/upload", data=data, content_type="multipart/form-data",
+                                 headers={"Authorization": "Bearer test_token"})
+
+        self.assertEqual(response.status_code, 200)
+        mock_create_job.assert_called_once_with(11, 3)
+        mock_chunk_document.remote.assert_called_once_with("10-K text", 1000, 11, "job-1")
+        self.assertEqual(response.get_json()["jobs"], [
+            {"job_id": "job-1", "document_id": 11, "document_name": "10k.pdf", "status": "queued"},
+        ])
+
+    @patch("app.is_api_key_valid", return_value=True)
+    @patch("app.ensure_SDK_user_exists")
+    @patch("app.add_chat_to_db", return_value=7)
+    @patch("app.add_document_to_db", return_value=(11, False))
+    @patch("app.create_ingestion_job", return_value="job-1")
+    @patch("app.chunk_document")
+    @patch("app.p")
+    def test_public_upload_reports_errors_per_file(self, mock_parser, mock_chunk_document, mock_create_job,
+                                                   mock_add_document, mock_add_chat, mock_ensure_user,
+                                                   mock_key_valid):
+        """Test a file that fails to parse does not fail the rest of an SDK upload"""
+        from io import BytesIO
+
+        def parse(file):
+            if file.filename == "broken.pdf":
+                raise RuntimeError("Tika could not parse the file")
+            return {"content": "10-K text", "metadata": {}}
+        mock_parser.from_buffer.side_effect = parse
+
+        data = {"task_type": "documents", "model_type": "gpt",
+                "files[]": [(BytesIO(b"%PDF"), "broken.pdf"), (BytesIO(b"%PDF"), "10k.pdf")]}
+        response = self.app.post("/public/upload", data=data, content_type="multipart/form-data",
+                                 headers={"Authorization": "Bearer test_token"})
+
+        self.assertEqual(response.status_code, 200)
+        mock_chunk_document.remote.assert_called_once_with("10-K text", 1000, 11, "job-1")
+        self.assertEqual(response.get_json()["jobs"], [
+            {"job_id": None, "document_id": None, "document_name": "broken.pdf", "status": "failed",
+             "error": "Tika could not parse the file"},
+            {"job_id": "job-1", "document_id": 11, "document_name": "10k.pdf", "status": "queued"},
+        ])
+
+    @patch("app.add_document_to_wfs_db", return_value=(21, False))
+    @patch("app.create_ingestion_job", return_value="job-2")
+    @patch("app.chunk_document")
+    @patch("app.parse_pdf")
+    def test_workflow_upload_parses_once(self, mock_parse_pdf, mock_chunk_document, mock_create_job,
+                                         mock_add_document):
+        """Test workflow uploads parse each PDF once and chunk the parsed pages"""
+        from io import BytesIO
+        document = MagicMock(page_count=2)
+        mock_parse_pdf.return_value = document
+
+        data = {"workflow_id": "5", "files": (BytesIO(b"%PDF"), "10k.pdf")}
+        response = self.app.post("/api/ingest-pdf-wf", data=data, content_type="multipart/form-data")
+
+        self.assertEqual(response.status_code, 200)
+        mock_parse_pdf.assert_called_once()
+        mock_add_document.assert_called_once_with(document, "10k.pdf", "5")
+        mock_create_job.assert_called_once_with(21, 2)
+        mock_chunk_document.remote.assert_called_once_with(document, 1000, 21, "job-2")
+
+    @patch("app.extractUserEmailFromRequest")
+    def test_ingestion_job_status(self, mock_extract_email):
+        """Test polling an ingestion job, and a job the user does not have"""
+        mock_extract_email.return_value = self.test_email
+
+        with patch("app.get_ingestion_job") as mock_get_job:
+            mock_get_job.return_value = {"job_id": "job-1", "status": "running", "rows_inserted": 128}
+            response = self.app.get("/ingestion-jobs/job-1", headers=self.test_headers)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["rows_inserted"], 128)
+            mock_get_job.assert_called_once_with("job-1", self.test_email)
+
+            mock_get_job.return_value = None
+            response = self.app.get("/ingestion-jobs/job-2", headers=self.test_headers)
+            self.assertEqual(response.status_code, 404)
+
+    @patch("app.extractUserEmailFromRequest")
+    def test_ingestion_job_events(self, mock_extract_email):
+        """Test the SSE stream reports progress changes and ends when the job completes"""
+        mock_extract_email.return_value = self.test_email
+
+        with patch("app.get_ingestion_job") as mock_get_job, patch("app.INGEST_JOB_POLL_SECONDS", 0):
+            mock_get_job.side_effect = [
+                {"job_id": "job-1", "status": "running", "chunks_embedded": 64, "rows_inserted": 0},
+                {"job_id": "job-1", "status": "running", "chunks_embedded": 64, "rows_inserted": 0},
+                {"job_id": "job-1", "status": "completed", "chunks_embedded": 64, "rows_inserted": 64},
+            ]
+            response = self.app.get("/ingestion-jobs/job-1/events", headers=self.test_headers)
+
+            events = [line for line in response.get_data(as_text=True).split("\n") if line.startswith("data: ")]
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(events), 3)
+            self.assertIn('"type": "completed"', events[-1])
+
+    @patch("app.extractUserEmailFromRequest")
+    def test_ingestion_job_events_time_out(self, mock_extract_email):
+        """Test the SSE stream of a job that never finishes ends after the maximum duration"""
+        mock_extract_email.return_value = self.test_email
+
+        with patch("app.get_ingestion_job") as mock_get_job, patch("app.INGEST_JOB_POLL_SECONDS", 0), \
+                patch("app.INGEST_JOB_STREAM_SECONDS", 0):
+            mock_get_job.return_value = {"job_id": "job-1", "status": "running", "chunks_embedded": 0,
+                                         "rows_inserted": 0}
+            response = self.app.get("/ingestion-jobs/job-1/events", headers=self.test_headers)
+
+            events = [line for line in response.get_data(as_text=True).split("\n") if line.startswith("data: ")]
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(events), 2)
+            self.assertIn('"type": "timeout"', events[-1])
+
     def _create_invalid_token_test(self, endpoint, method="post", data=None):
         """Helper method to test invalid token scenarios"""
         with patch("app.extractUserEmailFromRequest") as mock_extract:
@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.diversity import maximal_marginal_relevance
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _reference_mmr(query, candidates, k, lambda_mult):
+    # MMR as usually written: start from the most relevant candidate, then rescore
+    # every remaining candidate against the selected set
+    selected = [int(np.argmax(candidates @ query))]
+    remaining = [i for i in range(len(candidates)) if i != selected[0]]
+    while remaining and len(selected) < k:
+        def score(i):
+            redundancy = max(float(candidates[i] @ candidates[j]) for j in selected)
+            return lambda_mult * float(candidates[i] @ query) - (1 - lambda_mult) * redundancy
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+class TestMaximalMarginalRelevance(unittest.TestCase):
+    """Order in which MMR picks retrieved chunks"""
+
+    def setUp(self):
+        self.query = _normalize([1.0, 0.0, 0.0])
+        self.candidates = _normalize([
+            [0.95, 0.31, 0.0],   # most relevant
+            [0.6, -0.8, 0.0],    # less relevant, different passage
+            [0.0, 0.0, 1.0],     # unrelated
+            [0.95, 0.31, 0.02],  # near-duplicate of the first
+        ])
+
+    def test_near_duplicate_is_picked_last(self):
+        order = maximal_marginal_relevance(self.query, self.candidates, 4, lambda_mult=0.5)
+        self.assertEqual(order.tolist(), [0, 1, 2, 3])
+
+    def test_pure_relevance_orders_by_similarity(self):
+        order = maximal_marginal_relevance(self.query, self.candidates, 4, lambda_mult=1.0)
+        self.assertEqual(order.tolist(), [0, 3, 1, 2])
+
+    def test_k_is_capped_by_the_candidates(self):
+        self.assertEqual(len(maximal_marginal_relevance(self.query, self.candidates, 10, lambda_mult=0.5)), 4)
+        self.assertEqual(len(maximal_marginal_relevance(self.query, self.candidates, 0, lambda_mult=0.5)), 0)
+
+    def test_matches_reference_implementation(self):
+        rng = np.random.default_rng(0)
+        for lambda_mult in (0.0, 0.3, 0.5, 0.7, 1.0):
+            query = _normalize(rng.standard_normal(32))
+            candidates = _normalize(rng.standard_normal((40, 32)))
+            order = maximal_marginal_relevance(query, candidates, 10, lambda_mult=lambda_mult)
+            self.assertEqual(order.tolist(), _reference_mmr(query, candidates, 10, lambda_mult))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import random
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.document_diff import plan_reingest
+from api_endpoints.financeGPT.span_splitter import SpanTextSplitter
+
+SEPARATORS = ["\n\n", "\n", ". ", "? ", "! ", " ", ""]
+WORDS = ["revenue", "margin", "risk", "debt", "2023", "segment", "growth", "cash", "$4.2M", "Q3"]
+
+
+def _paragraph(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+
+
+def _chunk_rows(splitter, pages):
+    # Chunk rows as ingest_document_chunks stores them: split page by page, global offsets
+    rows = []
+    offset = 0
+    for page_number, page in enumerate(pages, start=1):
+        for start, end in splitter.split_spans(page):
+            rows.append({"id": len(rows) + 1, "start_index": offset + start, "end_index": offset + end,
+                         "page_number": page_number})
+        offset += len(page)
+    return rows
+
+
+def _page_offsets(pages):
+    offsets = []
+    offset = 0
+    for page in pages:
+        offsets.append(offset)
+        offset += len(page)
+    return offsets
+
+
+def _edit(rng, lines):
+    lines = list(lines)
+    for _ in range(rng.randint(1, 4)):
+        position = rng.randrange(len(lines))
+        operation = rng.random()
+        if operation < 0.4:
+            lines[position] = _paragraph(rng)
+        elif operation < 0.7:
+            lines.insert(position, _paragraph(rng))
+        else:
+            del lines[position]
+    return lines
+
+
+class TestPlanReingest(unittest.TestCase):
+    """Which chunks survive an edit, where they move and what is chunked afresh"""
+
+    def setUp(self):
+        self.splitter = SpanTextSplitter(300, 50, SEPARATORS)
+
+    def assert_plan_is_valid(self, plan, old_rows, old_text, new_text):
+        old_by_id = {row["id"]: row for row in old_rows}
+        self.assertEqual(sorted([chunk[0] for chunk in plan.kept] + plan.removed), sorted(old_by_id))
+
+        for chunk_id, start, end, _, _ in plan.kept:
+            row = old_by_id[chunk_id]
+            self.assertEqual(new_text[start:end], old_text[row["start_index"]:row["end_index"]])
+
+        covered = [False] * len(new_text)
+        for start, end in [(chunk[1], chunk[2]) for chunk in plan.kept] + [(start, end) for start, end, _ in plan.added]:
+            covered[start:end] = [True] * (end - start)
+        uncovered = [i for i, char in enumerate(new_text) if not covered[i] and not char.isspace()]
+        self.assertEqual(uncovered, [])
+
+    def test_kept_chunks_keep_their_text_and_new_text_is_covered(self):
+        rng = random.Random(7)
+        for _ in range(40):
+            lines = [_paragraph(rng) for _ in range(rng.randint(20, 120))]
+            old_text = "\n".join(lines)
+            old_rows = [dict(row, page_number=None) for row in _chunk_rows(self.splitter, [old_text])]
+            new_text = "\n".join(_edit(rng, lines))
+
+            plan = plan_reingest(old_rows, old_text, new_text, self.splitter)
+            self.assert_plan_is_valid(plan, old_rows, old_text, new_text)
+
+    def test_unchanged_text_keeps_every_chunk_in_place(self):
+        rng = random.Random(1)
+        text = "\n".join(_paragraph(rng) for _ in range(50))
+        rows = [dict(row, page_number=None) for row in _chunk_rows(self.splitter, [text])]
+
+        plan = plan_reingest(rows, text, text, self.splitter)
+        self.assertEqual(len(plan.kept), len(rows))
+        self.assertEqual((plan.removed, plan.added, plan.moved), ([], [], []))
+
+    def test_page_numbers_follow_the_new_pages(self):
+        rng = random.Random(3)
+        old_pages = ["\n".join(_paragraph(rng) for _ in range(15)) + "\n" for _ in range(4)]
+        # A new first page, and an edit on what is now page 4
+        new_pages = ["\n".join(_paragraph(rng) for _ in range(10)) + "\n"] + old_pages
+        new_pages[3] = _paragraph(rng) + "\n" + new_pages[3]
+        old_text, new_text = "".join(old_pages), "".join(new_pages)
+        old_rows = _chunk_rows(self.splitter, old_pages)
+        offsets = _page_offsets(new_pages)
+        page_ends = offsets[1:] + [len(new_text)]
+
+        plan = plan_reingest(old_rows, old_text, new_text, self.splitter, offsets)
+        self.assert_plan_is_valid(plan, old_rows, old_text, new_text)
+
+        old_pages_by_id = {row["id"]: row["page_number"] for row in old_rows}
+        for chunk_id, start, end, page_number, moved in plan.kept:
+            self.assertTrue(moved)
+            self.assertEqual(page_number, old_pages_by_id[chunk_id] + 1)
+        for start, end, page_number in [(chunk[1], chunk[2], chunk[3]) for chunk in plan.kept] + plan.added:
+            self.assertGreaterEqual(start, offsets[page_number - 1])
+            self.assertLessEqual(end, page_ends[page_number - 1])
+        self.assertTrue(any(page_number == 1 for _, _, page_number in plan.added))
+
+
+class FakeDatabase:
+    """The documents and chunks rows reingest_document_chunks reads and writes, for one document"""
+
+    def __init__(self, document_id, text, rows):
+        self.document_id = document_id
+        self.text = text
+        self.content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.chunks = {row["id"]: dict(row) for row in rows}
+        self.next_id = max(self.chunks) + 1
+
+    def fingerprint(self):
+        return len(self.chunks), max(self.chunks)
+
+    def connection(self):
+        cursor = MagicMock()
+        cursor.execute.side_effect = lambda query, params=(): self._execute(cursor, query, params)
+        cursor.executemany.side_effect = lambda query, rows: [self._execute(cursor, query, row) for row in rows]
+        return MagicMock(), cursor
+
+    def _insert(self, start, end, page_number):
+        self.chunks[self.next_id] = {"id": self.next_id, "start_index": start, "end_index": end,
+                                     "page_number": page_number}
+        self.next_id += 1
+
+    def _execute(self, cursor, query, params):
+        query = " ".join(query.split())
+        if query.startswith("SELECT document_text FROM documents"):
+            cursor.fetchone.return_value = {"document_text": self.text}
+        elif query.startswith("SELECT id, start_index, end_index, page_number FROM chunks"):
+            cursor.fetchall.return_value = [dict(row) for row in self.chunks.values()]
+        elif query.startswith("SELECT content_hash, EXISTS"):
+            cursor.fetchone.return_value = {"content_hash": self.content_hash, "has_chunks": bool(self.chunks)}
+        elif query.startswith("SELECT content_hash FROM documents"):
+            cursor.fetchone.return_value = {"content_hash": self.content_hash}
+        elif query.startswith("SELECT chat_id, workflow_id FROM documents"):
+            cursor.fetchone.return_value = {"chat_id": 7, "workflow_id": None}
+        elif query.startswith("DELETE FROM chunks WHERE id"):
+            for chunk_id in params:
+                del self.chunks[chunk_id]
+        elif query.startswith("UPDATE chunks SET start_index"):
+            start, end, page_number, chunk_id = params
+            self.chunks[chunk_id].update(start_index=start, end_index=end, page_number=page_number)
+        elif query.startswith("INSERT INTO chunks") and "SELECT" in query:
+            row = self.chunks[params[0]]
+            self._insert(row["start_index"], row["end_index"], row["page_number"])
+        elif query.startswith("INSERT INTO chunks"):
+            self._insert(params[0], params[1], params[-1])
+        elif query.startswith("UPDATE documents SET document_text"):
+            self.text, self.content_hash = params[0], params[1]
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+
+class TestReingestDocumentChunks(unittest.TestCase):
+    """Re-ingesting against the chunk rows of one document"""
+
+    def test_move_only_edit_changes_corpus_fingerprint(self):
+        from api_endpoints.financeGPT import chatbot_endpoints
+
+        rng = random.Random(5)
+        splitter = chatbot_endpoints._get_text_splitter(300)
+        old_text = "\n\n".join(_paragraph(rng) for _ in range(30))
+        rows = [dict(row, page_number=None) for row in _chunk_rows(splitter, [old_text])]
+        # A leading blank line lies outside every chunk: all chunks move, none change
+        new_text = "\n" + old_text
+        database = FakeDatabase(11, old_text, rows)
+        fingerprint = database.fingerprint()
+
+        with patch.object(chatbot_endpoints, "get_db_connection", side_effect=database.connection), \
+                patch.object(chatbot_endpoints, "get_embeddings_batch") as mock_embed, \
+                patch.object(chatbot_endpoints, "ann_index_store") as mock_ann_index:
+            embedded = chatbot_endpoints.reingest_document_chunks([new_text], 300, 11, numbered_pages=False)
+
+        self.assertEqual(embedded, 0)
+        mock_embed.assert_not_called()
+        mock_ann_index.drop.assert_called_once()
+        self.assertEqual(database.text, new_text)
+        self.assertNotEqual(database.fingerprint(), fingerprint)
+        self.assertEqual(sorted(new_text[row["start_index"]:row["end_index"]] for row in database.chunks.values()),
+                         sorted(old_text[row["start_index"]:row["end_index"]] for row in rows))
+
+    def test_page_generator_is_read_once(self):
+        from api_endpoints.financeGPT import chatbot_endpoints
+
+        rng = random.Random(6)
+        splitter = chatbot_endpoints._get_text_splitter(300)
+        old_text = "\n\n".join(_paragraph(rng) for _ in range(30))
+        rows = [dict(row, page_number=None) for row in _chunk_rows(splitter, [old_text])]
+        new_text = old_text + "\n\n" + _paragraph(rng)
+        database = FakeDatabase(11, old_text, rows)
+
+        with patch.object(chatbot_endpoints, "get_db_connection", side_effect=database.connection), \
+                patch.object(chatbot_endpoints, "get_embeddings_batch",
+                             side_effect=lambda texts, **kwargs: [[0.0] * 768 for _ in texts]), \
+                patch.object(chatbot_endpoints, "ann_index_store"):
+            chatbot_endpoints.ingest_document_chunks((page for page in [new_text]), 300, 11, numbered_pages=False)
+
+        self.assertEqual(database.text, new_text)
+        self.assertEqual(max(row["end_index"] for row in database.chunks.values()), len(new_text))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.embedding_batching import encode_length_bucketed, plan_token_batches, token_lengths
+
+
+class FakeModel:
+    """Embeds a text as [its length, its first character code] and records the batches it was given"""
+
+    max_seq_length = 512
+    tokenizer = None
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        self.batches.append(list(texts))
+        return np.array([[len(text), ord(text[0])] for text in texts], dtype=np.float32)
+
+
+class TestPlanTokenBatches(unittest.TestCase):
+    """Grouping texts by token length under a padded-token budget"""
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.lengths = [rng.choice([3, 8, 20, 120, 400, 512]) for _ in range(500)]
+
+    def test_batches_respect_the_budget_and_max_batch(self):
+        batches = plan_token_batches(self.lengths, token_budget=2048, max_batch=32)
+        for batch in batches:
+            self.assertLessEqual(len(batch), 32)
+            self.assertLessEqual(len(batch) * max(self.lengths[i] for i in batch), 2048)
+
+    def test_every_text_is_in_exactly_one_batch(self):
+        batches = plan_token_batches(self.lengths, token_budget=2048, max_batch=32)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(self.lengths))))
+
+    def test_text_longer_than_the_budget_gets_its_own_batch(self):
+        self.assertEqual(plan_token_batches([5, 600, 5], token_budget=256, max_batch=8), [[1], [0, 2]])
+
+    def test_no_texts(self):
+        self.assertEqual(plan_token_batches([], token_budget=256, max_batch=8), [])
+
+
+class TestEncodeLengthBucketed(unittest.TestCase):
+    """Embedding in length-sorted batches without reordering the output"""
+
+    def test_embeddings_come_back_in_input_order(self):
+        rng = random.Random(1)
+        texts = [chr(ord("a") + i % 26) * rng.randint(1, 1500) for i in range(300)]
+        model = FakeModel()
+
+        embeddings = encode_length_bucketed(model, texts, token_budget=4096, max_batch=16)
+
+        self.assertEqual(embeddings, [[float(len(text)), float(ord(text[0]))] for text in texts])
+        self.assertGreater(len(model.batches), 1)
+        lengths = dict(zip(texts, token_lengths(model, texts)))
+        for batch in model.batches:
+            self.assertLessEqual(len(batch), 16)
+            self.assertLessEqual(len(batch) * max(lengths[text] for text in batch), 4096)
+
+    def test_no_texts(self):
+        model = FakeModel()
+        self.assertEqual(encode_length_bucketed(model, []), [])
+        self.assertEqual(model.batches, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
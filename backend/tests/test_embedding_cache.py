@@ -0,0 +1,104 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.embedding_cache import ChunkEmbeddingStore
+from api_endpoints.financeGPT.embedding_format import encode_embedding
+
+
+class DatabaseError(Exception):
+    def __init__(self, errno):
+        super().__init__(f"error {errno}")
+        self.errno = errno
+
+
+class TestChunkEmbeddingStore(unittest.TestCase):
+    """Which database errors turn the chunk embedding cache off"""
+
+    @patch("api_endpoints.financeGPT.embedding_cache.get_db_connection")
+    def test_missing_table_disables_store(self, mock_get_db_connection):
+        cursor = MagicMock()
+        cursor.execute.side_effect = DatabaseError(1146)
+        mock_get_db_connection.return_value = (MagicMock(), cursor)
+
+        store = ChunkEmbeddingStore(enabled=True)
+        self.assertEqual(store.get_many(["key"]), {})
+        self.assertFalse(store.enabled)
+
+    @patch("api_endpoints.financeGPT.embedding_cache.get_db_connection")
+    def test_transient_errors_only_skip_the_call(self, mock_get_db_connection):
+        cursor = MagicMock()
+        cursor.execute.side_effect = DatabaseError(2013)
+        cursor.executemany.side_effect = DatabaseError(1213)
+        mock_get_db_connection.return_value = (MagicMock(), cursor)
+
+        store = ChunkEmbeddingStore(enabled=True)
+        self.assertEqual(store.get_many(["key"]), {})
+        store.put_many([("key", [0.0, 1.0])])
+        self.assertTrue(store.enabled)
+
+
+
+class TestChunkEmbeddingStorePruning(unittest.TestCase):
+    """Keeping the chunk embedding cache from growing without bound"""
+
+    @patch("api_endpoints.financeGPT.embedding_cache.get_db_connection")
+    def test_hits_refresh_last_used(self, mock_get_db_connection):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [{"text_hash": "a", "embedding_vector": encode_embedding([0.0, 1.0])}]
+        mock_get_db_connection.return_value = (MagicMock(), cursor)
+
+        found = ChunkEmbeddingStore(enabled=True).get_many(["a", "b"])
+
+        self.assertEqual(found, {"a": [0.0, 1.0]})
+        query, params = cursor.execute.call_args_list[-1].args
+        self.assertTrue(query.startswith("UPDATE chunk_embedding_cache SET last_used"))
+        self.assertEqual(params, ["a"])
+
+    @patch("api_endpoints.financeGPT.embedding_cache._PRUNE_BATCH_SIZE", 2)
+    @patch("api_endpoints.financeGPT.embedding_cache.get_db_connection")
+    def test_prune_deletes_in_batches(self, mock_get_db_connection):
+        cursor = MagicMock()
+        rowcounts = iter([2, 2, 1])
+
+        def execute(query, params):
+            self.assertTrue(query.startswith("DELETE FROM chunk_embedding_cache WHERE last_used"))
+            self.assertEqual(params, (7, 2))
+            cursor.rowcount = next(rowcounts)
+        cursor.execute.side_effect = execute
+        mock_get_db_connection.return_value = (MagicMock(), cursor)
+
+        self.assertEqual(ChunkEmbeddingStore(enabled=True).prune(max_age_days=7), 5)
+        self.assertEqual(cursor.execute.call_count, 3)
+
+    @patch("api_endpoints.financeGPT.embedding_cache.get_db_connection")
+    def test_missing_last_used_column_only_stops_pruning(self, mock_get_db_connection):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [{"text_hash": "a", "embedding_vector": encode_embedding([0.0, 1.0])}]
+        cursor.execute.side_effect = [None, DatabaseError(1054)]
+        mock_get_db_connection.return_value = (MagicMock(), cursor)
+
+        store = ChunkEmbeddingStore(enabled=True)
+        self.assertEqual(store.get_many(["a"]), {"a": [0.0, 1.0]})
+        self.assertTrue(store.enabled)
+        self.assertFalse(store.track_usage)
+        self.assertEqual(store.prune(), 0)
+
+    @patch("api_endpoints.financeGPT.embedding_cache.threading.Thread")
+    @patch("api_endpoints.financeGPT.embedding_cache.get_db_connection")
+    def test_writes_prune_at_most_once_per_interval(self, mock_get_db_connection, mock_thread):
+        mock_get_db_connection.return_value = (MagicMock(), MagicMock())
+
+        store = ChunkEmbeddingStore(enabled=True, max_age_days=30, prune_interval_seconds=3600)
+        store.put_many([("a", [0.0, 1.0])])
+        store.put_many([("b", [1.0, 0.0])])
+
+        mock_thread.assert_called_once_with(target=store.prune, daemon=True)
+        mock_thread.return_value.start.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
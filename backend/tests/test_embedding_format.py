@@ -0,0 +1,152 @@
+import os
+import struct
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.embedding_format import (
+    decode_embedding, decode_embedding_code, encode_embedding, encode_embedding_code, is_legacy_embedding,
+)
+
+DIMENSIONS = 768
+
+
+def _vector(seed=0, dimensions=DIMENSIONS):
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return vector / np.linalg.norm(vector)
+
+
+class TestEmbeddingFormat(unittest.TestCase):
+    """Versioned embedding BLOBs and the legacy float64 fallback"""
+
+    def test_float32_round_trip(self):
+        vector = _vector()
+        blob = encode_embedding(vector)
+
+        self.assertEqual(len(blob), 8 + DIMENSIONS * 4)
+        self.assertFalse(is_legacy_embedding(blob))
+        decoded = decode_embedding(blob)
+        self.assertEqual(decoded.dtype, np.float32)
+        np.testing.assert_array_equal(decoded, vector.astype(np.float32))
+
+    def test_float16_round_trip(self):
+        vector = _vector()
+        decoded = decode_embedding(encode_embedding(vector, dtype=np.float16))
+
+        self.assertEqual(decoded.dtype, np.float16)
+        np.testing.assert_allclose(decoded, vector, atol=1e-3)
+
+    def test_legacy_float64_blob_is_decoded(self):
+        vector = _vector()
+        blob = np.array(vector).tobytes()
+
+        self.assertTrue(is_legacy_embedding(blob))
+        np.testing.assert_array_equal(decode_embedding(blob), vector)
+
+    def test_truncated_or_invalid_header_is_rejected(self):
+        blob = encode_embedding(_vector())
+
+        # Truncated: neither a v1 BLOB nor a whole number of float64 values
+        self.assertIsNone(decode_embedding(blob[:-3]))
+        self.assertIsNone(decode_embedding(blob[:5]))
+        self.assertIsNone(decode_embedding(b""))
+        self.assertIsNone(decode_embedding(None))
+        # Unknown dtype code or version: the header no longer parses and the length is not a legacy one
+        for header in (struct.pack("<2sBBI", b"EV", 1, 9, DIMENSIONS), struct.pack("<2sBBI", b"EV", 2, 1, DIMENSIONS)):
+            self.assertIsNone(decode_embedding(header + blob[8:] + b"\0"))
+        # Dimensions in the header that do not match the payload
+        self.assertIsNone(decode_embedding(struct.pack("<2sBBI", b"EV", 1, 1, DIMENSIONS + 1) + blob[8:] + b"\0"))
+
+    def test_code_blobs_are_not_decoded_as_vectors(self):
+        vector = _vector()
+        for kind in ("int8", "binary"):
+            blob = encode_embedding_code(vector, kind)
+
+            self.assertIsNone(decode_embedding(blob))
+            self.assertIsNone(decode_embedding_code(encode_embedding(vector), kind))
+            codes, scale, dimensions = decode_embedding_code(blob, kind)
+            self.assertEqual(dimensions, DIMENSIONS)
+        self.assertIsNone(decode_embedding_code(encode_embedding_code(vector, "int8"), "binary"))
+
+    def test_unsupported_storage_dtype_raises(self):
+        with self.assertRaises(ValueError):
+            encode_embedding(_vector(), dtype=np.float64)
+
+
+class FakeEmbeddingTables:
+    """chunks and chat_share_chunks rows, queried the way migrate_legacy_embeddings queries them"""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def connection(self):
+        cursor = MagicMock()
+        cursor.execute.side_effect = lambda query, params: self._select(cursor, query, params)
+        cursor.executemany.side_effect = self._update
+        return MagicMock(), cursor
+
+    def _select(self, cursor, query, params):
+        table = query.split(" FROM ")[1].split()[0]
+        last_id, *condition, limit = params
+        if condition:
+            matches = lambda row: len(row["embedding_vector"]) == condition[0]
+        else:
+            matches = lambda row: row.get("embedding_int8") is None or row.get("embedding_binary") is None
+        rows = [{"id": row_id, "embedding_vector": row["embedding_vector"]}
+                for row_id, row in sorted(self.tables[table].items()) if row_id > last_id and matches(row)]
+        cursor.fetchall.return_value = rows[:limit]
+
+    def _update(self, query, updates):
+        table = query.split()[1]
+        for *values, row_id in updates:
+            if len(values) == 1:
+                self.tables[table][row_id]["embedding_vector"] = values[0]
+            else:
+                self.tables[table][row_id].update(embedding_int8=values[0], embedding_binary=values[1])
+
+
+class TestMigrateLegacyEmbeddings(unittest.TestCase):
+    """Rewriting legacy float64 rows in place"""
+
+    def test_only_rows_of_legacy_length_are_rewritten(self):
+        from api_endpoints.financeGPT import chatbot_endpoints
+
+        legacy, current, short = _vector(1), _vector(2), _vector(3, dimensions=384)
+        current_blob = encode_embedding(current)
+        short_blob = np.array(short).tobytes()
+        tables = FakeEmbeddingTables({
+            "chunks": {
+                1: {"embedding_vector": np.array(legacy).tobytes(), "embedding_int8": None, "embedding_binary": None},
+                2: {"embedding_vector": current_blob, "embedding_int8": b"code", "embedding_binary": b"code"},
+                3: {"embedding_vector": short_blob, "embedding_int8": b"code", "embedding_binary": b"code"},
+                4: {"embedding_vector": current_blob, "embedding_int8": None, "embedding_binary": None},
+            },
+            "chat_share_chunks": {
+                1: {"embedding_vector": np.array(legacy).tobytes()},
+                2: {"embedding_vector": current_blob},
+            },
+        })
+
+        with patch.object(chatbot_endpoints, "get_db_connection", side_effect=tables.connection):
+            migrated = chatbot_endpoints.migrate_legacy_embeddings(batch_size=1, pause_seconds=0)
+
+        chunks, shared = tables.tables["chunks"], tables.tables["chat_share_chunks"]
+        # Two legacy rows rewritten, then codes backfilled for the two chunks without them
+        self.assertEqual(migrated, 4)
+        for row in (chunks[1], shared[1]):
+            self.assertFalse(is_legacy_embedding(row["embedding_vector"]))
+            np.testing.assert_array_equal(decode_embedding(row["embedding_vector"]), legacy.astype(np.float32))
+        self.assertEqual(chunks[2]["embedding_vector"], current_blob)
+        self.assertEqual(chunks[3]["embedding_vector"], short_blob)
+        self.assertEqual(shared[2]["embedding_vector"], current_blob)
+        for row in (chunks[1], chunks[4]):
+            self.assertEqual(decode_embedding_code(row["embedding_int8"], "int8")[2], DIMENSIONS)
+            self.assertEqual(decode_embedding_code(row["embedding_binary"], "binary")[2], DIMENSIONS)
+
+
+if __name__ == "__main__":
+    unittest.main()
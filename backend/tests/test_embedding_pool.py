@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT import embedding_pool
+from api_endpoints.financeGPT.embedding_pool import EmbeddingPool, EmbeddingWorker
+
+
+def _embed(texts):
+    # Stands in for the model: one recognisable vector per text
+    return [[float(len(text)), float(ord(text[0]))] for text in texts]
+
+
+class TestEmbeddingWorkerBatching(unittest.TestCase):
+    """Merging concurrent encode() requests on one worker into model calls"""
+
+    def setUp(self):
+        self.model_calls = []
+
+        def encode_length_bucketed(model, texts):
+            self.model_calls.append(list(texts))
+            return _embed(texts)
+
+        patcher = patch.object(embedding_pool, "encode_length_bucketed", side_effect=encode_length_bucketed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        loader = patch.object(embedding_pool, "load_embedding_model", return_value=MagicMock())
+        loader.start()
+        self.addCleanup(loader.stop)
+
+    def _run(self, requests, **worker_options):
+        # The actor class itself, driven on a local event loop instead of in a Ray worker
+        worker = EmbeddingWorker.__ray_actor_class__("model", **worker_options)
+
+        async def encode_all():
+            return await asyncio.gather(*(worker.encode(texts) for texts in requests))
+        return asyncio.run(encode_all())
+
+    def test_concurrent_requests_share_one_model_call(self):
+        requests = [["alpha", "be"], ["gamma"], ["delta", "epsilon", "z"]]
+
+        results = self._run(requests, max_batch=128, batch_wait_ms=50)
+
+        self.assertEqual(self.model_calls, [[text for texts in requests for text in texts]])
+        self.assertEqual(results, [_embed(texts) for texts in requests])
+
+    def test_batches_stop_at_max_batch(self):
+        requests = [["a"], ["bb"], ["ccc"], ["dddd"], ["eeeee"]]
+
+        results = self._run(requests, max_batch=2, batch_wait_ms=50)
+
+        self.assertEqual([len(call) for call in self.model_calls], [2, 2, 1])
+        self.assertEqual(results, [_embed(texts) for texts in requests])
+
+    def test_model_error_fails_every_request_in_the_batch(self):
+        embedding_pool.encode_length_bucketed.side_effect = RuntimeError("CUDA out of memory")
+        worker = EmbeddingWorker.__ray_actor_class__("model", max_batch=128, batch_wait_ms=50)
+
+        async def encode_all():
+            return await asyncio.gather(worker.encode(["a"]), worker.encode(["b"]), return_exceptions=True)
+        results = asyncio.run(encode_all())
+
+        self.assertEqual([str(result) for result in results], ["CUDA out of memory"] * 2)
+
+
+class TestEmbeddingPool(unittest.TestCase):
+    """Spreading batches over the pool's workers and reassembling the results"""
+
+    def setUp(self):
+        self.texts = [chr(ord("a") + i) * (i % 5 + 1) for i in range(11)]
+
+    def test_process_backend_keeps_text_order(self):
+        pool = EmbeddingPool("model", size=2, backend="process")
+        pool._executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool._executor.shutdown)
+
+        with patch.object(embedding_pool, "_process_model", MagicMock()), \
+                patch.object(embedding_pool, "encode_length_bucketed", side_effect=lambda model, texts: _embed(texts)):
+            embeddings = pool.encode(self.texts, batch_size=3)
+
+        self.assertEqual(embeddings, _embed(self.texts))
+
+    def test_ray_backend_round_robins_batches_and_keeps_text_order(self):
+        pool = EmbeddingPool("model", size=2, backend="ray")
+        workers = [MagicMock(), MagicMock()]
+        for worker in workers:
+            worker.encode.remote.side_effect = _embed
+        pool._workers = workers
+
+        with patch.object(embedding_pool.ray, "get", side_effect=lambda refs: refs):
+            embeddings = pool.encode(self.texts, batch_size=3)
+
+        self.assertEqual(embeddings, _embed(self.texts))
+        sent = [[call.args[0] for call in worker.encode.remote.call_args_list] for worker in workers]
+        self.assertEqual(sent, [[self.texts[0:3], self.texts[6:9]], [self.texts[3:6], self.texts[9:11]]])
+
+
+if __name__ == "__main__":
+    unittest.main()
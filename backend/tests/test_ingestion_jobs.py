@@ -0,0 +1,139 @@
+import datetime
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT import ingestion_jobs
+from api_endpoints.financeGPT.ingestion_jobs import (
+    JOB_COMPLETED, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, create_ingestion_job, existing_ingestion_job,
+    fail_ingestion_job, finish_ingestion_job, get_ingestion_job, record_ingestion_progress, start_ingestion_job,
+)
+
+OWNER = "owner@example.com"
+
+
+class FakeJobsTable:
+    """The ingestion_jobs rows of documents owned by OWNER, updated by the module's statements"""
+
+    def __init__(self, chunks_per_document=None):
+        self.jobs = {}
+        self.chunks_per_document = chunks_per_document or {}
+        self.clock = datetime.datetime(2024, 1, 1)
+
+    def connection(self):
+        cursor = MagicMock()
+        cursor.execute.side_effect = lambda query, params: self._execute(cursor, " ".join(query.split()), params)
+        return MagicMock(), cursor
+
+    def _execute(self, cursor, query, params):
+        self.clock += datetime.timedelta(seconds=2)
+        if query.startswith("INSERT INTO ingestion_jobs (id, document_id, status, pages_parsed) VALUES"):
+            job_id, document_id, status, pages_parsed = params
+            self.jobs[job_id] = {"id": job_id, "document_id": document_id, "status": status,
+                                 "pages_parsed": pages_parsed, "chunks_embedded": 0, "rows_inserted": 0,
+                                 "error": None, "created": self.clock, "started": None, "finished": None}
+        elif query.startswith("INSERT INTO ingestion_jobs"):
+            job_id, document_id, status, pages_parsed, _ = params
+            chunks = self.chunks_per_document.get(document_id, 0)
+            self.jobs[job_id] = {"id": job_id, "document_id": document_id, "status": status,
+                                 "pages_parsed": pages_parsed, "chunks_embedded": chunks, "rows_inserted": chunks,
+                                 "error": None, "created": self.clock, "started": self.clock, "finished": self.clock}
+        elif query.startswith("SELECT id, status FROM ingestion_jobs"):
+            jobs = sorted((job for job in self.jobs.values() if job["document_id"] == params[0]),
+                          key=lambda job: job["created"], reverse=True)
+            cursor.fetchone.return_value = {"id": jobs[0]["id"], "status": jobs[0]["status"]} if jobs else None
+        elif query.startswith("UPDATE ingestion_jobs SET status = %s, started"):
+            self.jobs[params[1]].update(status=params[0], started=self.clock)
+        elif query.startswith("UPDATE ingestion_jobs SET chunks_embedded"):
+            self.jobs[params[2]].update(chunks_embedded=params[0], rows_inserted=params[1])
+        elif query.startswith("UPDATE ingestion_jobs SET status = %s, error = %s, finished"):
+            status, error, job_id, *unfinished = params
+            if not unfinished or self.jobs[job_id]["status"] in unfinished:
+                self.jobs[job_id].update(status=status, error=error, finished=self.clock)
+        elif "FROM ingestion_jobs j" in query:
+            job_id, email = params
+            job = self.jobs.get(job_id)
+            if job is None or email != OWNER:
+                cursor.fetchone.return_value = None
+                return
+            elapsed = ((job["finished"] or self.clock) - job["started"]).total_seconds() if job["started"] else None
+            cursor.fetchone.return_value = dict(job, document_name="10k.pdf", elapsed_seconds=elapsed)
+        else:
+            raise AssertionError(f"Unexpected query: {query}")
+
+
+class TestIngestionJobs(unittest.TestCase):
+    """A job's states from upload to searchable, as clients polling it see them"""
+
+    def setUp(self):
+        self.table = FakeJobsTable({12: 40})
+        patcher = patch.object(ingestion_jobs, "get_db_connection", side_effect=self.table.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_job_moves_from_queued_to_completed(self):
+        job_id = create_ingestion_job(11, pages_parsed=3)
+        self.assertEqual(get_ingestion_job(job_id, OWNER)["status"], JOB_QUEUED)
+        self.assertIsNone(get_ingestion_job(job_id, OWNER)["elapsed_seconds"])
+
+        conn, cursor = self.table.connection()
+        start_ingestion_job(cursor, job_id)
+        record_ingestion_progress(cursor, job_id, 64, 32)
+        job = get_ingestion_job(job_id, OWNER)
+        self.assertEqual((job["status"], job["chunks_embedded"], job["rows_inserted"]), (JOB_RUNNING, 64, 32))
+        self.assertIsNone(job["finished"])
+
+        record_ingestion_progress(cursor, job_id, 100, 100)
+        finish_ingestion_job(cursor, job_id)
+        job = get_ingestion_job(job_id, OWNER)
+        self.assertEqual(job["status"], JOB_COMPLETED)
+        self.assertEqual(job["pages_parsed"], 3)
+        self.assertIsNone(job["error"])
+        self.assertEqual(job["chunks_per_second"], 100 / job["elapsed_seconds"])
+        self.assertIsNotNone(job["finished"])
+
+    def test_failed_job_keeps_its_error(self):
+        job_id = create_ingestion_job(11)
+        conn, cursor = self.table.connection()
+        start_ingestion_job(cursor, job_id)
+        finish_ingestion_job(cursor, job_id, error=RuntimeError("embedding failed"))
+
+        job = get_ingestion_job(job_id, OWNER)
+        self.assertEqual((job["status"], job["error"]), (JOB_FAILED, "embedding failed"))
+
+    def test_fail_ingestion_job_leaves_finished_jobs_alone(self):
+        queued = create_ingestion_job(11)
+        fail_ingestion_job(queued, RuntimeError("Ray task died"))
+        self.assertEqual(get_ingestion_job(queued, OWNER)["status"], JOB_FAILED)
+
+        completed = create_ingestion_job(11)
+        conn, cursor = self.table.connection()
+        finish_ingestion_job(cursor, completed)
+        fail_ingestion_job(completed, RuntimeError("late failure"))
+        job = get_ingestion_job(completed, OWNER)
+        self.assertEqual((job["status"], job["error"]), (JOB_COMPLETED, None))
+
+    def test_existing_ingestion_job_reuses_the_latest_job(self):
+        first = create_ingestion_job(11)
+        latest = create_ingestion_job(11)
+        self.assertNotEqual(first, latest)
+        self.assertEqual(existing_ingestion_job(11), (latest, JOB_QUEUED))
+
+    def test_existing_ingestion_job_completes_a_document_without_jobs(self):
+        job_id, status = existing_ingestion_job(12, pages_parsed=5)
+
+        self.assertEqual(status, JOB_COMPLETED)
+        job = get_ingestion_job(job_id, OWNER)
+        self.assertEqual((job["status"], job["rows_inserted"], job["pages_parsed"]), (JOB_COMPLETED, 40, 5))
+
+    def test_other_users_and_unknown_jobs_are_not_found(self):
+        job_id = create_ingestion_job(11)
+        self.assertIsNone(get_ingestion_job(job_id, "someone@example.com"))
+        self.assertIsNone(get_ingestion_job("missing", OWNER))
+
+
+if __name__ == "__main__":
+    unittest.main()
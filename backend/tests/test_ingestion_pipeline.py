@@ -0,0 +1,79 @@
+import itertools
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.ingestion_pipeline import batched, run_pipeline
+
+
+class TestRunPipeline(unittest.TestCase):
+    """Threads and bounded queues between ingestion stages"""
+
+    def test_items_flow_through_every_stage_in_order(self):
+        received = []
+        run_pipeline(range(50), [lambda item: item * 2, lambda item: item + 1, received.append], queue_size=3)
+        self.assertEqual(received, [item * 2 + 1 for item in range(50)])
+
+    def test_slow_sink_bounds_how_far_the_source_runs_ahead(self):
+        produced = []
+        release = threading.Event()
+
+        def source():
+            for item in range(100):
+                produced.append(item)
+                yield item
+
+        def sink(item):
+            release.wait()
+
+        runner = threading.Thread(target=run_pipeline, args=(source(), [lambda item: item, sink]),
+                                  kwargs={"queue_size": 2})
+        runner.start()
+        time.sleep(0.5)
+        # Two full queues, one item in each stage and one the source is trying to put
+        self.assertLessEqual(len(produced), 2 * 2 + 3)
+        release.set()
+        runner.join(timeout=10)
+        self.assertFalse(runner.is_alive())
+        self.assertEqual(len(produced), 100)
+
+    def test_stage_error_stops_the_pipeline_and_is_raised(self):
+        consumed = []
+
+        def source():
+            for item in itertools.count():
+                consumed.append(item)
+                yield item
+
+        def embed(item):
+            if item == 3:
+                raise RuntimeError("embedding failed")
+            return item
+
+        with self.assertRaisesRegex(RuntimeError, "embedding failed"):
+            run_pipeline(source(), [embed, lambda item: None], queue_size=2)
+        # The endless source was abandoned once the stage failed
+        self.assertLess(len(consumed), 20)
+
+    def test_source_error_is_raised(self):
+        def source():
+            yield 1
+            raise ValueError("bad page")
+
+        received = []
+        with self.assertRaisesRegex(ValueError, "bad page"):
+            run_pipeline(source(), [received.append])
+
+
+class TestBatched(unittest.TestCase):
+    def test_batches_keep_order_and_the_last_may_be_short(self):
+        self.assertEqual(list(batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(batched([], 3)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
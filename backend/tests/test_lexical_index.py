@@ -0,0 +1,58 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.lexical_index import LexicalIndexStore, term_counts
+
+
+def _rows(texts, first_id=1):
+    return [(chunk_id, term_counts(text)) for chunk_id, text in enumerate(texts, start=first_id)]
+
+
+class TestLexicalIndexStore(unittest.TestCase):
+    """Bringing cached BM25 indexes up to a corpus fingerprint"""
+
+    def test_new_chunks_extend_the_index(self):
+        store = LexicalIndexStore()
+        rows = _rows(["revenue grew", "debt fell", "revenue guidance raised"])
+        loads = []
+
+        def load_rows_after(chunk_id):
+            loads.append(chunk_id)
+            return [row for row in rows if row[0] > chunk_id]
+
+        index = store.refresh(("chat", 1), (2, 2), lambda chunk_id: load_rows_after(chunk_id)[:2])
+        self.assertEqual(len(index), 2)
+        index = store.refresh(("chat", 1), (3, 3), load_rows_after)
+        self.assertEqual((len(index), index.max_chunk_id), (3, 3))
+        self.assertEqual(loads, [0, 2])
+        self.assertEqual(list(index.search("revenue", 5)[0]), [1, 3])
+
+    def test_deleted_chunks_rebuild_the_index(self):
+        store = LexicalIndexStore()
+        store.refresh(("chat", 1), (3, 3), lambda chunk_id: _rows(["a b", "c d", "e f"])[chunk_id:])
+        index = store.refresh(("chat", 1), (2, 4), lambda chunk_id: [row for row in _rows(["c d", "e f", "g h"], 2)
+                                                                    if row[0] > chunk_id and row[0] != 3])
+        self.assertEqual((len(index), index.max_chunk_id), (2, 4))
+
+    def test_rows_are_loaded_without_holding_the_lock(self):
+        store = LexicalIndexStore()
+        acquired = []
+
+        def load_rows_after(chunk_id):
+            # Another thread must be able to use the store while a corpus is loading
+            thread = threading.Thread(target=lambda: acquired.append(store._lock.acquire(timeout=1) and
+                                                                     store._lock.release() is None))
+            thread.start()
+            thread.join()
+            return _rows(["revenue"])
+
+        store.refresh(("chat", 1), (1, 1), load_rows_after)
+        self.assertEqual(acquired, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import io
+import os
+import pickle
+import sys
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock, patch
+
+from fpdf import FPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT import pdf_extraction
+from api_endpoints.financeGPT.pdf_extraction import iter_pdf_pages, parse_pdf
+
+
+def _pdf_bytes(page_count):
+    pdf = FPDF()
+    pdf.set_font("Arial", size=12)
+    for page in range(1, page_count + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, txt=f"Page {page} of the filing")
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def _page_numbers(pages):
+    return [int(text.split()[1]) for text in pages]
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _broken():
+    future = Future()
+    future.set_exception(BrokenProcessPool("worker died"))
+    return future
+
+
+class TestIterPdfPages(unittest.TestCase):
+    """Page order and the in-process fallbacks of PDF extraction"""
+
+    def setUp(self):
+        self.data = _pdf_bytes(9)
+        for name, value in (("PDF_PARALLEL_MIN_PAGES", 2), ("PDF_PAGES_PER_TASK", 2), ("PDF_EXTRACT_WORKERS", 2)):
+            patcher = patch.object(pdf_extraction, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(pdf_extraction._reset_executor)
+
+    def test_short_pdf_is_extracted_in_process(self):
+        with patch.object(pdf_extraction, "PDF_PARALLEL_MIN_PAGES", 40), \
+                patch.object(pdf_extraction, "_get_executor") as mock_get_executor:
+            pages = list(iter_pdf_pages(self.data))
+
+        self.assertEqual(_page_numbers(pages), list(range(1, 10)))
+        mock_get_executor.assert_not_called()
+
+    def test_process_pool_yields_pages_in_order(self):
+        executor = pdf_extraction._get_executor()
+        self.addCleanup(executor.shutdown)
+
+        pages = list(iter_pdf_pages(self.data))
+
+        self.assertEqual(_page_numbers(pages), list(range(1, 10)))
+
+    def test_broken_pool_falls_back_to_in_process_extraction(self):
+        executor = MagicMock()
+        # Pages 1-2 come from the pool, then a worker dies
+        executor.submit.side_effect = [_done(["Page 1", "Page 2"]), _broken(), _broken(), _broken(), _broken()]
+        pdf_extraction._executor = executor
+
+        pages = list(iter_pdf_pages(self.data))
+
+        self.assertEqual(_page_numbers(pages), list(range(1, 10)))
+        self.assertIsNone(pdf_extraction._executor)
+
+    def test_pool_that_cannot_start_falls_back_to_in_process_extraction(self):
+        with patch.object(pdf_extraction, "_get_executor", side_effect=RuntimeError("cannot start new process")):
+            pages = list(iter_pdf_pages(self.data))
+
+        self.assertEqual(_page_numbers(pages), list(range(1, 10)))
+
+    def test_file_objects_are_rewound(self):
+        stream = io.BytesIO(self.data)
+        with patch.object(pdf_extraction, "PDF_PARALLEL_MIN_PAGES", 40):
+            list(iter_pdf_pages(stream))
+        self.assertEqual(stream.tell(), 0)
+
+
+class TestParsedDocument(unittest.TestCase):
+    def test_text_and_page_offsets_line_up(self):
+        with patch.object(pdf_extraction, "PDF_PARALLEL_MIN_PAGES", 40):
+            document = parse_pdf(_pdf_bytes(3), name="10k.pdf")
+
+        self.assertEqual(document.page_count, 3)
+        for offset, page in zip(document.page_offsets, document.pages):
+            self.assertEqual(document.text[offset:offset + len(page)], page)
+
+        restored = pickle.loads(pickle.dumps(document))
+        self.assertEqual((restored.name, restored.pages, restored.text), (document.name, document.pages, document.text))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import importlib
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT import quantization
+from api_endpoints.financeGPT.embedding_format import encode_embedding_code
+from api_endpoints.financeGPT.quantization import build_quantized_matrix
+
+DIMENSIONS = 100
+
+
+def _unit_vectors(num_vectors, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((num_vectors, DIMENSIONS))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _rows(vectors, kind):
+    # Half the rows carry a stored code, half only the full vector (chunks written before codes existed)
+    return [
+        {"id": i, "embedding_code": encode_embedding_code(vector, kind)} if i % 2 == 0
+        else {"id": i, "embedding_code": None, "embedding_vector": vector}
+        for i, vector in enumerate(vectors)
+    ]
+
+
+class TestQuantizedMatrix(unittest.TestCase):
+    """Scores and vectors of int8 and binary codes against float32"""
+
+    def setUp(self):
+        self.vectors = _unit_vectors(200)
+        self.queries = _unit_vectors(5, seed=1)
+        self.exact = self.queries @ self.vectors.T
+
+    def build(self, kind):
+        matrix, kept = build_quantized_matrix(_rows(self.vectors, kind), kind, DIMENSIONS, lambda blob: blob)
+        self.assertEqual(len(kept), len(self.vectors))
+        self.assertEqual(matrix.shape, (len(self.vectors), DIMENSIONS))
+        return matrix
+
+    def test_int8_round_trip(self):
+        matrix = self.build("int8")
+
+        np.testing.assert_allclose(matrix.vectors(np.arange(len(self.vectors))), self.vectors, atol=0.01)
+        np.testing.assert_allclose(matrix.similarities(self.queries), self.exact, atol=0.02)
+        self.assertEqual(matrix.nbytes, len(self.vectors) * (DIMENSIONS + 4))
+
+    def test_binary_round_trip(self):
+        matrix = self.build("binary")
+
+        signs = np.sign(matrix.vectors(np.arange(len(self.vectors))))
+        np.testing.assert_array_equal(signs, np.where(self.vectors > 0, 1.0, -1.0))
+        scores = matrix.similarities(self.queries)
+        expected = 1.0 - 2.0 * ((self.queries[:, None, :] > 0) != (self.vectors[None, :, :] > 0)).sum(axis=2) / DIMENSIONS
+        np.testing.assert_allclose(scores, expected, atol=1e-6)
+        self.assertEqual(matrix.codes.shape, (len(self.vectors), (DIMENSIONS + 7) // 8))
+
+    def test_subset_keeps_rows_in_order(self):
+        matrix = self.build("int8")
+        rows = np.array([7, 3, 150])
+
+        np.testing.assert_allclose(matrix.subset(rows).similarities(self.queries),
+                                   matrix.similarities(self.queries)[:, rows], rtol=1e-5)
+
+    def test_rows_with_bad_dimensions_are_skipped(self):
+        rows = _rows(self.vectors[:3], "int8") + [{"id": 3, "embedding_code": None, "embedding_vector": self.vectors[0][:10]}]
+
+        matrix, kept = build_quantized_matrix(rows, "int8", DIMENSIONS, lambda blob: blob)
+        self.assertEqual([row["id"] for row in kept], [0, 1, 2])
+        self.assertEqual(len(matrix), 3)
+
+
+class TestPopcountFallback(unittest.TestCase):
+    """Binary scoring on numpy releases without np.bitwise_count (< 2.0)"""
+
+    def tearDown(self):
+        importlib.reload(quantization)
+
+    def test_binary_scores_match_without_bitwise_count(self):
+        vectors, queries = _unit_vectors(50), _unit_vectors(3, seed=1)
+        rows = _rows(vectors, "binary")
+        expected = build_quantized_matrix(rows, "binary", DIMENSIONS, lambda blob: blob)[0].similarities(queries)
+
+        bitwise_count = getattr(np, "bitwise_count", None)
+        if bitwise_count is not None:
+            del np.bitwise_count
+        try:
+            fallback = importlib.reload(quantization)
+            self.assertIsNot(fallback._popcount, bitwise_count)
+            codes = np.arange(256, dtype=np.uint8)
+            np.testing.assert_array_equal(fallback._popcount(codes), [bin(code).count("1") for code in range(256)])
+            matrix = fallback.build_quantized_matrix(rows, "binary", DIMENSIONS, lambda blob: blob)[0]
+            np.testing.assert_allclose(matrix.similarities(queries), expected)
+        finally:
+            if bitwise_count is not None:
+                np.bitwise_count = bitwise_count
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT.retrieval_filters import documents_named_in_query
+
+
+class TestDocumentsNamedInQuery(unittest.TestCase):
+    """Selecting documents by the years, form types and tickers a question names"""
+
+    def setUp(self):
+        self.filings = [
+            {"id": 1, "document_name": "AAPL_10-K_2023.pdf"},
+            {"id": 2, "document_name": "AAPL_10-K_2022.pdf"},
+            {"id": 3, "document_name": "MSFT_10-Q_2023.pdf"},
+        ]
+
+    def test_year_selects_documents(self):
+        self.assertEqual(documents_named_in_query("What was revenue in FY2022?", self.filings), [2])
+
+    def test_form_type_matches_any_spelling(self):
+        self.assertEqual(documents_named_in_query("Summarize the 10q", self.filings), [3])
+        documents = [{"id": 1, "document_name": "company_overview.pdf"}, {"id": 2, "document_name": "10k.pdf"}]
+        self.assertEqual(documents_named_in_query("What does the 10-K say about debt?", documents), [2])
+
+    def test_ticker_in_capitals_selects_documents(self):
+        self.assertEqual(documents_named_in_query("How did MSFT do?", self.filings), [3])
+
+    def test_ordinary_words_do_not_select(self):
+        documents = [{"id": 1, "document_name": "company_overview.pdf"}, {"id": 2, "document_name": "10k.pdf"}]
+        self.assertEqual(documents_named_in_query("What risks does the company face?", documents), [])
+        self.assertEqual(documents_named_in_query("How did msft do?", self.filings), [])
+
+    def test_terms_in_every_name_do_not_select(self):
+        documents = [{"id": 1, "document_name": "AAPL_10-K_2023.pdf"}, {"id": 2, "document_name": "AAPL_10-K_2022.pdf"}]
+        self.assertEqual(documents_named_in_query("What does the AAPL 10-K say?", documents), [])
+
+    def test_single_document_is_never_filtered(self):
+        self.assertEqual(documents_named_in_query("the 2023 10-K", self.filings[:1]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api_endpoints.financeGPT import shared_cache
+from api_endpoints.financeGPT.retrieval_cache import RetrievalResultCache, chat_corpus_key
+from api_endpoints.financeGPT.shared_cache import SharedCache
+
+
+class LocalBackendTestCase(unittest.TestCase):
+    """Runs against the in-process backend, whatever REDIS_HOST is set to"""
+
+    def setUp(self):
+        patcher = patch.object(shared_cache, "get_redis_client", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestSharedCacheLocalBackend(LocalBackendTestCase):
+    """The in-process fallback of the shared cache"""
+
+    def test_values_round_trip(self):
+        cache = SharedCache("test")
+        cache.set("key", {"sources": [["chunk", "10k.pdf"]]})
+
+        self.assertEqual(cache.get("key"), {"sources": [["chunk", "10k.pdf"]]})
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.backend, "local")
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = SharedCache("test")
+        with patch.object(shared_cache.time, "time", return_value=1000.0):
+            cache.set("key", "value", ttl_seconds=60)
+            cache.set("forever", "value")
+        with patch.object(shared_cache.time, "time", return_value=1059.0):
+            self.assertEqual(cache.get("key"), "value")
+        with patch.object(shared_cache.time, "time", return_value=1061.0):
+            self.assertIsNone(cache.get("key"))
+            self.assertEqual(cache.get("forever"), "value")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SharedCache("test", max_local_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+    def test_delete_and_counters(self):
+        cache = SharedCache("test")
+        cache.set("key", "value")
+        cache.delete("key")
+        self.assertIsNone(cache.get("key"))
+
+        self.assertEqual(cache.incr("hits"), 1)
+        self.assertEqual(cache.incr("hits", 2), 3)
+        self.assertEqual((cache.counter("hits"), cache.counter("misses")), (3, 0))
+
+
+class TestSharedCacheRedisFailure(unittest.TestCase):
+    def test_redis_error_falls_back_to_local_backend(self):
+        client = MagicMock()
+        client.set.side_effect = ConnectionError("Redis went away")
+        cache = SharedCache("test")
+
+        with patch.object(shared_cache, "get_redis_client", side_effect=[client, None]):
+            cache.set("key", "value", ttl_seconds=60)
+            self.assertEqual(cache.get("key"), "value")
+        self.assertIsNone(shared_cache._redis_client)
+
+
+class TestRetrievalResultCache(LocalBackendTestCase):
+    """Retrieval results keyed by corpus version"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = RetrievalResultCache(ttl_seconds=60)
+        self.key = chat_corpus_key(7)
+        self.sources = [("Revenue was $10M", "10k.pdf"), ("Risk factors", "10k.pdf")]
+        self.cache.put(self.key, (12, 340), "What was revenue?", 2, self.sources, "hybrid")
+
+    def test_same_corpus_version_hits(self):
+        self.assertEqual(self.cache.get(self.key, (12, 340), "What was revenue?", 2, "hybrid"), self.sources)
+        # Case and whitespace do not matter
+        self.assertEqual(self.cache.get(self.key, (12, 340), "  what was   REVENUE? ", 2, "hybrid"), self.sources)
+
+    def test_new_corpus_version_misses(self):
+        self.assertIsNone(self.cache.get(self.key, (13, 341), "What was revenue?", 2, "hybrid"))
+        self.assertIsNone(self.cache.get(self.key, (12, 341), "What was revenue?", 2, "hybrid"))
+
+    def test_other_corpus_k_or_variant_misses(self):
+        self.assertIsNone(self.cache.get(chat_corpus_key(8), (12, 340), "What was revenue?", 2, "hybrid"))
+        self.assertIsNone(self.cache.get(self.key, (12, 340), "What was revenue?", 3, "hybrid"))
+        self.assertIsNone(self.cache.get(self.key, (12, 340), "What was revenue?", 2, "dense"))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["backend"]), (0, 3, "local"))
+
+    def test_zero_ttl_disables_the_cache(self):
+        cache = RetrievalResultCache(ttl_seconds=0)
+        cache.put(self.key, (12, 340), "What was revenue?", 2, self.sources)
+        self.assertIsNone(cache.get(self.key, (12, 340), "What was revenue?", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from api_endpoints.financeGPT.span_splitter import SpanTextSplitter
+
+# The separators ingestion splits with (see chatbot_endpoints._get_text_splitter)
+SEPARATORS = ["\n\n", "\n", ". ", "? ", "! ", " ", ""]
+PIECES = ["a", "revenue", "10-K", "$4.2M", " ", "  ", "\t", "\n", "\n\n", "\n \n", ". ", "? ", "! ", "x" * 40]
+
+
+class TestSpanTextSplitter(unittest.TestCase):
+    """SpanTextSplitter must chunk exactly like LangChain's RecursiveCharacterTextSplitter"""
+
+    def assert_matches_langchain(self, text, chunk_size, chunk_overlap):
+        splitter = SpanTextSplitter(chunk_size, chunk_overlap, SEPARATORS)
+        reference = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                   separators=SEPARATORS)
+        spans = splitter.split_spans(text)
+
+        self.assertEqual(splitter.split_text(text), reference.split_text(text))
+        self.assertEqual([text[start:end] for start, end in spans], splitter.split_text(text))
+        self.assertEqual(list(splitter.iter_spans(text)), spans)
+
+    def test_random_texts_match_langchain(self):
+        rng = random.Random(20)
+        for _ in range(500):
+            text = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 300)))
+            chunk_size = rng.randint(5, 400)
+            self.assert_matches_langchain(text, chunk_size, rng.randint(0, chunk_size))
+
+    def test_ingestion_settings_match_langchain(self):
+        rng = random.Random(21)
+        words = ["Revenue", "increased", "12%", "in", "fiscal", "2023.", "Risk", "factors", "include", "debt."]
+        paragraphs = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 120))) for _ in range(60)]
+        text = "\n\n".join(paragraph.replace("include", "include\n") for paragraph in paragraphs)
+        for chunk_size in (200, 1000, 1500):
+            self.assert_matches_langchain(text, chunk_size, 200)
+
+    def test_split_spans_of_a_range_uses_global_offsets(self):
+        text = "Intro.\n\n" + "Revenue grew. " * 50 + "\n\nOutro."
+        splitter = SpanTextSplitter(100, 20, SEPARATORS)
+        start, end = 8, len(text) - 7
+        spans = splitter.split_spans(text, start, end)
+
+        self.assertEqual([text[s:e] for s, e in spans], splitter.split_text(text[start:end]))
+        self.assertTrue(all(start <= s < e <= end for s, e in spans))
+
+    def test_overlap_larger_than_chunk_size_is_rejected(self):
+        with self.assertRaises(ValueError):
+            SpanTextSplitter(10, 20, SEPARATORS)
+
+
+if __name__ == "__main__":
+    unittest.main()